@@ -7,7 +7,13 @@ from django.contrib import admin
 # Also, register the model in the app’s admin.py:
 
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Listing, Bid, Comment
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+
+from .closing import CLOSE_BATCH_SIZE, close_listings
+from .fragments import bump_listing_version
+from .models import User, Category, Listing, Bid, Comment
 
 # https://cs50.harvard.edu/web/2020/notes/4/#django-admin
 # To customize the admin app interface, create a new class here.
@@ -26,19 +32,132 @@ from .models import User, Listing, Bid, Comment
 class UserAdmin(admin.ModelAdmin):
     pass
 
-class ListingAdmin(admin.ModelAdmin):
-    pass
 
-class BidAdmin(admin.ModelAdmin):
-    pass
+# Changelists of the large tables (listings, bids, comments) are built to cost the same few queries whatever the table
+# size:
+# - list_display names columns instead of using __str__ (Bid and Comment print their listing, which prints its
+#   category), and list_select_related joins the rows those columns need, so there is no query per row,
+# - foreign keys are edited with raw_id_fields (or autocomplete for categories) instead of a <select> of every user
+#   or listing,
+# - list_filter only offers is_open and category, which listing_open_category_idx covers,
+# - the paginator estimates the row count of an unfiltered table instead of counting it, and show_full_result_count
+#   is off so filtered pages do not count the whole table as well.
+# https://docs.djangoproject.com/en/5.0/ref/contrib/admin/#django.contrib.admin.ModelAdmin.list_select_related
+# https://docs.djangoproject.com/en/5.0/ref/contrib/admin/#django.contrib.admin.ModelAdmin.show_full_result_count
 
-class CommentAdmin(admin.ModelAdmin):
-    pass
+# Tables estimated to have fewer rows than this are counted exactly.
+ESTIMATE_COUNT_ABOVE = 100000
+
+# Comments deleted per transaction by the spam actions.
+DELETE_BATCH_SIZE = 1000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that reads the row count of an unfiltered table from PostgreSQL's statistics (pg_class.reltuples, kept
+    up to date by autovacuum) instead of running COUNT(*), which reads the whole table.
+    Filtered changelists, small tables and other databases are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is -1 for a table that has never been analyzed.
+            if row and row[0] > ESTIMATE_COUNT_ABOVE:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug", "open_listings", "updated_at")
+    # Used by the category autocomplete on the listing form. slug is the indexed, unique column.
+    search_fields = ("name", "slug")
+    readonly_fields = ("open_listings", "updated_at")
+
+
+class ListingAdmin(LargeTableAdmin):
+    list_display = ("id", "title", "category", "createdBy", "bid", "bid_count", "is_open", "ends_at")
+    list_select_related = ("category", "createdBy")
+    list_filter = ("is_open", "category")
+    autocomplete_fields = ("category",)
+    raw_id_fields = ("createdBy", "watchlist")
+    actions = ["close_auctions"]
+
+    # Closing cannot be undone (winners, results and notifications are written), so it needs the change permission.
+    @admin.action(description="Close the selected auctions", permissions=["change"])
+    def close_auctions(self, request, queryset):
+        # Closed like the close_auctions worker does: a batch of rows per short transaction, with the winners,
+        # results, notifications and category counts written by close_listings().
+        closed = 0
+        while True:
+            with transaction.atomic():
+                batch = close_listings(queryset, CLOSE_BATCH_SIZE)
+            closed += len(batch)
+            if len(batch) < CLOSE_BATCH_SIZE:
+                break
+        self.message_user(request, f"Closed {closed} auctions.")
+
+
+class BidAdmin(LargeTableAdmin):
+    list_display = ("id", "listing", "placedBy", "bid", "created_at")
+    # Listing.__str__ shows the category.
+    list_select_related = ("listing__category", "placedBy")
+    raw_id_fields = ("listing", "placedBy")
+
+
+def delete_comments(comments):
+    # Delete the comments in batches of DELETE_BATCH_SIZE, one transaction each. Returns the number deleted.
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(comments.order_by("pk").values_list("pk", "listing_id")[:DELETE_BATCH_SIZE])
+            if not rows:
+                return deleted
+            # Comment has no signal receivers or dependent rows, so this is one DELETE ... WHERE id IN (...).
+            Comment.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            for listing_id in {row[1] for row in rows}:
+                bump_listing_version(listing_id)
+        deleted += len(rows)
+
+
+class CommentAdmin(LargeTableAdmin):
+    list_display = ("id", "listing", "author", "comment")
+    list_select_related = ("listing__category", "author")
+    raw_id_fields = ("listing", "author")
+    actions = ["delete_spam", "delete_spam_by_authors"]
+
+    def get_actions(self, request):
+        # The built-in delete action lists every selected comment on its confirmation page. The actions below replace it.
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Delete the selected comments as spam", permissions=["delete"])
+    def delete_spam(self, request, queryset):
+        self.message_user(request, f"Deleted {delete_comments(queryset)} comments.")
+
+    @admin.action(description="Delete every comment by the authors of the selected comments", permissions=["delete"])
+    def delete_spam_by_authors(self, request, queryset):
+        authors = set(queryset.values_list("author_id", flat=True))
+        deleted = delete_comments(Comment.objects.filter(author_id__in=authors))
+        self.message_user(request, f"Deleted {deleted} comments by {len(authors)} users.")
 
 
 # https://docs.djangoproject.com/en/5.0/topics/auth/customizing/#using-a-custom-user-model-when-starting-a-project
 # Also, register the (User) model in the app’s admin.py.
 admin.site.register(User, UserAdmin)
+admin.site.register(Category, CategoryAdmin)
 admin.site.register(Listing, ListingAdmin)
 admin.site.register(Bid, BidAdmin)
 admin.site.register(Comment, CommentAdmin)
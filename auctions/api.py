@@ -0,0 +1,262 @@
+# JSON read API, version 1. Mounted under /api/v1/ in urls.py.
+#
+# GET /api/v1/listings                     open listings, newest first (?status=open|closed|all, ?category=<slug>)
+# GET /api/v1/listings?ids=4,8,15          up to MAX_IDS listings by id, in the order asked for
+# GET /api/v1/listings/<id>                one listing
+# GET /api/v1/listings/<id>/bids           the listing's bids, highest (newest) first
+# GET /api/v1/listings/<id>/bid_rollups    the listing's hourly bid counts and high/low amounts, newest first
+# GET /api/v1/listings/<id>/comments       the listing's comments, oldest first
+# GET /api/v1/categories                   categories with open listings (the cached directory, see categories.py)
+# GET /api/v1/watchlist                    the signed in user's watched listings
+#
+# Every endpoint takes ?fields=a,b,c to return only some fields (id is always included). Lists are paginated by
+# keyset: ?cursor=<next_cursor from the previous page>&limit=<1..MAX_PAGE_SIZE>.
+# Rows are read with values_list() over only the columns (and joins) the requested fields need and turned straight
+# into dicts - no model instances are created. Errors are {"error": "..."} with a 4xx status.
+# https://docs.djangoproject.com/en/5.0/ref/models/querysets/#values-list
+
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+
+from .categories import category_directory
+from .models import Bid, BidRollup, Comment, Listing
+from .queries import MAX_ID, parse_cursor
+from .watchlists import user_watched_ids
+
+
+# Rows per page when ?limit= is not given, and the most a client may ask for.
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Most ids accepted by ?ids=.
+MAX_IDS = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Resource:
+    """
+    The fields of one kind of object: public field name -> ORM path read with values_list().
+    converters turn a column value into its JSON value where the raw value is not right (e.g. image names into URLs).
+    Decimals and datetimes are left to DjangoJSONEncoder (strings and ISO 8601).
+    """
+    def __init__(self, fields, default, converters=None):
+        self.fields = fields
+        self.default = default
+        self.converters = converters or {}
+
+    def select(self, request):
+        # The field names asked for with ?fields=, or the default set. Raises ApiError for an unknown name.
+        value = request.GET.get("fields")
+        if not value:
+            return self.default
+        names = ["id"]
+        for name in value.split(","):
+            name = name.strip()
+            if name not in self.fields:
+                raise ApiError(f"Unknown field '{name}'. Fields: {', '.join(self.fields)}.")
+            if name not in names:
+                names.append(name)
+        return names
+
+    def rows(self, queryset, names):
+        # Serialize the queryset as a list of dicts with the given fields.
+        converters = [(index, self.converters[name]) for index, name in enumerate(names) if name in self.converters]
+        results = []
+        for row in queryset.values_list(*[self.fields[name] for name in names]):
+            if converters:
+                row = list(row)
+                for index, convert in converters:
+                    row[index] = convert(row[index])
+            results.append(dict(zip(names, row)))
+        return results
+
+
+LISTINGS = Resource(
+    {
+        "id": "id",
+        "title": "title",
+        "description": "description",
+        "price": "bid",
+        "bid_count": "bid_count",
+        "is_open": "is_open",
+        "category": "category__slug",
+        "seller": "createdBy__username",
+        "image": "image",
+        "ends_at": "ends_at",
+        "updated_at": "updated_at",
+        "winner": "winner__username",
+    },
+    default=["id", "title", "price", "bid_count", "is_open", "category", "image", "ends_at"],
+    converters={"image": image_url}
+)
+
+BIDS = Resource(
+    {"id": "id", "amount": "bid", "bidder": "placedBy__username", "created_at": "created_at"},
+    default=["id", "amount", "bidder", "created_at"]
+)
+
+BID_ROLLUPS = Resource(
+    {"id": "id", "period_start": "period_start", "bid_count": "bid_count", "high": "high", "low": "low"},
+    default=["id", "period_start", "bid_count", "high", "low"]
+)
+
+COMMENTS = Resource(
+    {"id": "id", "comment": "comment", "author": "author__username"},
+    default=["id", "comment", "author"]
+)
+
+CATEGORY_FIELDS = ["name", "slug", "open_listings", "updated_at"]
+
+
+def api_view(view):
+    # Wrap a view that returns a dict: GET only, JSON response, ApiError and Http404 as JSON errors.
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return JsonResponse({"error": "Method not allowed."}, status=405, headers={"Allow": "GET, HEAD"})
+        try:
+            data = view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+        except Http404:
+            return JsonResponse({"error": "Not found."}, status=404)
+        return JsonResponse(data)
+    return wrapper
+
+
+def page_limit(request):
+    value = request.GET.get("limit")
+    if value is None:
+        return PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return limit
+
+
+def paginate(request, queryset, resource, newest_first=True):
+    """
+    One page of the queryset, ordered by id, as {"results": [...], "next_cursor": id or None}.
+    The cursor is the last id of the previous page, so each page is an index range - no OFFSET, no COUNT.
+    """
+    names = resource.select(request)
+    limit = page_limit(request)
+    cursor = parse_cursor(request.GET.get("cursor"))
+    if cursor is not None:
+        queryset = queryset.filter(id__lt=cursor) if newest_first else queryset.filter(id__gt=cursor)
+    queryset = queryset.order_by("-id" if newest_first else "id")
+
+    # One extra row says whether there is another page.
+    results = resource.rows(queryset[:limit + 1], names)
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = results[-1]["id"]
+    return {"results": results, "next_cursor": next_cursor}
+
+
+def parse_ids(value):
+    try:
+        ids = list(dict.fromkeys(int(listing_id) for listing_id in value.split(",") if listing_id.strip()))
+    except ValueError:
+        raise ApiError("ids must be a comma-separated list of listing ids.")
+    if not all(1 <= listing_id <= MAX_ID for listing_id in ids):
+        raise ApiError(f"ids must be between 1 and {MAX_ID}.")
+    if not 1 <= len(ids) <= MAX_IDS:
+        raise ApiError(f"Between 1 and {MAX_IDS} ids can be looked up at once.")
+    return ids
+
+
+@api_view
+def listings(request):
+    if "ids" in request.GET:
+        # Batched lookup: one query for all the ids. Ids that do not exist are left out.
+        ids = parse_ids(request.GET["ids"])
+        rows = {row["id"]: row for row in LISTINGS.rows(Listing.objects.filter(pk__in=ids), LISTINGS.select(request))}
+        return {"results": [rows[listing_id] for listing_id in ids if listing_id in rows]}
+
+    status = request.GET.get("status", "open")
+    if status not in ("open", "closed", "all"):
+        raise ApiError("status must be open, closed or all.")
+    queryset = Listing.objects.all()
+    if status != "all":
+        # Open listings are read from listing_open_feed_idx.
+        queryset = queryset.filter(is_open=status == "open")
+    if request.GET.get("category"):
+        queryset = queryset.filter(category__slug=request.GET["category"])
+
+    return paginate(request, queryset, LISTINGS)
+
+
+@api_view
+def listing(request, id):
+    rows = LISTINGS.rows(Listing.objects.filter(pk=id), LISTINGS.select(request))
+    if not rows:
+        raise Http404
+    return rows[0]
+
+
+def listing_must_exist(id):
+    if not Listing.objects.filter(pk=id).exists():
+        raise Http404
+
+
+@api_view
+def listing_bids(request, id):
+    # Accepted bids always beat the one before, so newest first is also highest first.
+    data = paginate(request, Bid.objects.filter(listing_id=id), BIDS)
+    if not data["results"]:
+        # Tell "no bids" from "no such listing". Only checked for an empty page.
+        listing_must_exist(id)
+    return data
+
+
+@api_view
+def listing_bid_rollups(request, id):
+    # Rollup rows of a listing are created hour by hour, so newest id first is also latest hour first.
+    data = paginate(request, BidRollup.objects.filter(listing_id=id), BID_ROLLUPS)
+    if not data["results"]:
+        listing_must_exist(id)
+    return data
+
+
+@api_view
+def listing_comments(request, id):
+    data = paginate(request, Comment.objects.filter(listing_id=id), COMMENTS, newest_first=False)
+    if not data["results"]:
+        listing_must_exist(id)
+    return data
+
+
+@api_view
+def categories(request):
+    # Served from the cached directory - no query when it is cached.
+    value = request.GET.get("fields")
+    names = [name.strip() for name in value.split(",")] if value else CATEGORY_FIELDS
+    unknown = [name for name in names if name not in CATEGORY_FIELDS]
+    if unknown:
+        raise ApiError(f"Unknown field '{unknown[0]}'. Fields: {', '.join(CATEGORY_FIELDS)}.")
+    return {"results": [{name: entry[name] for name in names} for entry in category_directory()]}
+
+
+@api_view
+def watchlist(request):
+    if not request.user.is_authenticated:
+        raise ApiError("Sign in to see your watchlist.", status=401)
+    # The watched ids come from the cached watchlist (watchlists.py).
+    return paginate(request, Listing.objects.filter(pk__in=user_watched_ids(request.user)), LISTINGS)
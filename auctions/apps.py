@@ -1,5 +1,36 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # https://docs.djangoproject.com/en/5.0/topics/signals/#connecting-receiver-functions
+        # Keep the search index up to date when a listing is saved or deleted, or its category renamed or deleted.
+        from . import categories, fragments, search, watchlists
+        from .models import Category, Listing
+
+        post_save.connect(search.listing_saved, sender=Listing, dispatch_uid="auctions_search_listing_saved")
+        post_delete.connect(search.listing_deleted, sender=Listing, dispatch_uid="auctions_search_listing_deleted")
+        post_save.connect(search.category_saved, sender=Category, dispatch_uid="auctions_search_category_saved")
+        pre_delete.connect(search.category_deleting, sender=Category, dispatch_uid="auctions_search_category_deleting")
+
+        # Drop cached watchlists when the watchlist table is changed outside watchlists.watch()/unwatch().
+        m2m_changed.connect(watchlists.watchlist_changed, sender=Listing.watchlist.through, dispatch_uid="auctions_watchlist_changed")
+
+        # Invalidate the cached HTML of a listing when it is saved (e.g. edited in the admin).
+        post_save.connect(fragments.listing_saved, sender=Listing, dispatch_uid="auctions_fragments_listing_saved")
+
+        # A category page changes when one of its listings is saved. Its open listing count changes when a listing is
+        # created, deleted, closed, reopened or moved to another category.
+        pre_save.connect(categories.listing_pre_save, sender=Listing, dispatch_uid="auctions_categories_listing_pre_save")
+        post_save.connect(categories.listing_saved, sender=Listing, dispatch_uid="auctions_categories_listing_saved")
+        post_delete.connect(categories.listing_deleted, sender=Listing, dispatch_uid="auctions_categories_listing_deleted")
+
+        # Structured event logging through a background thread (see logs.py). Off by default: the app's records then go
+        # to the handlers the project configures with LOGGING, like any other library's.
+        if getattr(settings, "AUCTIONS_LOG_QUEUE", False):
+            from .logs import start_queue_logging
+            start_queue_logging()
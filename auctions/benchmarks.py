@@ -0,0 +1,310 @@
+# Benchmark suite for the auction workflows, run by: python manage.py bench_suite (see the command for usage).
+#
+# 1. seed() writes users, listings, bids, comments and watchlist rows at the requested scale with bulk_create, and
+#    sets the listing counters, category counts and bid rollups the way the application would have.
+# 2. Scenarios (browse the feed, open a listing, a bid war on one listing, watch/unwatch, comment, close an auction)
+#    are run through a driver: the Django test client in this process (which also counts the SQL queries of every
+#    request), or HTTP against a running server that uses the same database.
+# 3. summarize() reports throughput, p50/p95/p99 latency and queries per request for each scenario as JSON, and
+#    compare() lists the regressions against a stored baseline report.
+# Everything seeded is named with a prefix and deleted by cleanup() afterwards.
+
+import http.client
+import itertools
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+
+from .categories import category_for_name, change_open_listings
+from .models import User, Listing, Bid, Comment
+from .profiling import RequestProfile
+from .rollups import rebuild_rollups
+
+
+# Every seeded user has this password, so the HTTP driver can sign in.
+BENCH_PASSWORD = "bench-password"
+
+CATEGORIES = ["Art", "Books", "Electronics", "Fashion", "Home", "Music", "Sports", "Toys"]
+
+Watch = Listing.watchlist.through
+
+# Users a single-threaded run takes turns with (e.g. so the close scenario has several users' listings to close).
+SEQUENTIAL_USERS = 16
+
+
+class World:
+    # The ids of the seeded data that scenarios pick from.
+
+    def __init__(self, prefix, user_ids, listing_ids, owners):
+        self.prefix = prefix
+        self.user_ids = user_ids
+        self.listing_ids = listing_ids
+        # The listing everybody bids on in the bid war.
+        self.hot_listing_id = listing_ids[0]
+        # Open listings by creator. The close scenario closes each of them once.
+        self.closable = defaultdict(list)
+        for listing_id, owner_id in owners.items():
+            if listing_id != self.hot_listing_id:
+                self.closable[owner_id].append(listing_id)
+        self.lock = threading.Lock()
+        # Bid war amounts only go up, so most bids are accepted even with concurrent bidders.
+        self.amounts = itertools.count(100_000)
+
+    def next_amount(self):
+        return Decimal(next(self.amounts)) / 100
+
+    def take_closable(self, user_id):
+        with self.lock:
+            listings = self.closable.get(user_id)
+            return listings.pop() if listings else None
+
+
+def seed(prefix, users, listings, bids, comments, watches, batch_size=5000, rng=random):
+    """
+    Write the benchmark data set and return a World. Bids go mostly to a few popular listings (like real auctions),
+    rise in price on each listing, and the listings' bid counters and hourly rollups are set from them.
+    """
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create([User(username=f"{prefix}_user_{i}", password=password) for i in range(users)], batch_size=batch_size)
+    user_ids = list(User.objects.filter(username__startswith=f"{prefix}_user_").order_by("id").values_list("id", flat=True))
+
+    categories = [category_for_name(name).id for name in CATEGORIES]
+    created = Listing.objects.bulk_create([
+        Listing(title=f"{prefix} listing {i}", description="Benchmark listing", category_id=rng.choice(categories),
+                image="images/bench.png", bid=Decimal("1.00"), createdBy_id=rng.choice(user_ids))
+        for i in range(listings)
+    ], batch_size=batch_size)
+    owners = {listing.id: listing.createdBy_id for listing in created}
+    listing_ids = sorted(owners)
+
+    with transaction.atomic():
+        for category_id, count in Counter(listing.category_id for listing in created).items():
+            change_open_listings(category_id, count)
+
+    # Bids: listing i is picked with a skewed distribution, so the first listings are the busiest.
+    prices = {}
+    counts = Counter()
+    leading = {}
+    for start in range(0, bids, batch_size):
+        batch = []
+        for _ in range(min(batch_size, bids - start)):
+            listing_id = listing_ids[int(len(listing_ids) * rng.random() ** 3)]
+            prices[listing_id] = prices.get(listing_id, Decimal("1.00")) + Decimal(rng.randint(1, 500)) / 100
+            counts[listing_id] += 1
+            batch.append(Bid(bid=prices[listing_id], listing_id=listing_id, placedBy_id=rng.choice(user_ids)))
+        for bid in Bid.objects.bulk_create(batch):
+            leading[bid.listing_id] = bid
+
+    Listing.objects.bulk_update([
+        Listing(id=listing_id, bid=bid.bid, bid_count=counts[listing_id], leading_bid_id=bid.id, last_bid_at=bid.created_at)
+        for listing_id, bid in leading.items()
+    ], ["bid", "bid_count", "leading_bid", "last_bid_at"], batch_size=batch_size)
+    for start in range(0, len(listing_ids), batch_size):
+        with transaction.atomic():
+            rebuild_rollups(listing_ids[start:start + batch_size])
+
+    for start in range(0, comments, batch_size):
+        Comment.objects.bulk_create([
+            Comment(comment="Benchmark comment", listing_id=rng.choice(listing_ids), author_id=rng.choice(user_ids))
+            for _ in range(min(batch_size, comments - start))
+        ])
+
+    for start in range(0, watches, batch_size):
+        Watch.objects.bulk_create([
+            Watch(listing_id=rng.choice(listing_ids), user_id=rng.choice(user_ids))
+            for _ in range(min(batch_size, watches - start))
+        ], ignore_conflicts=True)
+
+    return World(prefix, user_ids, listing_ids, owners)
+
+
+def cleanup(prefix):
+    # Delete the seeded data (bids, comments, watches and results go with their listings). The category counts are
+    # given back by categories.listing_deleted.
+    with transaction.atomic():
+        Listing.objects.filter(title__startswith=f"{prefix} listing ").delete()
+        User.objects.filter(username__startswith=f"{prefix}_user_").delete()
+
+
+class ClientDriver:
+    # Requests through the Django test client in this process. Counts the SQL queries of each request.
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.client = Client()
+        self.client.force_login(User.objects.get(pk=user_id))
+
+    def request(self, method, path, data=None):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            response = self.client.get(path) if method == "GET" else self.client.post(path, data or {})
+        return response.status_code, profile.sql_count
+
+
+class HttpDriver:
+    # Requests over one keep-alive HTTP connection to a running server, signed in as the user.
+
+    def __init__(self, user_id, host, port):
+        self.user_id = user_id
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = SimpleCookie()
+        # The login page sets the CSRF cookie. Signing in sets the session cookie.
+        self.request("GET", "/login")
+        username = User.objects.values_list("username", flat=True).get(pk=user_id)
+        status, _ = self.request("POST", "/login", {"username": username, "password": BENCH_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"Could not sign in as {username} (HTTP {status}).")
+
+    def request(self, method, path, data=None):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{name}={morsel.value}" for name, morsel in self.cookies.items())
+        body = None
+        if method == "POST":
+            body = urlencode({**(data or {}), "csrfmiddlewaretoken": self.cookies["csrftoken"].value})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return None, None
+        for header in response.headers.get_all("Set-Cookie") or []:
+            self.cookies.load(header)
+        return response.status, None
+
+
+# Scenarios: one iteration each. They return [(method, path, data)] requests, made in order.
+
+def browse_feed(world, user_id, rng):
+    return [("GET", "/", None), ("GET", "/categories", None)]
+
+
+def open_listing(world, user_id, rng):
+    # Mostly the popular listings, like the bids.
+    return [("GET", f"/listing/{world.listing_ids[int(len(world.listing_ids) * rng.random() ** 3)]}", None)]
+
+
+def bid_war(world, user_id, rng):
+    return [("POST", f"/bid/{world.hot_listing_id}", {"bid": str(world.next_amount())})]
+
+
+def watchlist_toggle(world, user_id, rng):
+    listing_id = rng.choice(world.listing_ids)
+    return [("POST", f"/add_to_watchlist/{listing_id}", None), ("POST", f"/remove_from_watchlist/{listing_id}", None)]
+
+
+def comment(world, user_id, rng):
+    return [("POST", f"/comment/{rng.choice(world.listing_ids)}", {"comment": "Benchmark comment"})]
+
+
+def close(world, user_id, rng):
+    # Users close their own listings. Once a user has none left the iteration is skipped.
+    listing_id = world.take_closable(user_id)
+    return [("POST", f"/close/{listing_id}", None)] if listing_id else []
+
+
+SCENARIOS = {
+    "browse_feed": browse_feed,
+    "open_listing": open_listing,
+    "bid_war": bid_war,
+    "watchlist_toggle": watchlist_toggle,
+    "comment": comment,
+    "close": close,
+}
+
+
+def run_scenario(scenario, world, make_driver, iterations, concurrency, rng):
+    """
+    Run iterations of the scenario on concurrency threads, each with its own driver (signed in as a different user).
+    With one thread, iterations take turns between SEQUENTIAL_USERS drivers.
+    Returns (records, seconds) where records are (latency, status, queries) per request.
+    """
+    local = threading.local()
+    thread_numbers = itertools.count()
+    sequential = {}
+    records = []
+    lock = threading.Lock()
+
+    def driver_for(number):
+        if concurrency <= 1:
+            slot = number % min(SEQUENTIAL_USERS, len(world.user_ids))
+            if slot not in sequential:
+                sequential[slot] = make_driver(world.user_ids[slot])
+            return sequential[slot]
+        if not hasattr(local, "driver"):
+            local.driver = make_driver(world.user_ids[next(thread_numbers) % len(world.user_ids)])
+        return local.driver
+
+    def iteration(number):
+        driver = driver_for(number)
+        for method, path, data in scenario(world, driver.user_id, rng):
+            started = time.perf_counter()
+            status, queries = driver.request(method, path, data)
+            latency = time.perf_counter() - started
+            with lock:
+                records.append((latency, status, queries))
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for number in range(iterations):
+            iteration(number)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(iteration, range(iterations)))
+    return records, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(records, seconds):
+    # Throughput, latency percentiles (ms) and queries per request of one scenario's records.
+    # Redirects (302) are successful responses: the write views redirect back to the listing.
+    ok = [record for record in records if record[1] is not None and record[1] < 400]
+    latencies = [record[0] * 1000 for record in ok]
+    queries = [record[2] for record in ok if record[2] is not None]
+    return {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "throughput_rps": round(len(ok) / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    The regressions of report against baseline, as messages. A scenario regresses if its p95 latency grows, or its
+    throughput drops, by more than tolerance (0.2 = 20%), if it makes more queries per request or has new errors.
+    Scenarios missing from either report are not compared.
+    """
+    regressions = []
+    for name, current in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if current["p95_ms"] is not None and base.get("p95_ms") and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms, baseline {base['p95_ms']} ms")
+        if base.get("throughput_rps") and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['throughput_rps']} requests/s, baseline {base['throughput_rps']}")
+        if current["queries_per_request"] is not None and base.get("queries_per_request") is not None \
+                and current["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(f"{name}: {current['queries_per_request']} queries per request, baseline {base['queries_per_request']}")
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: {current['errors']} errors, baseline {base.get('errors', 0)}")
+    return regressions
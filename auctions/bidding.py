@@ -0,0 +1,81 @@
+# Write-side bid handling.
+# A Bid row, the auction state stored on its Listing (bid, bid_count, leading_bid, last_bid_at) and the listing's hourly
+# bid rollup always change together.
+# https://docs.djangoproject.com/en/5.0/topics/db/transactions/
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .fragments import bump_listing_version
+from .live import publish_listing_event
+from .models import Listing, Bid
+from .notifications import record_bid
+from .rollups import record_bid_rollup
+
+
+# Bids are stored with 2 decimal places (see Bid.bid).
+CENT = Decimal("0.01")
+
+# The largest amount Bid.bid and Listing.bid (max_digits=19, decimal_places=2) can hold.
+MAX_AMOUNT = Decimal("99999999999999999.99")
+
+
+def parse_bid_amount(value):
+    """
+    Convert the bid input by the user as a string to a Decimal rounded to cents.
+    Returns None for anything that is not a positive number that fits the bid columns.
+    """
+    try:
+        amount = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    if not amount.is_finite() or amount < CENT or amount > MAX_AMOUNT:
+        return None
+    amount = amount.quantize(CENT)
+    # Rounding up may pass the limit (e.g. 99999999999999999.999).
+    return amount if amount <= MAX_AMOUNT else None
+
+
+def place_bid(listing_id, user, amount):
+    """
+    Place a bid without a read-compare-write race.
+    The listing row is only updated if the auction is open (and has not reached its end time) and the bid is higher than the current bid. The check and
+    the write are one conditional UPDATE, so the database decides which of two concurrent bids wins: the UPDATE locks
+    the row and the second bid is compared against the first bid's amount once the lock is released.
+    While the row is locked the Bid is inserted and set as the leading bid, so accepted bids are stored in price order.
+    Returns the new Bid, or None if the bid was rejected. No rows are read.
+    """
+    with transaction.atomic():
+        # https://docs.djangoproject.com/en/5.0/ref/models/querysets/#update
+        now = timezone.now()
+        # Bids after the end time are rejected even if the close_auctions worker has not closed the auction yet.
+        accepted = Listing.objects.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=now), pk=listing_id, is_open=True, bid__lt=amount
+        ).update(
+            bid=amount,
+            bid_count=F("bid_count") + 1,
+            last_bid_at=now,
+            updated_at=now
+        )
+        if not accepted:
+            return None
+
+        new_bid = Bid.objects.create(bid=amount, listing_id=listing_id, placedBy=user, created_at=now)
+        Listing.objects.filter(pk=listing_id).update(leading_bid=new_bid)
+
+        # Count the bid in the listing's hourly rollup (see rollups.py).
+        record_bid_rollup(listing_id, amount, now)
+
+        # Watchers and the previous high bidder are notified later by the outbox dispatcher (notifications.py).
+        record_bid(new_bid)
+
+        # Cached listing HTML shows the old price.
+        bump_listing_version(listing_id)
+
+        # Push the new price to browsers watching the listing page.
+        publish_listing_event(listing_id, "bid", bid=str(amount), bidder=user.username)
+
+    return new_bid
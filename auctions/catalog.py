@@ -0,0 +1,300 @@
+# Bulk listing import and export for large catalogs, used by the import_listings and export_listings commands.
+#
+# Both stream: rows are read and written one batch at a time, so memory use does not depend on the catalog size.
+# Import:
+# - reads CSV or JSON Lines with the columns title, description, bid (the starting bid), category, image and
+#   optionally ends_at (other columns, like the ones export writes, are ignored),
+# - matches category names to Category rows by slug (categories.category_for_name), once per name per run,
+# - resolves image references on a thread pool: a file already in storage is used as it is, a local file or an
+#   http(s) URL is checked to be an image and stored without its metadata under its content hash like uploads are
+#   (uploads.py),
+# - writes each batch with one bulk_create in one transaction, together with the category counts and search index,
+# - records the number of input rows done in a progress file around each batch's commit, so an interrupted import
+#   can be resumed without duplicating listings (see resume_position()).
+# Export reads the listings with a server-side cursor (QuerySet.iterator(chunk_size=...)) and values_list(), so no
+# model instances are built, and records the last exported id the same way.
+# https://docs.djangoproject.com/en/5.0/ref/models/querysets/#bulk-create
+# https://docs.djangoproject.com/en/5.0/ref/models/querysets/#iterator
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+import urllib.request
+from http.client import HTTPException
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .bidding import parse_bid_amount
+from .categories import category_for_name, category_slug, change_open_listings
+from .closing import parse_end_time
+from .fragments import bump_feed_version
+from .models import Listing
+from .search import search_backend
+from .uploads import SIGNATURE_LENGTH, detect_image_type, image_path, max_image_bytes, strip_metadata
+
+
+# Listings written per transaction by import, and read per round trip by export.
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+# Threads resolving image references during import.
+IMAGE_WORKERS = 8
+
+# Columns written by export. Import reads title, description, bid, category, image and ends_at.
+EXPORT_COLUMNS = ["id", "title", "description", "bid", "bid_count", "category", "image", "ends_at", "is_open", "seller"]
+EXPORT_FIELDS = ["id", "title", "description", "bid", "bid_count", "category__name", "image", "ends_at", "is_open", "createdBy__username"]
+
+
+class RowError(ValueError):
+    pass
+
+
+def file_format(path, requested=None):
+    # "csv" or "jsonl", from --format or the file extension.
+    if requested:
+        return requested
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_rows(file, format):
+    # Dicts of column -> value, one per input row, read lazily.
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+# Progress files: a small JSON document next to the input or output file, replaced atomically after each batch.
+
+def progress_path(path):
+    return f"{path}.progress"
+
+
+def read_progress(path):
+    try:
+        with open(progress_path(path)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_progress(path, state):
+    temporary = progress_path(path) + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(state, file)
+    os.replace(temporary, progress_path(path))
+
+
+def resume_position(path, seller):
+    """
+    The number of input rows an interrupted import of path by seller committed.
+    Before a batch commits, the progress file records the batch as pending with its first listing. If that listing
+    exists, the batch was committed and only the progress update after it was lost.
+    """
+    state = read_progress(path)
+    pending = state.get("pending")
+    if pending and Listing.objects.filter(pk=pending["id"], createdBy=seller, title=pending["title"]).exists():
+        return pending["rows"]
+    return state.get("rows", 0)
+
+
+def clear_progress(path):
+    try:
+        os.remove(progress_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def store_image_bytes(data):
+    # Store image bytes without their metadata under their content hash, like uploads.store_listing_image().
+    image_type = detect_image_type(data[:SIGNATURE_LENGTH])
+    if image_type is None:
+        raise RowError("the image must be a JPEG, PNG, GIF or WebP file")
+    data = strip_metadata(BytesIO(data), image_type) or data
+    path = image_path(hashlib.sha256(data).hexdigest(), image_type)
+    if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(data))
+    return path
+
+
+def resolve_image(reference, base_dir):
+    """
+    The storage path for an image reference from an import file:
+    a path already in storage, a local file (relative to the import file) or an http(s) URL.
+    Raises RowError for a reference that cannot be used, so only its row is skipped.
+    """
+    try:
+        return find_image(reference, base_dir)
+    except RowError:
+        raise
+    except SuspiciousOperation:
+        # A path outside the storage, e.g. "../settings.py".
+        raise RowError(f"invalid image path: {reference}")
+    except (OSError, ValueError, HTTPException) as error:
+        # Unreadable files, malformed URLs (http.client.InvalidURL is a ValueError), failed downloads.
+        raise RowError(f"cannot read image {reference}: {error}")
+
+
+def find_image(reference, base_dir):
+    if not reference:
+        raise RowError("an image is required")
+    limit = max_image_bytes()
+    if reference.startswith(("http://", "https://")):
+        with urllib.request.urlopen(reference, timeout=30) as response:
+            data = response.read(limit + 1)
+    elif default_storage.exists(reference):
+        return reference
+    else:
+        path = os.path.join(base_dir, reference)
+        if not os.path.isfile(path):
+            raise RowError(f"image not found: {reference}")
+        with open(path, "rb") as file:
+            data = file.read(limit + 1)
+    if len(data) > limit:
+        raise RowError("the image is too large")
+    return store_image_bytes(data)
+
+
+class Importer:
+    """
+    Imports listings for one seller. Call run(rows) with the rows of the file; it returns after the last batch.
+    Counts (imported, skipped, errors) are kept on the object for the command's report.
+    """
+
+    def __init__(self, seller, base_dir, batch_size=IMPORT_BATCH_SIZE, image_workers=IMAGE_WORKERS, progress_path=None):
+        self.seller = seller
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        # The import file whose progress is recorded (read back with resume_position()), if any.
+        self.progress_path = progress_path
+        # Category slug -> id, so each category name is looked up once per run.
+        self.categories = {}
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def category_id(self, name):
+        name = (name or "").strip()
+        if not name:
+            return None
+        slug = category_slug(name)
+        if slug not in self.categories:
+            self.categories[slug] = category_for_name(name).id
+        return self.categories[slug]
+
+    def resolve_images(self, pool, rows):
+        # Image reference -> storage path or the RowError, for the distinct references of the batch.
+        def resolve(reference):
+            try:
+                return resolve_image(reference, self.base_dir)
+            except RowError as error:
+                return error
+        references = list({(row.get("image") or "").strip() for row in rows})
+        return dict(zip(references, pool.map(resolve, references)))
+
+    def build(self, row, images):
+        # The Listing for one input row. Raises RowError if the row is not valid.
+        title = (row.get("title") or "").strip()
+        if not title:
+            raise RowError("title is required")
+        bid = parse_bid_amount(row.get("bid"))
+        if bid is None:
+            raise RowError(f"invalid bid: {row.get('bid')!r}")
+        image = images[(row.get("image") or "").strip()]
+        if isinstance(image, RowError):
+            raise image
+        ends_at = None
+        if row.get("ends_at"):
+            ends_at = parse_end_time(row["ends_at"])
+            if ends_at is None:
+                raise RowError(f"invalid ends_at: {row['ends_at']!r}")
+        return Listing(
+            title=title[:100],
+            description=row.get("description") or "",
+            bid=bid,
+            category_id=self.category_id(row.get("category")),
+            image=image,
+            ends_at=ends_at,
+            createdBy=self.seller
+        )
+
+    def save_progress(self, state):
+        if self.progress_path:
+            write_progress(self.progress_path, state)
+
+    def write(self, listings, done, end):
+        # Create the listings of the input rows done + 1 to end.
+        with transaction.atomic():
+            created = Listing.objects.bulk_create(listings)
+            # Recorded before the commit: if the process stops before the update below, resume_position() finds out
+            # from the database whether this batch was committed.
+            self.save_progress({"rows": done, "pending": {"rows": end, "id": created[0].id, "title": created[0].title}})
+            for category_id, count in Counter(listing.category_id for listing in created).items():
+                change_open_listings(category_id, count)
+            # bulk_create does not send post_save, so the search index is updated here.
+            listing_ids = [listing.id for listing in created]
+            transaction.on_commit(lambda: search_backend().index_listings(listing_ids))
+            bump_feed_version()
+
+    def run(self, rows, start=0):
+        """
+        Import rows, skipping the first start rows (already imported by an interrupted run).
+        """
+        rows = enumerate(itertools.islice(rows, start, None), start=start + 1)
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    return
+                images = self.resolve_images(pool, [row for number, row in batch])
+                listings = []
+                for number, row in batch:
+                    try:
+                        listings.append(self.build(row, images))
+                    except RowError as error:
+                        self.skipped += 1
+                        self.errors.append(f"row {number}: {error}")
+                if listings:
+                    self.write(listings, batch[0][0] - 1, batch[-1][0])
+                self.imported += len(listings)
+                self.save_progress({"rows": batch[-1][0]})
+
+
+def export_rows(queryset, after_id=0, chunk_size=EXPORT_CHUNK_SIZE):
+    # (id, dict of EXPORT_COLUMNS) for the listings after after_id, in id order, from a server-side cursor.
+    rows = queryset.filter(pk__gt=after_id).order_by("pk").values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for values in rows:
+        row = dict(zip(EXPORT_COLUMNS, values))
+        row["bid"] = str(row["bid"])
+        row["ends_at"] = row["ends_at"].isoformat() if row["ends_at"] else ""
+        row["category"] = row["category"] or ""
+        yield values[0], row
+
+
+class RowWriter:
+    # Writes export rows as CSV (with a header unless appending) or JSON Lines.
+
+    def __init__(self, file, format, header=True):
+        self.file = file
+        self.format = format
+        if format == "csv":
+            self.csv = csv.DictWriter(file, fieldnames=EXPORT_COLUMNS)
+            if header:
+                self.csv.writeheader()
+
+    def write(self, row):
+        if self.format == "csv":
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
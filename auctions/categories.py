@@ -0,0 +1,164 @@
+# Categories: name/slug lookup and the category directory (category -> number of open listings).
+# The counts live in the Category table and are changed by one UPDATE when a listing is created or closed.
+# Listings saved or deleted through the ORM (the Create Listing view, the admin, the shell) are counted by the signal
+# receivers at the end of this file. Bulk writes that skip signals - close_listings(), the catalog importer - call
+# change_open_listings() themselves. python manage.py rebuild_category_counts recounts them from the Listing table.
+# The list shown on the Categories page is cached with Django's cache framework under a versioned key. Every write
+# bumps the version, so the next request rebuilds the list from the (small) Category table - never from Listing.
+# https://docs.djangoproject.com/en/5.0/topics/cache/#the-low-level-cache-api
+
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Category, Listing
+
+
+VERSION_KEY = "auctions:categories:version"
+
+
+def category_slug(name):
+    """
+    The slug that identifies a category name: lowercase, ASCII, words joined with "-".
+    Names with no ASCII letters or digits get a stable hash-based slug.
+    Migration 0017_category_foreign_key_data uses the same rule.
+    """
+    # https://docs.djangoproject.com/en/5.0/ref/utils/#django.utils.text.slugify
+    return slugify(name)[:100] or "category-" + hashlib.md5(name.strip().lower().encode()).hexdigest()[:8]
+
+
+def category_for_name(name):
+    """
+    The Category for a name typed by a seller, created on first use. Returns None for a blank name.
+    Looked up by slug, so any spelling of an existing category finds it.
+    """
+    name = (name or "").strip()
+    if not name:
+        return None
+    category, created = Category.objects.get_or_create(slug=category_slug(name), defaults={"name": name[:100]})
+    return category
+
+
+def directory_key(version):
+    return f"auctions:categories:{version}"
+
+
+def new_version():
+    # Versions start from the clock, so an evicted version key never comes back with a number used before.
+    # The version is also the ETag of the Categories page (see conditional.py).
+    return time.time_ns()
+
+
+def directory_version():
+    # https://docs.djangoproject.com/en/5.0/topics/cache/#cache-versioning
+    return cache.get_or_set(VERSION_KEY, new_version, timeout=None)
+
+
+def directory_cache_key():
+    return directory_key(directory_version())
+
+
+def category_directory():
+    """
+    All categories with at least one open listing, ordered by name.
+    Returns a list of dicts with name, slug, open_listings and updated_at.
+    """
+    key = directory_cache_key()
+    entries = cache.get(key)
+    if entries is None:
+        entries = list(
+            Category.objects.filter(open_listings__gt=0).order_by("name").values("name", "slug", "open_listings", "updated_at")
+        )
+        cache.set(key, entries, timeout=None)
+    return entries
+
+
+async def acategory_directory():
+    # Async version of category_directory() for the ASGI views.
+    key = directory_key(await cache.aget_or_set(VERSION_KEY, new_version, timeout=None))
+    entries = await cache.aget(key)
+    if entries is None:
+        entries = [
+            entry async for entry in
+            Category.objects.filter(open_listings__gt=0).order_by("name").values("name", "slug", "open_listings", "updated_at")
+        ]
+        await cache.aset(key, entries, timeout=None)
+    return entries
+
+
+def invalidate_directory():
+    # A new version makes every cached copy stale at once. Old keys simply expire from the cache.
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The version key was evicted or never set.
+        cache.set(VERSION_KEY, new_version(), timeout=None)
+
+
+def change_open_listings(category_id, delta):
+    """
+    Add delta (+1 when a listing is created, -1 when it is closed) to the category's open listing count.
+    Listings without a category (category_id is None) are not part of the directory.
+    The cached directory is invalidated once the surrounding transaction commits.
+    """
+    if category_id is None:
+        return
+
+    # Never go below zero. A count that is already wrong is fixed by rebuild_category_counts.
+    Category.objects.filter(pk=category_id).update(
+        open_listings=Greatest(F("open_listings") + delta, 0), updated_at=timezone.now()
+    )
+
+    # https://docs.djangoproject.com/en/5.0/topics/db/transactions/#performing-actions-after-commit
+    transaction.on_commit(invalidate_directory)
+
+
+def counted_category(category_id, is_open):
+    # The category whose open_listings count includes a listing: its category while it is open, none once closed.
+    return category_id if is_open else None
+
+
+# Attribute set on a listing by listing_pre_save() for listing_saved().
+STORED_CATEGORY = "_counted_category"
+
+
+def listing_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # pre_save receiver, connected in apps.py. Reads the stored category and state of a listing being changed (e.g. in
+    # the admin), so listing_saved() can move it between counts. New listings and saves that cannot change the count
+    # cost no query.
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {"category", "category_id", "is_open"} & set(update_fields):
+        return
+    stored = Listing.objects.filter(pk=instance.pk).values_list("category_id", "is_open").first()
+    if stored is not None:
+        setattr(instance, STORED_CATEGORY, counted_category(*stored))
+
+
+def listing_saved(sender, instance, created=False, raw=False, **kwargs):
+    # post_save receiver, connected in apps.py. A category page lists its listings' titles, so a saved listing
+    # (e.g. edited in the admin) changes its category's updated_at, which is the page's Last-Modified.
+    if raw:
+        return
+    if created:
+        change_open_listings(counted_category(instance.category_id, instance.is_open), +1)
+    elif hasattr(instance, STORED_CATEGORY):
+        before = instance.__dict__.pop(STORED_CATEGORY)
+        after = counted_category(instance.category_id, instance.is_open)
+        if before != after:
+            # Moved to another category, closed or reopened.
+            change_open_listings(before, -1)
+            change_open_listings(after, +1)
+    if instance.category_id is not None:
+        Category.objects.filter(pk=instance.category_id).update(updated_at=timezone.now())
+
+
+def listing_deleted(sender, instance, **kwargs):
+    # post_delete receiver, connected in apps.py.
+    change_open_listings(counted_category(instance.category_id, instance.is_open), -1)
@@ -0,0 +1,130 @@
+# Closing auctions.
+# An auction closes when its creator clicks "Close Auction" (views.close) or when its end time (Listing.ends_at) has
+# passed and the close_auctions worker picks it up. Both go through close_listings(), which:
+# - locks the listing rows it is about to close with SELECT ... FOR UPDATE SKIP LOCKED, so several workers (and the
+#   close view) never wait for each other or close the same auction twice - rows another worker holds are skipped,
+# - closes them with one UPDATE that also records the winner (the user who placed the leading bid),
+# - writes an AuctionResult and a notification outbox event for each of them in the same transaction,
+# - updates the category counts, tells listing pages and invalidates their cached HTML, once the transaction commits.
+# Only the listing rows being closed are locked, one batch at a time. Bids on other listings carry on.
+# https://docs.djangoproject.com/en/5.0/ref/models/querysets/#select-for-update
+
+# On SQLite, which has no row locks, the whole database is locked for writing while a batch is closed. Two workers
+# that read the same due auctions cannot both commit: the second one gets "database is locked" and retries later.
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .categories import change_open_listings
+from .fragments import bump_listing_version
+from .live import publish_listing_event
+from .models import AuctionResult, Listing, Bid
+from .notifications import record_closes
+
+
+# Auctions closed per transaction by the worker.
+CLOSE_BATCH_SIZE = 500
+
+
+def parse_end_time(value):
+    """
+    Convert the end time typed in the Create Listing form (e.g. "2024-05-01T18:30") into an aware datetime.
+    Times without a timezone are in the site's timezone. Returns None for a blank or invalid value.
+    """
+    try:
+        ends_at = parse_datetime(value or "")
+    except ValueError:
+        return None
+    if ends_at is not None and timezone.is_naive(ends_at):
+        ends_at = timezone.make_aware(ends_at)
+    return ends_at
+
+
+def close_listings(listings, limit):
+    """
+    Close up to limit open listings from the listings queryset. Must be called inside transaction.atomic().
+    Returns the ids of the listings this call closed - listings already closed or locked by someone else are left alone.
+    """
+    # SQLite has no SELECT ... FOR UPDATE. Django leaves the clause out there.
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    claimed = list(
+        listings.filter(is_open=True).select_for_update(skip_locked=skip_locked)
+        .values_list("id", "category_id", "bid", "bid_count", "leading_bid_id")[:limit]
+    )
+    if not claimed:
+        return []
+
+    listing_ids = [row[0] for row in claimed]
+
+    # The winner is the user who placed the leading bid. Bids are only accepted while the row is open and unlocked,
+    # so the leading bid cannot change between the SELECT above and the writes below.
+    winners = dict(Bid.objects.filter(pk__in=[row[4] for row in claimed if row[4]]).values_list("id", "placedBy_id"))
+    winner = Bid.objects.filter(pk=OuterRef("leading_bid_id")).values("placedBy_id")[:1]
+    closed_at = timezone.now()
+    Listing.objects.filter(pk__in=listing_ids, is_open=True).update(is_open=False, winner_id=Subquery(winner), updated_at=closed_at)
+
+    # The outcome is stored with the close, so it never has to be worked out from the bids again.
+    results = AuctionResult.objects.bulk_create([
+        AuctionResult(
+            listing_id=listing_id,
+            winner_id=winners.get(leading_bid_id),
+            winning_bid=bid if leading_bid_id in winners else None,
+            bid_count=bid_count,
+            closed_at=closed_at
+        )
+        for listing_id, category_id, bid, bid_count, leading_bid_id in claimed
+    ])
+
+    # Watchers and the winner are notified later by the outbox dispatcher (notifications.py).
+    record_closes(results)
+
+    for category_id, closed in Counter(row[1] for row in claimed).items():
+        change_open_listings(category_id, -closed)
+
+    for listing_id in listing_ids:
+        publish_listing_event(listing_id, "close")
+        bump_listing_version(listing_id)
+
+    return listing_ids
+
+
+def close_listing(listing_id, user):
+    """
+    Close one auction for its creator. Returns True if this call closed it, False if user is not the creator or the
+    auction is already closed (or being closed by the worker).
+    """
+    with transaction.atomic():
+        return bool(close_listings(Listing.objects.filter(pk=listing_id, createdBy_id=user.id), 1))
+
+
+def close_due_listings(now=None, batch_size=CLOSE_BATCH_SIZE):
+    """
+    Close every auction whose end time has passed, one batch (and one short transaction) at a time, oldest first.
+    Returns the number of auctions closed. Running it again, or on several workers at once, is safe.
+    """
+    now = now or timezone.now()
+    # Uses listing_due_idx (WHERE is_open, ordered by ends_at).
+    due = Listing.objects.filter(ends_at__lte=now).order_by("ends_at")
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            closed = close_listings(due, batch_size)
+        total += len(closed)
+        # A short batch means nothing is left, or the rest is locked by other workers, who will close it.
+        if len(closed) < batch_size:
+            return total
+
+
+def next_due_in(now=None):
+    # Time until the next auction ends, or None if no open auction has an end time.
+    now = now or timezone.now()
+    ends_at = Listing.objects.filter(is_open=True, ends_at__isnull=False).order_by("ends_at").values_list("ends_at", flat=True).first()
+    if ends_at is None:
+        return None
+    return max(ends_at - now, timedelta(0))
@@ -0,0 +1,79 @@
+# HTTP validators (ETag / Last-Modified) for the read pages, used with Django's @condition decorator in views.py.
+# A browser or reverse proxy that already has a page sends its ETag back in If-None-Match. When the page has not
+# changed, the view answers 304 Not Modified without loading the listing, rendering a template or sending the HTML.
+# The ETags are built from the version counters the pages are already cached under (fragments.py, categories.py),
+# so checking one costs a cache read, not the page's queries.
+# https://docs.djangoproject.com/en/5.0/topics/conditional-view-processing/
+
+# Pages show the signed in user's name and watchlist count in the nav bar, so every ETag ends with the user part.
+# A date cannot carry the user part, so Last-Modified is only sent to signed out visitors, who all get the same page:
+# a signed in user revalidating with If-Modified-Since alone would otherwise get a 304 for another user's page or for
+# a watchlist change that did not touch updated_at. The views also send Vary: Cookie, so shared caches keep the
+# signed out and signed in pages apart.
+# Only the sync views have validators: async views would have to evaluate them synchronously from the event loop.
+
+from .categories import directory_version
+from .fragments import cached_fragment, feed_version, listing_version
+from .models import Category, Listing
+from .watchlists import user_watched_ids
+
+
+def user_part(request):
+    # What the layout shows about the user: who they are and how many listings they watch.
+    user = request.user
+    if not user.is_authenticated:
+        return "anonymous"
+    return f"{user.id}.{len(user_watched_ids(user))}"
+
+
+def listing_etag(request, id):
+    # The listing's version changes with every bid, comment, close, watch and save (see fragments.py).
+    return f"listing-{id}-{listing_version(id)}-{user_part(request)}"
+
+
+def listing_last_modified(request, id):
+    # Listing.updated_at, for signed out clients that revalidate with If-Modified-Since. Every write that sets
+    # updated_at also bumps the listing's version, so the value is cached under the version like the page: a cached
+    # page needs no query.
+    # Changes that only bump the version (watchers, the user's own watchlist) are caught by the ETag, which takes
+    # precedence when a client sends both.
+    if request.user.is_authenticated:
+        return None
+    return cached_fragment(
+        "updated-at", id, lambda: Listing.objects.filter(pk=id).values_list("updated_at", flat=True).first()
+    )
+
+
+def index_etag(request):
+    # The feed version changes whenever any listing's version does. The cursor selects the page.
+    return f"feed-{feed_version()}-{request.GET.get('cursor', '')}-{user_part(request)}"
+
+
+def categories_etag(request):
+    # The Categories page is the cached directory, which is rebuilt when its version changes.
+    return f"categories-{directory_version()}-{user_part(request)}"
+
+
+def category_state(request, slug):
+    # (updated_at, open_listings) of the category, or None if there is no such category.
+    # Read once per request and shared by category_etag() and category_last_modified().
+    if not hasattr(request, "_category_state"):
+        request._category_state = Category.objects.filter(slug=slug).values_list("updated_at", "open_listings").first()
+    return request._category_state
+
+
+def category_etag(request, slug):
+    # Category.updated_at changes when a listing in the category is created, closed or saved (categories.py).
+    state = category_state(request, slug)
+    if state is None:
+        # Let the view answer 404.
+        return None
+    updated_at, open_listings = state
+    return f"category-{slug}-{updated_at.timestamp()}-{open_listings}-{user_part(request)}"
+
+
+def category_last_modified(request, slug):
+    if request.user.is_authenticated:
+        return None
+    state = category_state(request, slug)
+    return state[0] if state is not None else None
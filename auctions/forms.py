@@ -9,6 +9,9 @@ from .models import Listing, Bid, Comment
 
 # Create a ModelForm.
 class CreateListingForm(forms.ModelForm):
+    # Sellers type the category name. new_listing matches it to a Category (or creates one).
+    category = forms.CharField(max_length=100, required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+
     # Specify the name of the model to use.
     class Meta:
         model = Listing
@@ -22,14 +25,21 @@ class CreateListingForm(forms.ModelForm):
         widgets = {
             "title": forms.TextInput(attrs={'class': 'form-control'}),
             "description": forms.Textarea(attrs={'class': 'form-control'}),
-            "category": forms.TextInput(attrs={'class': 'form-control'}),
             # "image": forms.ImageField(),
             "Bid": forms.NumberInput(attrs={'class': 'form-control'}),     
             "createdBy": forms.HiddenInput(),
             "watchlist": forms.HiddenInput(),
-            "is_open": forms.HiddenInput()
+            "is_open": forms.HiddenInput(),
+            # Optional. Browsers show a date and time picker. https://developer.mozilla.org/en-US/docs/Web/HTML/Element/input/datetime-local
+            "ends_at": forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'})
         } 
+        labels = {
+            "ends_at": "Ends at (optional)"
+        }
         # exclude = ["watchlist"]
+        # The declared category CharField above replaces the model's Category foreign key. Excluding the model field
+        # stops the form from assigning the typed name to Listing.category when it is validated.
+        exclude = ["category"]
 
 
 class CreateBidForm(forms.ModelForm):
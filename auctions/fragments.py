@@ -0,0 +1,124 @@
+# Cached HTML for listing pages.
+# Every listing has a version number in the cache. Anything that changes what a listing page shows - a bid, a comment,
+# closing, the watchlist, a new image variant, saving the listing - bumps the version after the change commits.
+# Rendered HTML is cached under keys that include the version, so a bump makes every cached fragment of that listing
+# stale at once and nothing has to be deleted. Old fragments simply expire.
+# Templates use the {% listingfragment %} tag (templatetags/listing_fragments.py). Views use cached_fragment().
+# https://docs.djangoproject.com/en/5.0/topics/cache/#template-fragment-caching
+
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Cached fragments expire after an hour even if the listing does not change.
+FRAGMENT_TIMEOUT = 60 * 60
+
+
+# Changes whenever any listing's version changes. Pages listing many listings (the Active Listings feed) use it as
+# their HTTP ETag (see conditional.py).
+FEED_VERSION_KEY = "auctions:feed:version"
+
+
+def version_key(listing_id):
+    return f"auctions:listing:{listing_id}:version"
+
+
+def new_version():
+    # Versions start from the clock, so a version key that was evicted never comes back with a number that old
+    # fragments were cached under.
+    return time.time_ns()
+
+
+def listing_version(listing_id):
+    return cache.get_or_set(version_key(listing_id), new_version, timeout=None)
+
+
+async def alisting_version(listing_id):
+    return await cache.aget_or_set(version_key(listing_id), new_version, timeout=None)
+
+
+def listing_versions(listing_ids):
+    # Versions of many listings in one cache round trip (e.g. the cards on the Active Listings page).
+    keys = {version_key(listing_id): listing_id for listing_id in listing_ids}
+    found = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return {keys[key]: version for key, version in {**found, **missing}.items()}
+
+
+async def alisting_versions(listing_ids):
+    # Async version of listing_versions() for the ASGI views.
+    keys = {version_key(listing_id): listing_id for listing_id in listing_ids}
+    found = await cache.aget_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+    return {keys[key]: version for key, version in {**found, **missing}.items()}
+
+
+def feed_version():
+    return cache.get_or_set(FEED_VERSION_KEY, new_version, timeout=None)
+
+
+def bump_key(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not in the cache: any new value makes the old fragments unreachable.
+        cache.set(key, new_version(), timeout=None)
+
+
+def bump_now(listing_id):
+    bump_key(version_key(listing_id))
+    bump_key(FEED_VERSION_KEY)
+
+
+def bump_feed_version():
+    # New listings added without post_save (bulk_create in catalog.py) change the feed but no cached listing.
+    transaction.on_commit(lambda: bump_key(FEED_VERSION_KEY))
+
+
+def bump_listing_version(listing_id):
+    # Invalidate the listing's cached HTML once the current transaction commits.
+    transaction.on_commit(lambda: bump_now(listing_id))
+
+
+def fragment_key(name, listing_id, version, vary):
+    vary_hash = hashlib.md5(repr(vary).encode()).hexdigest() if vary else ""
+    return f"auctions:fragment:{name}:{listing_id}:{version}:{vary_hash}"
+
+
+def cached_fragment(name, listing_id, render, *vary, version=None, timeout=FRAGMENT_TIMEOUT):
+    """
+    The HTML called name for the listing, from the cache or made by calling render() and cached.
+    vary are extra values the HTML depends on (e.g. the user's language). Pass version if it was already looked up.
+    """
+    if version is None:
+        version = listing_version(listing_id)
+    key = fragment_key(name, listing_id, version, vary)
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, timeout=timeout)
+    return html
+
+
+async def acached_fragment(name, listing_id, render, *vary, version=None, timeout=FRAGMENT_TIMEOUT):
+    # Async version of cached_fragment(). render is a coroutine function.
+    if version is None:
+        version = await alisting_version(listing_id)
+    key = fragment_key(name, listing_id, version, vary)
+    html = await cache.aget(key)
+    if html is None:
+        html = await render()
+        await cache.aset(key, html, timeout=timeout)
+    return html
+
+
+def listing_saved(sender, instance, **kwargs):
+    # post_save receiver, connected in apps.py: edits made in the admin change the page too.
+    bump_listing_version(instance.pk)
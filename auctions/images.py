@@ -0,0 +1,133 @@
+# Listing image processing.
+# Uploaded images are stored at full size, with their metadata removed (uploads.py). After the listing is saved, a
+# worker thread makes smaller copies of the image (a thumbnail for the listing cards and a medium size for the listing
+# page) in WebP and JPEG.
+# The copies are re-encoded from pixels only, so camera metadata (EXIF, GPS, etc.) is not copied into them either.
+# https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.thumbnail
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .fragments import bump_listing_version
+from .models import Listing
+
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> largest width and height in pixels. The aspect ratio is kept.
+VARIANTS = {
+    "thumb": (320, 320),
+    "medium": (960, 960),
+}
+
+# Output format -> (Pillow format name, file extension, save options).
+FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Worker threads shared by the whole process. Pillow releases the GIL while resizing and encoding.
+executor = ThreadPoolExecutor(max_workers=getattr(settings, "AUCTIONS_IMAGE_WORKERS", 2), thread_name_prefix="listing-images")
+
+
+def variant_path(image_name, variant, extension):
+    # Variants are stored by image, not by listing, so listings sharing a content-addressed image (uploads.py) share them.
+    # Those are keyed on the sha256 stem. Other images (stored before uploads were content-addressed) are keyed on their
+    # whole path, so images/photo.jpg and images/photo.png do not overwrite each other's variants.
+    if image_name.startswith("images/sha256/"):
+        stem = os.path.splitext(os.path.basename(image_name))[0]
+        return f"images/variants/{stem}/{variant}.{extension}"
+    return f"images/variants/files/{image_name}/{variant}.{extension}"
+
+
+def existing_variants(image_name):
+    # Content-addressed images never change, so variants made for another listing with the same image can be reused.
+    if not image_name.startswith("images/sha256/"):
+        return None
+    variants = {
+        variant: {format_name: variant_path(image_name, variant, extension) for format_name, (pillow_format, extension, options) in FORMATS.items()}
+        for variant in VARIANTS
+    }
+    if all(default_storage.exists(path) for files in variants.values() for path in files.values()):
+        return variants
+    return None
+
+
+def make_variants(source, image_name):
+    """
+    Resize the image file source into every variant and format and save them to the default storage.
+    Returns the image_variants dict to store on the listing.
+    """
+    with Image.open(source) as original:
+        # Apply the EXIF orientation to the pixels before the EXIF data is dropped.
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    variants = {}
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        # https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.thumbnail
+        resized.thumbnail(size, Image.Resampling.LANCZOS)
+
+        variants[variant] = {}
+        for format_name, (pillow_format, extension, options) in FORMATS.items():
+            # JPEG has no transparency.
+            output = resized.convert("RGB") if pillow_format == "JPEG" or resized.mode not in ("RGB", "RGBA") else resized
+            buffer = BytesIO()
+            output.save(buffer, pillow_format, **options)
+
+            path = variant_path(image_name, variant, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[variant][format_name] = default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    return variants
+
+
+def process_listing_image(listing_id, force=False):
+    """
+    Make the image variants for one listing and save their paths on it.
+    Existing variants of a content-addressed image are reused unless force is True, in which case they are remade.
+    """
+    listing = Listing.objects.only("id", "image").get(pk=listing_id)
+    if not listing.image:
+        return
+
+    variants = None if force else existing_variants(listing.image.name)
+    if variants is None:
+        with listing.image.open("rb") as source:
+            variants = make_variants(source, listing.image.name)
+
+    # update() writes only this column and does not send post_save.
+    Listing.objects.filter(pk=listing_id).update(image_variants=variants, updated_at=timezone.now())
+    # Cached listing HTML still points at the original image.
+    bump_listing_version(listing_id)
+
+
+def process_in_background(listing_id, force=False):
+    # Runs in a worker thread, which has its own database connection.
+    close_old_connections()
+    try:
+        process_listing_image(listing_id, force)
+    except Exception:
+        # The listing keeps showing its original image. The process_images command can retry it.
+        logger.exception("Could not process the image for listing %s", listing_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(listing_id):
+    """
+    Process the listing's image in a worker thread once the current transaction commits,
+    so the request that uploaded the image does not wait for it.
+    """
+    transaction.on_commit(lambda: executor.submit(process_in_background, listing_id))
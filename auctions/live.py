@@ -0,0 +1,111 @@
+# Live listing updates.
+# Browsers on a listing page subscribe to /listing/<id>/events (Server-Sent Events, see views.listing_events) and are
+# pushed accepted bids, new comments and the auction closing, instead of reloading the page.
+# https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events/Using_server-sent_events
+
+# Events go through a broker. LocalBroker fans out to the subscribers in this process only, which is enough for one
+# ASGI worker and for tests. For several workers set AUCTIONS_LIVE_BROKER in settings.py to the dotted path of a
+# Broker subclass backed by a shared pub/sub service (e.g. Redis).
+
+# The events endpoint holds a connection open per browser, so it needs the ASGI entry point (commerce/asgi.py).
+
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# Events waiting for one slow subscriber. When it is full the oldest event is dropped.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+class Broker:
+    """
+    Interface for a pub/sub broker.
+    publish() may be called from any thread. subscribe() is an async context manager that yields an asyncio.Queue
+    receiving the events published to the channel while the subscription is open.
+    """
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    # In-process pub/sub: one bounded asyncio.Queue per subscriber.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # channel -> {queue: event loop that owns the queue}
+        self.subscribers = defaultdict(dict)
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, {}).items())
+        for queue, loop in subscribers:
+            # Queues belong to their event loop; publishers may be sync views running in a thread pool.
+            try:
+                loop.call_soon_threadsafe(self.deliver, queue, event)
+            except RuntimeError:
+                # The subscriber's loop was closed before it unsubscribed. Publishing runs after the bid or close has
+                # committed, so a dead subscriber must not fail the request: drop it and tell the others.
+                self.unsubscribe(channel, queue)
+
+    @staticmethod
+    def deliver(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers[channel][queue] = asyncio.get_running_loop()
+        try:
+            yield queue
+        finally:
+            self.unsubscribe(channel, queue)
+
+    def unsubscribe(self, channel, queue):
+        with self.lock:
+            subscribers = self.subscribers.get(channel)
+            if subscribers is None:
+                return
+            subscribers.pop(queue, None)
+            if not subscribers:
+                del self.subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.subscribers.get(channel, {}))
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        broker_path = getattr(settings, "AUCTIONS_LIVE_BROKER", None)
+        _broker = import_string(broker_path)() if broker_path else LocalBroker()
+    return _broker
+
+
+def publish_listing_event(listing_id, event_type, **data):
+    """
+    Publish an event to the listing's subscribers once the current transaction commits,
+    so browsers are never told about a bid or comment that was rolled back.
+    """
+    event = {"type": event_type, "listing": listing_id, **data}
+    transaction.on_commit(lambda: get_broker().publish(listing_channel(listing_id), event))
@@ -0,0 +1,145 @@
+# Structured, sampled logging for the auctions app. Views and workers log events here instead of print().
+#
+# log_event(logger, "bid.placed", listing_id=3, amount=amount) writes one JSON line, e.g.
+#   {"time": "...", "level": "INFO", "logger": "auctions.views", "event": "bid.placed", "listing_id": 3, "amount": "5.00"}
+#
+# Cheap when nobody is listening:
+# - the level is checked first, so a disabled event costs one method call and builds nothing,
+# - field values are kept as they are and only turned into JSON by the formatter,
+# - per-logger sampling (AUCTIONS_LOG_SAMPLING = {"auctions.views": 0.1}) drops a share of the events of busy loggers,
+# - records can be handed to a background thread through a queue (QueueHandler), so a request never waits for stderr.
+#
+# Where the records go is up to the project. Either format them with LOGGING, next to the project's other handlers:
+#   LOGGING = {
+#       "version": 1,
+#       "formatters": {"structured": {"()": "auctions.logs.StructuredFormatter"}},
+#       "handlers": {"events": {"class": "logging.StreamHandler", "formatter": "structured"}},
+#       "loggers": {"auctions": {"handlers": ["events"], "level": "INFO"}},
+#   }
+# or set AUCTIONS_LOG_QUEUE = True to have start_queue_logging() write them to stderr from a background thread. That
+# takes the "auctions" logger out of the root logger's handlers (file, Sentry, ...), so it is off by default.
+#
+# Values are described without side effects: a QuerySet that has not been evaluated is logged as its model name and
+# never run, and model instances are logged as "Model:pk" instead of str(), which may follow foreign keys.
+# https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+from django.db.models import Model, QuerySet
+from django.forms import BaseForm
+
+
+# The attribute of a LogRecord that holds the event's fields.
+FIELDS_ATTRIBUTE = "event_fields"
+
+
+def describe(value):
+    # A JSON-friendly description of value that never runs a query or renders a template.
+    if isinstance(value, QuerySet):
+        # _result_cache is set once the QuerySet has been evaluated. Logging must not evaluate it.
+        if value._result_cache is None:
+            return f"<QuerySet {value.model.__name__} (not evaluated)>"
+        return f"<QuerySet {value.model.__name__} ({len(value._result_cache)} rows)>"
+    if isinstance(value, Model):
+        return f"{type(value).__name__}:{value.pk}"
+    if isinstance(value, BaseForm):
+        # Printing a form renders every widget. The names of the submitted fields are enough.
+        return {"form": type(value).__name__, "fields": sorted(value.data.keys())}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [describe(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in value.items()}
+    # Decimal, datetime, ...
+    return str(value)
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """
+    Log a named event with fields. Nothing is formatted or described unless a handler writes the record.
+    Use it with a logger from get_logger() so the logger's sampling rate applies.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, event, extra={FIELDS_ATTRIBUTE: fields})
+
+
+class SamplingFilter(logging.Filter):
+    # Keep a share (rate, 0 to 1) of the records below WARNING. Warnings and errors are always kept.
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+def get_logger(name):
+    # logging.getLogger(name) with the sampling rate from AUCTIONS_LOG_SAMPLING (default: keep everything).
+    logger = logging.getLogger(name)
+    rate = getattr(settings, "AUCTIONS_LOG_SAMPLING", {}).get(name, 1.0)
+    if rate < 1 and not any(isinstance(existing, SamplingFilter) for existing in logger.filters):
+        logger.addFilter(SamplingFilter(rate))
+    return logger
+
+
+class StructuredFormatter(logging.Formatter):
+    # One JSON object per record: time, level, logger, event and the event's fields.
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        for key, value in getattr(record, FIELDS_ATTRIBUTE, {}).items():
+            entry[key] = describe(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    # Formats the record in the logging thread and queues only the finished line: no model or QuerySet is handed
+    # to the listener thread.
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.__dict__.pop(FIELDS_ATTRIBUTE, None)
+        return record
+
+
+def start_queue_logging(logger_name="auctions", stream=None, level=None):
+    """
+    Send the records of logger_name (and its children) to stream (stderr) from a background thread.
+    Called by AuctionsConfig.ready() if AUCTIONS_LOG_QUEUE is True, unless LOGGING already gives the logger a handler.
+    Returns the QueueListener, or None if logging was left as configured.
+    """
+    logger = logging.getLogger(logger_name)
+    if logger.handlers:
+        return None
+
+    records = queue.SimpleQueue()
+    handler = StructuredQueueHandler(records)
+    handler.setFormatter(StructuredFormatter())
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    # Write out what is still queued when the process exits.
+    atexit.register(listener.stop)
+
+    logger.addHandler(handler)
+    # WARNING by default, like Python's root logger: set AUCTIONS_LOG_LEVEL = "INFO" (or "DEBUG") to see the events.
+    logger.setLevel(level or getattr(settings, "AUCTIONS_LOG_LEVEL", "WARNING"))
+    # The records are written here. Do not write them again through the root logger's handlers.
+    logger.propagate = False
+    return listener
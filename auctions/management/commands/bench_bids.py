@@ -0,0 +1,80 @@
+# Concurrency benchmark for bidding.place_bid.
+# Fires many bids from parallel threads at one listing, then checks that every accepted bid was stored,
+# the stored bids rise with their ids, and the listing's counters match the Bid table.
+
+# Usage:
+# python manage.py bench_bids --bids 5000 --workers 32
+# Run it against the database you want to measure (PostgreSQL for real row locking). Test data is deleted afterwards
+# unless --keep is given.
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from auctions.bidding import place_bid
+from auctions.models import User, Listing, Bid
+
+
+class Command(BaseCommand):
+    help = "Place many concurrent bids on one listing and verify that no accepted bid is lost or out of order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=5000, help="Total number of bids to place.")
+        parser.add_argument("--workers", type=int, default=32, help="Number of parallel threads (one database connection each).")
+        parser.add_argument("--bidders", type=int, default=100, help="Number of distinct bidding users.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark listing, users and bids.")
+
+    def handle(self, *args, **options):
+        seller = User.objects.create_user(f"bench_seller_{time.time_ns()}")
+        bidders = [User.objects.create_user(f"bench_bidder_{time.time_ns()}_{i}") for i in range(options["bidders"])]
+        listing = Listing.objects.create(title="Benchmark listing", description="bench_bids", image="images/bench.png",
+                                         bid=Decimal("1.00"), createdBy=seller)
+
+        # Amounts climb overall but overlap between threads, so many bids race for the same price.
+        amounts = [Decimal(1 + i // 4 + random.randint(0, 50)) + Decimal("0.01") for i in range(options["bids"])]
+
+        def bid_worker(amount):
+            try:
+                new_bid = place_bid(listing.id, random.choice(bidders), amount)
+                return "accepted" if new_bid is not None else "rejected"
+            except OperationalError:
+                # SQLite reports "database is locked" when a writer waits too long.
+                return "error"
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            results = list(pool.map(bid_worker, amounts))
+        elapsed = time.perf_counter() - started
+
+        accepted = results.count("accepted")
+        stored = list(Bid.objects.filter(listing=listing).order_by("id").values_list("id", "bid"))
+        listing.refresh_from_db()
+
+        problems = []
+        if len(stored) != accepted:
+            problems.append(f"{accepted} bids accepted but {len(stored)} stored")
+        if listing.bid_count != len(stored):
+            problems.append(f"bid_count is {listing.bid_count}, {len(stored)} bids stored")
+        if any(earlier[1] >= later[1] for earlier, later in zip(stored, stored[1:])):
+            problems.append("stored bids are not strictly increasing in id order")
+        if stored and (listing.leading_bid_id != stored[-1][0] or listing.bid != stored[-1][1]):
+            problems.append("leading bid / current bid do not match the last accepted bid")
+
+        self.stdout.write(
+            f"{len(amounts)} bids in {elapsed:.2f}s ({len(amounts) / elapsed:.0f} bids/s) with {options['workers']} workers: "
+            f"{accepted} accepted, {results.count('rejected')} rejected, {results.count('error')} errors."
+        )
+
+        if not options["keep"]:
+            listing.delete()
+            User.objects.filter(pk__in=[seller.pk] + [bidder.pk for bidder in bidders]).delete()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No accepted bid was lost or stored out of order."))
@@ -0,0 +1,106 @@
+# HTTP load test for the read-only pages, run against a server that is already running.
+# Used to compare the sync views with the async read views (AUCTIONS_ASYNC_VIEWS) under an ASGI server:
+
+# Usage:
+# uvicorn commerce.asgi:application --workers 1                     (AUCTIONS_ASYNC_VIEWS = False in settings.py)
+# python manage.py bench_http --label sync --concurrency 200 --requests 20000
+# uvicorn commerce.asgi:application --workers 1                     (AUCTIONS_ASYNC_VIEWS = True)
+# python manage.py bench_http --label async --concurrency 200 --requests 20000
+
+# Every client thread keeps one HTTP/1.1 connection open and requests the pages in turn.
+# The report has the requests per second and the median, p95 and p99 latency for each page.
+
+import http.client
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.models import Category, Listing
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Measure requests per second and latency percentiles of the read-only pages on a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running server.")
+        parser.add_argument("--requests", type=int, default=5000, help="Total number of requests.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Number of client connections.")
+        parser.add_argument("--paths", nargs="*", help="Paths to request. Defaults to the feed, categories and a few listing and category pages.")
+        parser.add_argument("--label", default="", help="Name printed with the results, e.g. sync or async.")
+
+    def default_paths(self):
+        # Pages that exist in the database the server is using.
+        paths = ["/", "/categories"]
+        paths += [f"/listing/{listing_id}" for listing_id in Listing.objects.filter(is_open=True).order_by("-id").values_list("id", flat=True)[:10]]
+        paths += [f"/category/{slug}" for slug in Category.objects.filter(open_listings__gt=0).order_by("-open_listings").values_list("slug", flat=True)[:5]]
+        return paths
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("--url must be an http:// URL.")
+        paths = options["paths"] or self.default_paths()
+        total = options["requests"]
+        concurrency = options["concurrency"]
+
+        local = threading.local()
+        lock = threading.Lock()
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+
+        def fetch(number):
+            path = paths[number % len(paths)]
+            if not hasattr(local, "connection"):
+                local.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            started = time.perf_counter()
+            try:
+                local.connection.request("GET", path)
+                response = local.connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    latencies[path].append(elapsed)
+                else:
+                    errors[path] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(fetch, range(total)))
+        duration = time.perf_counter() - started
+
+        all_latencies = [latency for values in latencies.values() for latency in values]
+        if not all_latencies:
+            raise CommandError(f"No successful responses from {options['url']}.")
+
+        label = f"[{options['label']}] " if options["label"] else ""
+        self.stdout.write(
+            f"{label}{len(all_latencies)} OK, {sum(errors.values())} failed in {duration:.2f}s "
+            f"at concurrency {concurrency}: {len(all_latencies) / duration:.0f} requests/s, "
+            f"median {statistics.median(all_latencies) * 1000:.1f} ms, p99 {percentile(all_latencies, 0.99) * 1000:.1f} ms"
+        )
+        for path in paths:
+            values = latencies.get(path)
+            if not values:
+                self.stdout.write(f"  {path}: {errors[path]} failed")
+                continue
+            self.stdout.write(
+                f"  {path}: median {statistics.median(values) * 1000:.1f} ms, "
+                f"p95 {percentile(values, 0.95) * 1000:.1f} ms, p99 {percentile(values, 0.99) * 1000:.1f} ms, "
+                f"{errors[path]} failed"
+            )
@@ -0,0 +1,134 @@
+# Benchmark for the indexes added in migration 0015_hot_path_indexes.
+# Seeds a large data set, then runs the hot-path queries with and without the indexes and prints the query plan
+# and the median time of each.
+
+# Usage:
+# python manage.py bench_indexes --bids 1000000
+# Run it against a scratch database: seeding a million bids takes a while and the data is deleted afterwards
+# unless --keep is given. The indexes are dropped only for the "before" run and are always recreated.
+
+import random
+import statistics
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from auctions.categories import category_for_name, change_open_listings
+from auctions.models import User, Category, Listing, Bid, Comment
+
+
+CATEGORIES = ["Art", "Books", "Electronics", "Fashion", "Home", "Music", "Sports", "Toys"]
+
+
+class Command(BaseCommand):
+    help = "Seed bids, listings and comments and compare hot-path query plans and timings with and without indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=1_000_000)
+        parser.add_argument("--listings", type=int, default=20_000)
+        parser.add_argument("--users", type=int, default=1_000)
+        parser.add_argument("--comments", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per bulk_create.")
+        parser.add_argument("--repeat", type=int, default=20, help="Times each query is run.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded data.")
+
+    def handle(self, *args, **options):
+        prefix = f"bench_{time.time_ns()}"
+        users, listings, categories = self.seed(prefix, options)
+
+        listing_id = random.choice(listings)
+        user_id = random.choice(users)
+        queries = {
+            "top bid for a listing": lambda: Bid.objects.filter(listing_id=listing_id).order_by("-bid")[:1],
+            "comments for a listing": lambda: Comment.objects.filter(listing_id=listing_id).order_by("id"),
+            "active listings feed": lambda: Listing.objects.filter(is_open=True).order_by("-id")[:25],
+            "category page": lambda: Listing.objects.filter(is_open=True, category_id=random.choice(categories)),
+            "user's open listings": lambda: Listing.objects.filter(createdBy_id=user_id, is_open=True),
+        }
+
+        after = self.measure(queries, options["repeat"])
+        indexes = [(model, index) for model in (Listing, Bid, Comment) for index in model._meta.indexes]
+        try:
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.remove_index(model, index)
+            before = self.measure(queries, options["repeat"])
+        finally:
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.add_index(model, index)
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  before: {before[name][0] * 1000:.3f} ms\n    {before[name][1]}")
+            self.stdout.write(f"  after:  {after[name][0] * 1000:.3f} ms\n    {after[name][1]}")
+
+        if not options["keep"]:
+            # Deleting the listings gives their category counts back (categories.listing_deleted).
+            Listing.objects.filter(title__startswith=prefix).delete()
+            Category.objects.filter(pk__in=categories).delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+    def seed(self, prefix, options):
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+
+        # Categories of their own, so the benchmark never changes the counts of the site's categories.
+        categories = [category_for_name(f"{prefix} {name}").id for name in CATEGORIES]
+
+        User.objects.bulk_create(
+            [User(username=f"{prefix}_user_{i}") for i in range(options["users"])], batch_size=batch_size
+        )
+        users = list(User.objects.filter(username__startswith=prefix).values_list("id", flat=True))
+
+        Listing.objects.bulk_create(
+            [
+                Listing(title=f"{prefix} listing {i}", description="Benchmark listing", category_id=random.choice(categories),
+                        image="images/bench.png", bid=Decimal("1.00"), is_open=random.random() < 0.8,
+                        createdBy_id=random.choice(users))
+                for i in range(options["listings"])
+            ],
+            batch_size=batch_size
+        )
+        listings = list(Listing.objects.filter(title__startswith=prefix).values_list("id", flat=True))
+        # bulk_create skips the signals that count open listings.
+        open_by_category = Counter(
+            Listing.objects.filter(title__startswith=prefix, is_open=True).values_list("category_id", flat=True)
+        )
+        for category_id, count in open_by_category.items():
+            change_open_listings(category_id, count)
+
+        # Bids and comments are generated one batch at a time so memory stays flat.
+        for start in range(0, options["bids"], batch_size):
+            Bid.objects.bulk_create([
+                Bid(bid=Decimal(random.randint(2, 100_000)) / 100, listing_id=random.choice(listings), placedBy_id=random.choice(users))
+                for _ in range(min(batch_size, options["bids"] - start))
+            ])
+        for start in range(0, options["comments"], batch_size):
+            Comment.objects.bulk_create([
+                Comment(comment="Benchmark comment", listing_id=random.choice(listings), author_id=random.choice(users))
+                for _ in range(min(batch_size, options["comments"] - start))
+            ])
+
+        # Refresh the planner statistics so both runs see the real table sizes.
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        self.stdout.write(f"Seeded {options['bids']} bids in {time.perf_counter() - started:.1f}s.")
+        return users, listings, categories
+
+    def measure(self, queries, repeat):
+        results = {}
+        for name, build in queries.items():
+            # https://docs.djangoproject.com/en/5.0/ref/models/querysets/#explain
+            plan = build().explain().replace("\n", "\n    ")
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build())
+                timings.append(time.perf_counter() - started)
+            results[name] = (statistics.median(timings), plan)
+        return results
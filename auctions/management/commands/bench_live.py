@@ -0,0 +1,117 @@
+# Load test for live listing updates (views.listing_events and live.LocalBroker).
+# Opens thousands of idle Server-Sent Events connections to one listing through Django's ASGI handler in this process,
+# then publishes events and measures how long it takes every subscriber to receive each one.
+
+# Usage:
+# python manage.py bench_live --subscribers 5000 --events 20
+
+import asyncio
+import resource
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.live import get_broker, listing_channel
+from auctions.models import User, Listing
+
+
+def request_host():
+    # A host name accepted by ALLOWED_HOSTS.
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            return host.lstrip(".")
+    return "localhost"
+
+
+class Command(BaseCommand):
+    help = "Hold many idle SSE subscribers on one listing and measure event fan-out latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=5000)
+        parser.add_argument("--events", type=int, default=20, help="Number of events published once everyone is subscribed.")
+
+    def handle(self, *args, **options):
+        seller = User.objects.create_user(f"bench_seller_{time.time_ns()}")
+        listing = Listing.objects.create(title="Benchmark listing", description="bench_live", image="images/bench.png",
+                                         bid=Decimal("1.00"), createdBy=seller)
+        try:
+            asyncio.run(self.run(listing.id, options["subscribers"], options["events"]))
+        finally:
+            seller.delete()
+
+    async def run(self, listing_id, subscribers, events):
+        application = ASGIHandler()
+        broker = get_broker()
+        channel = listing_channel(listing_id)
+        disconnect = asyncio.Event()
+        # received[i] = number of events connection i has seen so far.
+        received = [0] * subscribers
+        progress = asyncio.Condition()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": f"/listing/{listing_id}/events", "raw_path": f"/listing/{listing_id}/events".encode(),
+            "query_string": b"", "root_path": "", "headers": [(b"host", request_host().encode())],
+            "client": ("127.0.0.1", 50000), "server": (request_host(), 80),
+        }
+
+        async def connection(index):
+            request_sent = False
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # The browser stays connected and idle until the test is over.
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start" and message["status"] != 200:
+                    raise CommandError(f"Events endpoint returned {message['status']}.")
+                if message["type"] == "http.response.body" and message.get("body", b"").startswith(b"event: "):
+                    async with progress:
+                        received[index] += 1
+                        progress.notify_all()
+
+            await application(dict(scope), receive, send)
+
+        memory_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(connection(index)) for index in range(subscribers)]
+
+        # Wait until every connection has subscribed.
+        while broker.subscriber_count(channel) < subscribers:
+            if any(task.done() for task in tasks):
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+            await asyncio.sleep(0.05)
+        connect_time = time.perf_counter() - started
+        memory_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        fan_out = []
+        for number in range(1, events + 1):
+            published = time.perf_counter()
+            broker.publish(channel, {"type": "bid", "listing": listing_id, "bid": str(number)})
+            async with progress:
+                await progress.wait_for(lambda: min(received) >= number)
+            fan_out.append(time.perf_counter() - published)
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.stdout.write(
+            f"{subscribers} subscribers connected in {connect_time:.2f}s, "
+            f"peak RSS grew by {(memory_after - memory_before) / 1024:.1f} MB."
+        )
+        self.stdout.write(
+            f"{events} events delivered to every subscriber: median {statistics.median(fan_out) * 1000:.1f} ms, "
+            f"max {max(fan_out) * 1000:.1f} ms."
+        )
+        self.stdout.write(self.style.SUCCESS(f"{broker.subscriber_count(channel)} subscribers left after disconnect."))
@@ -0,0 +1,86 @@
+# Latency benchmark for search.search_listings.
+# Seeds a corpus of listings built from a small vocabulary, rebuilds the search index, then runs random one- to
+# three-word searches (some with filters) and prints p50 / p95 / p99 latency.
+
+# Usage:
+# python manage.py bench_search --listings 100000 --queries 500
+# Seeded listings are deleted afterwards unless --keep is given.
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from auctions.categories import category_for_name
+from auctions.models import User, Listing
+from auctions.search import search_backend, search_listings
+
+
+WORDS = (
+    "vintage antique modern rustic handmade wooden brass silver gold leather ceramic glass oak walnut marble "
+    "lamp table chair vase clock mirror rug painting print poster camera guitar violin piano bicycle watch "
+    "ring necklace jacket boots scarf book novel atlas record radio phone laptop monitor keyboard speaker "
+    "red blue green black white small large rare signed original restored boxed mint used new"
+).split()
+
+CATEGORIES = ["Art", "Books", "Electronics", "Fashion", "Home", "Music", "Sports", "Toys"]
+
+
+def percentile(timings, percent):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = "Seed listings and measure full-text search latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=5_000, help="Rows per bulk_create.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded listings.")
+
+    def handle(self, *args, **options):
+        prefix = f"bench_{time.time_ns()}"
+        seller = User.objects.create_user(prefix)
+        categories = [category_for_name(name) for name in CATEGORIES]
+
+        started = time.perf_counter()
+        for start in range(0, options["listings"], options["batch_size"]):
+            Listing.objects.bulk_create([
+                Listing(title=" ".join(random.sample(WORDS, 3)), description=" ".join(random.choices(WORDS, k=30)),
+                        category=random.choice(categories), image="images/bench.png",
+                        bid=Decimal(random.randint(1, 1000)), is_open=random.random() < 0.8, createdBy=seller)
+                for _ in range(min(options["batch_size"], options["listings"] - start))
+            ])
+
+        # bulk_create does not send post_save, so index the corpus in one pass.
+        backend = search_backend()
+        backend.rebuild()
+        self.stdout.write(f"Seeded and indexed {options['listings']} listings in {time.perf_counter() - started:.1f}s "
+                          f"({type(backend).__name__}).")
+
+        timings = []
+        for _ in range(options["queries"]):
+            query = " ".join(random.sample(WORDS, random.randint(1, 3)))
+            filters = random.choice([
+                {},
+                {"status": "all"},
+                {"category": random.choice(categories)},
+                {"min_price": Decimal(100), "max_price": Decimal(500)},
+            ])
+            started = time.perf_counter()
+            search_listings(query, **filters)
+            timings.append(time.perf_counter() - started)
+
+        self.stdout.write(
+            f"{len(timings)} searches: mean {statistics.mean(timings) * 1000:.2f} ms, "
+            f"p50 {percentile(timings, 50) * 1000:.2f} ms, p95 {percentile(timings, 95) * 1000:.2f} ms, "
+            f"p99 {percentile(timings, 99) * 1000:.2f} ms"
+        )
+
+        if not options["keep"]:
+            seller.delete()
+            backend.rebuild()
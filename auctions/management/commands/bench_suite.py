@@ -0,0 +1,99 @@
+# Benchmark suite for the auction workflows. See auctions/benchmarks.py.
+# Seeds a data set, runs the scenarios and prints (or writes) a JSON report with the throughput, p50/p95/p99 latency
+# and queries per request of each. With --baseline the run fails if a scenario regressed against a stored report.
+
+# Usage:
+# python manage.py bench_suite --output baseline.json                       # test client, default scale
+# python manage.py bench_suite --baseline baseline.json                     # fails on a regression
+# python manage.py bench_suite --users 500 --listings 20000 --bids 500000 --iterations 1000
+# python manage.py bench_suite --driver http --url http://127.0.0.1:8000 --concurrency 32
+#     (the server must use the same database; queries per request are only counted by the test client driver)
+# Run it against a scratch database. The seeded data is deleted afterwards unless --keep is given.
+
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from auctions.benchmarks import SCENARIOS, ClientDriver, HttpDriver, cleanup, compare, run_scenario, seed, summarize
+
+
+class Command(BaseCommand):
+    help = "Seed benchmark data, run the auction workflow scenarios and report (and check) their performance."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--listings", type=int, default=1000)
+        parser.add_argument("--bids", type=int, default=10_000)
+        parser.add_argument("--comments", type=int, default=2000)
+        parser.add_argument("--watches", type=int, default=2000, help="Watchlist rows.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk_create.")
+        parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS), help="Scenarios to run. Defaults to all.")
+        parser.add_argument("--iterations", type=int, default=200, help="Iterations of each scenario.")
+        parser.add_argument("--driver", choices=["client", "http"], default="client")
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running server (--driver http).")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads (--driver http). The test client runs one.")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed, so runs use the same data and requests.")
+        parser.add_argument("--output", help="Write the JSON report to this file (e.g. to use as a baseline).")
+        parser.add_argument("--baseline", help="JSON report to compare with. Regressions fail the command.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed latency/throughput change against the baseline.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded data.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+            # Test client and HTTP timings are not comparable.
+            if baseline.get("driver") != options["driver"]:
+                raise CommandError(f"The baseline was measured with --driver {baseline.get('driver')}.")
+
+        if options["driver"] == "http":
+            url = urlsplit(options["url"])
+            if url.scheme != "http" or not url.hostname:
+                raise CommandError("--url must be an http:// URL.")
+            make_driver = lambda user_id: HttpDriver(user_id, url.hostname, url.port or 80)
+            concurrency = options["concurrency"]
+        else:
+            make_driver = ClientDriver
+            concurrency = 1
+
+        rng = random.Random(options["seed"])
+        prefix = f"bench_{time.time_ns()}"
+        started = time.perf_counter()
+        world = seed(prefix, options["users"], options["listings"], options["bids"], options["comments"], options["watches"],
+                     batch_size=options["batch_size"], rng=rng)
+        self.stderr.write(f"Seeded {options['listings']} listings and {options['bids']} bids in {time.perf_counter() - started:.1f}s.")
+
+        report = {
+            "driver": options["driver"],
+            "scale": {name: options[name] for name in ("users", "listings", "bids", "comments", "watches")},
+            "iterations": options["iterations"],
+            "concurrency": concurrency,
+            "scenarios": {},
+        }
+        try:
+            # The test client sends Host: testserver.
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                for name in options["scenarios"] or SCENARIOS:
+                    records, seconds = run_scenario(SCENARIOS[name], world, make_driver, options["iterations"], concurrency, rng)
+                    report["scenarios"][name] = summarize(records, seconds)
+        finally:
+            if not options["keep"]:
+                cleanup(prefix)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = compare(report, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,51 @@
+# Close auctions whose end time (Listing.ends_at) has passed. See auctions/closing.py.
+# Run it once from cron, or keep it running as a worker with --loop. Several workers may run at the same time:
+# each batch locks only the rows it closes and skips rows locked by another worker.
+
+# Usage:
+# python manage.py close_auctions                    # close everything that is due, then exit
+# python manage.py close_auctions --loop             # keep closing auctions as they end
+# python manage.py close_auctions --loop --interval 1 --batch-size 1000
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from auctions.closing import CLOSE_BATCH_SIZE, close_due_listings, next_due_in
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Close auctions that have reached their end time and record the winners."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=CLOSE_BATCH_SIZE, help="Auctions closed per transaction.")
+        parser.add_argument("--loop", action="store_true", help="Keep running and close auctions as they end.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Longest wait in seconds between scans with --loop.")
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            closed = close_due_listings(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Closed {closed} auctions."))
+            return
+
+        while True:
+            # Long-running process: drop connections that the database has timed out.
+            close_old_connections()
+            try:
+                closed = close_due_listings(batch_size=options["batch_size"])
+                if closed:
+                    self.stdout.write(f"Closed {closed} auctions.")
+                # Sleep until the next auction ends, but wake up at least every --interval seconds
+                # for auctions created in the meantime.
+                due_in = next_due_in()
+            except DatabaseError:
+                # e.g. another worker holds the SQLite write lock. Nothing was committed, so try again later.
+                logger.exception("Could not close due auctions")
+                due_in = None
+            wait = options["interval"] if due_in is None else min(due_in.total_seconds(), options["interval"])
+            time.sleep(max(wait, 0.05))
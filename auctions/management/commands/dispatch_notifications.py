@@ -0,0 +1,43 @@
+# Deliver pending notification outbox events (see auctions/notifications.py).
+# Run it from cron, or keep it running as a worker with --loop. Several workers may run at the same time.
+
+# Usage:
+# python manage.py dispatch_notifications                 # deliver everything pending, then exit
+# python manage.py dispatch_notifications --loop          # keep delivering as events arrive
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from auctions.notifications import DISPATCH_BATCH_SIZE, dispatch_all
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Turn pending bid and close events into notifications for watchers, bidders and winners."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DISPATCH_BATCH_SIZE, help="Events handled per transaction.")
+        parser.add_argument("--loop", action="store_true", help="Keep running and deliver events as they arrive.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to wait when there is nothing to deliver.")
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            handled = dispatch_all(options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Delivered {handled} events."))
+            return
+
+        while True:
+            close_old_connections()
+            try:
+                handled = dispatch_all(options["batch_size"])
+                if handled:
+                    self.stdout.write(f"Delivered {handled} events.")
+            except DatabaseError:
+                # The batch was rolled back and its events are still pending.
+                logger.exception("Could not deliver notifications")
+            time.sleep(options["interval"])
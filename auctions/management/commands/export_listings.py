@@ -0,0 +1,78 @@
+# Export listings to a CSV or JSON Lines file (see auctions/catalog.py for the columns).
+# Rows are streamed from a server-side cursor in id order, so any size of catalog exports in constant memory.
+# When writing to a file, the last exported id and the file position are written to <file>.progress every --chunk-size
+# rows. If an export is interrupted, run it again with --resume to append the rest to the same file.
+# The file can be imported again with import_listings.
+
+# Usage:
+# python manage.py export_listings --output catalog.csv
+# python manage.py export_listings --status open --format jsonl > open.jsonl
+# python manage.py export_listings --output catalog.csv --resume
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.catalog import EXPORT_CHUNK_SIZE, RowWriter, clear_progress, export_rows, file_format, read_progress, write_progress
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Export listings to CSV or JSON Lines, streaming them from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write (default: standard output).")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from the file extension, or csv).")
+        parser.add_argument("--status", choices=["open", "closed", "all"], default="all", help="Listings to export.")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Number of rows fetched per database round trip.")
+        parser.add_argument("--resume", action="store_true", help="Append the listings an interrupted export of the same file did not write.")
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        if options["resume"] and not path:
+            raise CommandError("--resume needs --output.")
+        format = file_format(path or "", options["format"])
+
+        listings = Listing.objects.all()
+        if options["status"] != "all":
+            listings = listings.filter(is_open=options["status"] == "open")
+
+        progress = read_progress(path) if options["resume"] else {}
+        after_id = progress.get("last_id", 0)
+        began = time.perf_counter()
+        exported = 0
+        try:
+            if not path:
+                file = sys.stdout
+            elif after_id:
+                # Rows written after the last progress update are cut off and exported again. The CSV header was
+                # written by the first run.
+                file = open(path, "r+", newline="", encoding="utf-8")
+                file.seek(progress["offset"])
+                file.truncate()
+            else:
+                file = open(path, "w", newline="", encoding="utf-8")
+        except OSError as error:
+            raise CommandError(f"Cannot write {path}: {error}")
+        try:
+            writer = RowWriter(file, format, header=not after_id)
+            for listing_id, row in export_rows(listings, after_id, options["chunk_size"]):
+                writer.write(row)
+                exported += 1
+                if path and exported % options["chunk_size"] == 0:
+                    # Everything up to this row must be on disk before the progress file says so.
+                    file.flush()
+                    write_progress(path, {"last_id": listing_id, "offset": file.tell()})
+        finally:
+            if path:
+                file.close()
+        if path:
+            clear_progress(path)
+        elapsed = time.perf_counter() - began
+
+        rate = exported / elapsed if elapsed else 0
+        # The report goes to stderr when the rows go to stdout.
+        (self.stdout if path else self.stderr).write(self.style.SUCCESS(
+            f"Exported {exported} listings in {elapsed:.1f}s, {rate:.0f} rows/s."
+        ))
@@ -0,0 +1,72 @@
+# Import listings from a CSV or JSON Lines file (see auctions/catalog.py for the columns and how images are found).
+# The file is read and written in batches, so any size of catalog imports in constant memory.
+# The number of rows done is written to <file>.progress as each batch commits. If an import is interrupted, run it
+# again with --resume to carry on after the last committed batch.
+# Image variants are not made here: run process_images afterwards.
+
+# Usage:
+# python manage.py import_listings catalog.csv --seller alice
+# python manage.py import_listings catalog.jsonl --seller alice --batch-size 2000 --image-workers 16
+# python manage.py import_listings catalog.csv --seller alice --resume
+
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.catalog import (
+    IMAGE_WORKERS, IMPORT_BATCH_SIZE, Importer, clear_progress, file_format, read_rows, resume_position
+)
+
+
+class Command(BaseCommand):
+    help = "Import listings from a CSV or JSON Lines file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON Lines (.jsonl) file to import.")
+        parser.add_argument("--seller", required=True, help="Username of the user the listings are created for.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from the file extension).")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Number of listings created per transaction.")
+        parser.add_argument("--image-workers", type=int, default=IMAGE_WORKERS, help="Number of images fetched and stored at the same time.")
+        parser.add_argument("--resume", action="store_true", help="Skip the rows committed by an interrupted import of the same file.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            seller = get_user_model().objects.get(username=options["seller"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user called '{options['seller']}'.")
+
+        start = resume_position(path, seller) if options["resume"] else 0
+        if start:
+            self.stdout.write(f"Resuming after row {start}.")
+
+        importer = Importer(
+            seller,
+            base_dir=os.path.dirname(os.path.abspath(path)),
+            batch_size=options["batch_size"],
+            image_workers=options["image_workers"],
+            progress_path=path
+        )
+        began = time.perf_counter()
+        try:
+            # newline="" lets the csv module handle line breaks inside quoted fields.
+            with open(path, newline="", encoding="utf-8") as file:
+                importer.run(read_rows(file, file_format(path, options["format"])), start=start)
+        except OSError as error:
+            raise CommandError(f"Cannot read {path}: {error}")
+        except ValueError as error:
+            # A line of a JSON Lines file that is not JSON. The rows before it are committed - fix it and --resume.
+            raise CommandError(f"Cannot parse {path}: {error}")
+        elapsed = time.perf_counter() - began
+        clear_progress(path)
+
+        for error in importer.errors[:20]:
+            self.stderr.write(error)
+        if len(importer.errors) > 20:
+            self.stderr.write(f"... and {len(importer.errors) - 20} more rows skipped.")
+        rate = importer.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.imported} listings ({importer.skipped} rows skipped) in {elapsed:.1f}s, {rate:.0f} rows/s."
+        ))
@@ -0,0 +1,43 @@
+# Make the thumbnail and WebP variants for listing images (see auctions/images.py).
+# New listings are processed automatically. Use this command for listings created before image processing existed,
+# listings whose processing failed, or after changing images.VARIANTS.
+
+# Usage:
+# python manage.py process_images            # listings without variants
+# python manage.py process_images --all      # every listing, remaking existing variants
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from auctions.images import process_in_background
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Make resized WebP/JPEG variants of listing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Reprocess listings that already have variants.")
+        parser.add_argument("--workers", type=int, default=4, help="Number of images processed at the same time.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of listing ids read per query.")
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.exclude(image="").order_by("pk")
+        if not options["all"]:
+            listings = listings.filter(image_variants={})
+
+        processed = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                listing_ids = list(listings.filter(pk__gt=last_id).values_list("pk", flat=True)[:options["batch_size"]])
+                if not listing_ids:
+                    break
+                # Errors are logged by process_in_background and the listing is left unprocessed.
+                list(pool.map(partial(process_in_background, force=options["all"]), listing_ids))
+                processed += len(listing_ids)
+                last_id = listing_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} listing images."))
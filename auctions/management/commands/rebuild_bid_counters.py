@@ -0,0 +1,85 @@
+# Rebuild (or check) the bid counters stored on Listing from the Bid table.
+# bid_count and leading_bid come from the listing's bids. bid (the current price) and last_bid_at come from the leading
+# bid: place_bid() writes its amount and time to the listing. A listing with no bids keeps its bid, which is then the
+# starting price and is not stored anywhere else.
+# https://docs.djangoproject.com/en/5.0/howto/custom-management-commands/
+
+# Usage:
+# python manage.py rebuild_bid_counters              # fix every listing whose bid_count / leading_bid / bid / last_bid_at is wrong
+# python manage.py rebuild_bid_counters --verify     # only report mismatches, exit with an error if there are any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from auctions.models import Listing, Bid
+
+
+class Command(BaseCommand):
+    help = "Rebuild Listing.bid_count, leading_bid, bid and last_bid_at from the Bid table in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of listings read and written per transaction.")
+        parser.add_argument("--verify", action="store_true", help="Report mismatches without writing them.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        verify = options["verify"]
+
+        # Correlated subqueries computed by the database for each listing in the batch.
+        listing_bids = Bid.objects.filter(listing=OuterRef("pk"))
+        bid_count = listing_bids.order_by().values("listing").annotate(count=Count("pk")).values("count")
+        leading_bids = listing_bids.order_by("-bid", "-id")
+        leading_bid = leading_bids.values("pk")[:1]
+        leading_amount = leading_bids.values("bid")[:1]
+        leading_time = leading_bids.values("created_at")[:1]
+
+        checked = 0
+        mismatched = 0
+        last_id = 0
+
+        # Walk the table by primary key so each batch is an index range scan.
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Listing.objects.filter(pk__gt=last_id).order_by("pk")
+                    .only("id", "bid", "bid_count", "leading_bid", "last_bid_at")
+                    .annotate(
+                        real_bid_count=Coalesce(Subquery(bid_count), 0),
+                        real_leading_bid=Subquery(leading_bid),
+                        real_bid=Subquery(leading_amount),
+                        real_last_bid_at=Subquery(leading_time),
+                    )
+                    [:batch_size]
+                )
+                if not batch:
+                    break
+
+                stale = []
+                for listing in batch:
+                    real = {
+                        "bid_count": listing.real_bid_count,
+                        "leading_bid_id": listing.real_leading_bid,
+                        "last_bid_at": listing.real_last_bid_at,
+                        # Without bids the stored bid is the starting price.
+                        "bid": listing.bid if listing.real_leading_bid is None else listing.real_bid,
+                    }
+                    if any(getattr(listing, field) != value for field, value in real.items()):
+                        for field, value in real.items():
+                            setattr(listing, field, value)
+                        stale.append(listing)
+
+                if stale and not verify:
+                    Listing.objects.bulk_update(stale, ["bid", "bid_count", "leading_bid", "last_bid_at"])
+
+            checked += len(batch)
+            mismatched += len(stale)
+            last_id = batch[-1].pk
+
+        if verify:
+            if mismatched:
+                raise CommandError(f"{mismatched} of {checked} listings have stale bid counters.")
+            self.stdout.write(self.style.SUCCESS(f"All {checked} listings have correct bid counters."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Checked {checked} listings, rebuilt {mismatched}."))
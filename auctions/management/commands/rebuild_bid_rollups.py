@@ -0,0 +1,41 @@
+# Rebuild the hourly bid rollups (BidRollup) from the Bid table.
+# Needed once after migration 0024 for bids placed before rollups existed, or to repair them.
+# https://docs.djangoproject.com/en/5.0/howto/custom-management-commands/
+
+# Usage:
+# python manage.py rebuild_bid_rollups
+# python manage.py rebuild_bid_rollups --batch-size 200
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from auctions.models import Listing
+from auctions.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly bid rollups of every listing with bids, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of listings rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        listings = 0
+        rollups = 0
+        last_id = 0
+
+        # Walk the listings that have bids by primary key so each batch is an index range scan.
+        while True:
+            batch = list(
+                Listing.objects.filter(pk__gt=last_id, bid_count__gt=0).order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                rollups += rebuild_rollups(batch)
+            listings += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rollups} rollups for {listings} listings."))
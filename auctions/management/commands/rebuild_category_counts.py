@@ -0,0 +1,50 @@
+# Rebuild (or check) Category.open_listings from the Listing table.
+# The counts are kept up to date as listings are created, closed, moved and deleted (see categories.py). Use this
+# command after changing listings with update() or raw SQL, or to check the counts.
+# https://docs.djangoproject.com/en/5.0/howto/custom-management-commands/
+
+# Usage:
+# python manage.py rebuild_category_counts              # fix every category whose count is wrong
+# python manage.py rebuild_category_counts --verify     # only report mismatches, exit with an error if there are any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from auctions.categories import invalidate_directory
+from auctions.models import Category, Listing
+
+
+class Command(BaseCommand):
+    help = "Recount the open listings of every category."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Report mismatches without writing them.")
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+
+        with transaction.atomic():
+            # One GROUP BY over listing_open_category_idx (is_open, category).
+            real = dict(
+                Listing.objects.filter(is_open=True, category__isnull=False).order_by()
+                .values("category").annotate(count=Count("pk")).values_list("category", "count")
+            )
+            stale = []
+            for category in Category.objects.only("id", "open_listings"):
+                if category.open_listings != real.get(category.id, 0):
+                    category.open_listings = real.get(category.id, 0)
+                    category.updated_at = timezone.now()
+                    stale.append(category)
+
+            if stale and not verify:
+                Category.objects.bulk_update(stale, ["open_listings", "updated_at"])
+                transaction.on_commit(invalidate_directory)
+
+        if verify:
+            if stale:
+                raise CommandError(f"{len(stale)} categories have a wrong open listing count.")
+            self.stdout.write(self.style.SUCCESS("All categories have correct open listing counts."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(stale)} category counts."))
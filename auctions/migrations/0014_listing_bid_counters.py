@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_bid_counters(apps, schema_editor):
+    # Fill the new columns for listings that already have bids, 1000 listings at a time.
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+
+    listing_bids = Bid.objects.filter(listing=OuterRef('pk'))
+    bid_count = listing_bids.order_by().values('listing').annotate(count=Count('pk')).values('count')
+    leading_bid = listing_bids.order_by('-bid', '-id').values('pk')[:1]
+
+    last_id = 0
+    while True:
+        batch = list(
+            Listing.objects.filter(pk__gt=last_id).order_by('pk')
+            .annotate(real_bid_count=Coalesce(Subquery(bid_count), 0), real_leading_bid=Subquery(leading_bid))[:1000]
+        )
+        if not batch:
+            break
+        for listing in batch:
+            listing.bid_count = listing.real_bid_count
+            listing.leading_bid_id = listing.real_leading_bid
+        Listing.objects.bulk_update(batch, ['bid_count', 'leading_bid'])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='leading_bid',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid'),
+        ),
+        migrations.RunPython(backfill_bid_counters, migrations.RunPython.noop),
+    ]
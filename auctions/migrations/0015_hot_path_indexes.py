@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:13
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_listing_bid_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid'], name='bid_listing_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', 'id'], name='comment_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_open', '-id'], name='listing_open_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_open', 'category'], name='listing_open_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['createdBy', 'is_open'], name='listing_creator_open_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.CheckConstraint(condition=models.Q(('bid__gte', Decimal('0.01'))), name='bid_bid_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='listing',
+            constraint=models.CheckConstraint(condition=models.Q(('bid__gte', Decimal('0.01'))), name='listing_bid_positive'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_open_listings(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Category = apps.get_model('auctions', 'Category')
+
+    counts = (
+        Listing.objects.filter(is_open=True).exclude(category='')
+        .values('category').annotate(open_listings=Count('pk')).order_by()
+    )
+    Category.objects.bulk_create(
+        [Category(name=row['category'], open_listings=row['open_listings']) for row in counts], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('open_listings', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_open_listings, migrations.RunPython.noop),
+    ]
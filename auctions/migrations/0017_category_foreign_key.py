@@ -0,0 +1,27 @@
+# Replace the free-text Listing.category with a foreign key to Category, step 1 of 3: add the new columns.
+# Step 2 (0017_category_foreign_key_data) fills them and step 3 (0017_category_foreign_key_finish) drops the old
+# column. Each step is its own migration - its own transaction - because PostgreSQL cannot ALTER a table that still
+# has pending (deferred foreign key) trigger events from the data step.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_category_directory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='category_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='listings', to='auctions.category'),
+        ),
+    ]
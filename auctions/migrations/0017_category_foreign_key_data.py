@@ -0,0 +1,87 @@
+# Replace the free-text Listing.category with a foreign key to Category, step 2 of 3: fill the new columns.
+# Existing category strings are folded into Category rows by slug, so different spellings of the same name end up in
+# one category. Blank names (including names that are only whitespace) become no category.
+# The listing table is read once, by primary key, 1000 rows at a time - the old text column has no index.
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Q
+from django.utils.text import slugify
+
+
+BATCH_SIZE = 1000
+
+
+def category_slug(name):
+    # Same rule as categories.category_slug(). Names with no ASCII letters or digits get a stable hash-based slug.
+    return slugify(name)[:100] or 'category-' + hashlib.md5(name.strip().lower().encode()).hexdigest()[:8]
+
+
+def fold_categories(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+
+    # Give the existing directory rows a slug, dropping rows whose name is another spelling of an earlier row.
+    by_slug = {}
+    for category in Category.objects.order_by('pk'):
+        if not category.name.strip():
+            category.delete()
+            continue
+        slug = category_slug(category.name)
+        if slug in by_slug:
+            category.delete()
+        else:
+            category.slug = slug
+            category.save(update_fields=['slug'])
+            by_slug[slug] = category
+
+    # Category id for every distinct name, looked up once.
+    category_ids = {}
+    last_id = 0
+    while True:
+        rows = list(Listing.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'category')[:BATCH_SIZE])
+        if not rows:
+            break
+        listings_by_category = defaultdict(list)
+        for listing_id, name in rows:
+            name = (name or '').strip()
+            if not name:
+                continue
+            if name not in category_ids:
+                slug = category_slug(name)
+                if slug not in by_slug:
+                    by_slug[slug] = Category.objects.create(name=name[:100], slug=slug)
+                category_ids[name] = by_slug[slug].pk
+            listings_by_category[category_ids[name]].append(listing_id)
+        for category_id, listing_ids in listings_by_category.items():
+            Listing.objects.filter(pk__in=listing_ids).update(category_ref_id=category_id)
+        last_id = rows[-1][0]
+
+    # Recount open listings now that spellings have been merged.
+    counted = Category.objects.annotate(count=Count('listings', filter=Q(listings__is_open=True)))
+    categories = []
+    for category in counted:
+        category.open_listings = category.count
+        categories.append(category)
+    Category.objects.bulk_update(categories, ['open_listings'], batch_size=BATCH_SIZE)
+
+
+def unfold_categories(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+
+    for category in Category.objects.all():
+        Listing.objects.filter(category_ref=category).update(category=category.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_category_foreign_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_categories, unfold_categories),
+    ]
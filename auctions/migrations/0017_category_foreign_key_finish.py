@@ -0,0 +1,36 @@
+# Replace the free-text Listing.category with a foreign key to Category, step 3 of 3: drop the old column and give
+# the foreign key its name.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_category_foreign_key_data'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_open_category_idx',
+        ),
+        migrations.RemoveField(
+            model_name='listing',
+            name='category',
+        ),
+        migrations.RenameField(
+            model_name='listing',
+            old_name='category_ref',
+            new_name='category',
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_open', 'category'], name='listing_open_category_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Create and fill the full-text search index for the database in use (see auctions/search.py).
+# The SQL is written out here rather than taken from the search backends, so the migration keeps doing what it did
+# when it was written even if auctions/search.py changes later. Other databases search with LIKE and need no index.
+# A project with its own AUCTIONS_SEARCH_BACKEND creates that backend's index itself (create_index() and rebuild()).
+
+from django.db import migrations
+
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts "
+        "USING fts5(title, description, category, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO auctions_listing_fts (rowid, title, description, category) "
+        "SELECT l.id, l.title, l.description, COALESCE(c.name, '') FROM auctions_listing l "
+        "LEFT JOIN auctions_category c ON c.id = l.category_id",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS auctions_listing_search ("
+        "listing_id bigint PRIMARY KEY REFERENCES auctions_listing (id) ON DELETE CASCADE, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS auctions_listing_search_document_idx ON auctions_listing_search USING GIN (document)",
+        "INSERT INTO auctions_listing_search (listing_id, document) "
+        "SELECT l.id, "
+        "setweight(to_tsvector('english', l.title), 'A') || "
+        "setweight(to_tsvector('english', COALESCE(c.name, '')), 'B') || "
+        "setweight(to_tsvector('english', l.description), 'C') "
+        "FROM auctions_listing l LEFT JOIN auctions_category c ON c.id = l.category_id "
+        "ON CONFLICT (listing_id) DO NOTHING",
+    ],
+}
+
+DROP_SQL = {
+    'sqlite': ["DROP TABLE IF EXISTS auctions_listing_fts"],
+    'postgresql': ["DROP TABLE IF EXISTS auctions_listing_search"],
+}
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_category_foreign_key_finish'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
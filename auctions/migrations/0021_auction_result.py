@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+BATCH_SIZE = 1000
+
+
+def record_closed_auctions(apps, schema_editor):
+    # Write results (and Listing.winner) for auctions closed before results were recorded.
+    # Their closing time was not stored, so closed_at is the time of this migration.
+    Listing = apps.get_model('auctions', 'Listing')
+    AuctionResult = apps.get_model('auctions', 'AuctionResult')
+    closed_at = timezone.now()
+
+    last_id = 0
+    while True:
+        rows = list(
+            Listing.objects.filter(is_open=False, pk__gt=last_id).order_by('pk')
+            .values_list('pk', 'bid', 'bid_count', 'leading_bid__placedBy_id')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        AuctionResult.objects.bulk_create([
+            AuctionResult(listing_id=listing_id, winner_id=winner_id, winning_bid=bid if winner_id else None,
+                          bid_count=bid_count, closed_at=closed_at)
+            for listing_id, bid, bid_count, winner_id in rows
+        ])
+        for listing_id, bid, bid_count, winner_id in rows:
+            if winner_id:
+                Listing.objects.filter(pk=listing_id).update(winner_id=winner_id)
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0020_listing_end_time_and_winner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuctionResult',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='result', serialize=False, to='auctions.listing')),
+                ('winning_bid', models.DecimalField(blank=True, decimal_places=2, max_digits=19, null=True)),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('closed_at', models.DateTimeField()),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='wins', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['winner', '-closed_at'], name='result_winner_closed_idx')],
+            },
+        ),
+        migrations.RunPython(record_closed_auctions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_existing_bids(apps, schema_editor):
+    # Bids placed before created_at existed were not timed. The closest known time is their listing's last_bid_at
+    # (exact for the leading bid). Bids on listings without one keep the time of this migration.
+    # The hourly rollups can then be built with: python manage.py rebuild_bid_rollups
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    last_bid_at = Listing.objects.filter(pk=OuterRef('listing_id')).values('last_bid_at')[:1]
+    Bid.objects.filter(listing__last_bid_at__isnull=False).update(created_at=Subquery(last_bid_at))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BidRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=19)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=19)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-id'], name='bid_listing_history_idx'),
+        ),
+        migrations.AddField(
+            model_name='bidrollup',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_rollups', to='auctions.listing'),
+        ),
+        migrations.AddConstraint(
+            model_name='bidrollup',
+            constraint=models.UniqueConstraint(fields=('listing', 'period_start'), name='bidrollup_listing_period_uniq'),
+        ),
+        migrations.RunPython(date_existing_bids, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,7 @@
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 # Validate numbers are within a certain range with MinValueValidator and MaxValueValidator.
 # https://stackoverflow.com/questions/44022056/validators-minvaluevalidator-does-not-work-in-django
@@ -22,6 +23,22 @@ class User(AbstractUser):
     pass # Pass = placeholder for future code. Python will do nothing when it sees the 'pass' statement.
 
 
+# Listing category
+# Listings point to a Category row so category pages are an indexed foreign key lookup.
+# Category names are matched by slug, so "Home Decor", "home decor" and "Home  Decor " are the same category.
+# open_listings is the number of open listings in the category, so the Categories page never scans Listing.
+# It is kept up to date by categories.py when a listing is created or closed.
+class Category(models.Model):
+    name = models.CharField(max_length=100, unique=True) # Display name - the first spelling used for the category.
+    # https://docs.djangoproject.com/en/5.0/ref/models/fields/#slugfield
+    slug = models.SlugField(max_length=100, unique=True)
+    open_listings = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
 # Auction Listing
 class Listing(models.Model):
     # https://docs.djangoproject.com/en/5.0/ref/databases/#character-fields (max_length restricted to 255 characters if you are using unique=True for the field)
@@ -30,7 +47,8 @@ class Listing(models.Model):
     # https://docs.djangoproject.com/en/5.0/ref/models/fields/#textfield
     description = models.TextField()
     
-    category = models.CharField(max_length=100, blank=True) # blank=True - field may be empty.)
+    # blank=True / null=True - a listing may have no category. If a category is deleted its listings keep no category.
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="listings")
 
     # https://docs.djangoproject.com/en/5.0/ref/models/fields/#imagefield
     # https://docs.djangoproject.com/en/5.0/ref/forms/fields/#imagefield
@@ -40,6 +58,13 @@ class Listing(models.Model):
     # image = models.ImageField(upload_to=None, height_field=None, width_field=None, max_length=100)
     image = models.ImageField(upload_to="images/") #, null=True, blank=True) # blank=True - field may be empty. # Image files are uploaded to the media/images directory through the admin account. However, image files are not uploaded (to this directory) from the user.
 
+    # Resized copies of the image made by images.py, e.g. {"thumb": {"webp": "images/variants/<sha256>/thumb.webp", "jpeg": ...}}.
+    # Variants are stored per image under the stem of its content-addressed name (images/sha256/../<sha256>.jpg), so
+    # listings sharing an image share its variants. Older images are keyed on their whole path
+    # (images/variants/files/images/photo.jpg/thumb.webp). Empty until the image has been processed - templates show the
+    # original image until then.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
     # https://cs50.harvard.edu/web/2020/projects/2/commerce/#specification
     # CS50 specifications indicate that "users should also optionally be able to provide a URL for an image for the listing.
 
@@ -66,6 +91,44 @@ class Listing(models.Model):
     # "Many-to-one relations are defined using ForeignKey field of django.db.models." A user can have multiple listings but a listing can't have multipls users.
     createdBy = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user") # If a user is deleted, all listings posted by that user are deleted as well. 
 
+    # Auction state copied from the Bid table so pages can read it without counting or sorting bids.
+    # These columns are written in the same transaction that inserts a Bid (see bidding.py) and can be rebuilt with:
+    # python manage.py rebuild_bid_counters
+    # editable=False keeps them out of CreateListingForm and the admin forms.
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+    # The highest bid. Bid is defined below so the model is referenced by name. related_name="+" - no reverse relation.
+    leading_bid = models.ForeignKey("Bid", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+")
+    last_bid_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # When the auction closes by itself. Listings without an end time stay open until the creator closes them.
+    # Due auctions are closed by: python manage.py close_auctions (see closing.py).
+    ends_at = models.DateTimeField(null=True, blank=True)
+    # The user with the highest bid when the auction closed. Empty while open and for auctions that closed without bids.
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="won_listings")
+
+    # When the listing last changed: saved, bid on, closed or given image variants. Sent as the listing page's Last-Modified.
+    # auto_now only applies to save(), so the update() calls in bidding.py, closing.py and images.py set it themselves.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # https://docs.djangoproject.com/en/5.0/ref/models/options/#indexes
+    # https://docs.djangoproject.com/en/5.0/ref/models/options/#constraints
+    class Meta:
+        indexes = [
+            # Active Listings feed: WHERE is_open ORDER BY id DESC.
+            models.Index(fields=["is_open", "-id"], name="listing_open_feed_idx"),
+            # Category pages and the category list: WHERE is_open AND category = ...
+            models.Index(fields=["is_open", "category"], name="listing_open_category_idx"),
+            # A user's own listings: WHERE createdBy = ... AND is_open.
+            models.Index(fields=["createdBy", "is_open"], name="listing_creator_open_idx"),
+            # Auctions due to close: WHERE is_open AND ends_at <= now ORDER BY ends_at. Only open listings are indexed,
+            # so the index stays as small as the number of running auctions.
+            models.Index(fields=["ends_at"], condition=models.Q(is_open=True), name="listing_due_idx"),
+        ]
+        constraints = [
+            # Same rule as MinValueValidator, enforced by the database for rows that skip form validation.
+            models.CheckConstraint(condition=models.Q(bid__gte=Decimal("0.01")), name="listing_bid_positive"),
+        ]
+
     # Instructions to convert Listing object into a string.
     # https://cs50.harvard.edu/web/2020/notes/4/#shell
     def __str__(self):
@@ -92,6 +155,19 @@ class Bid(models.Model):
     # A user can have multiple bids but a bid can't have multiple users. If a user is deleted, all bids posted by that user are deleted as well. 
     placedBy = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_bids") # If a user is deleted, all bids posted by that user are deleted as well. 
 
+    # When the bid was placed. place_bid() passes the same time it writes to Listing.last_bid_at.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Highest bid on a listing: WHERE listing = ... ORDER BY bid DESC.
+            models.Index(fields=["listing", "-bid"], name="bid_listing_amount_idx"),
+            # Bid history, one page at a time: WHERE listing = ... AND id < cursor ORDER BY id DESC.
+            models.Index(fields=["listing", "-id"], name="bid_listing_history_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(bid__gte=Decimal("0.01")), name="bid_bid_positive"),
+        ]
     
     def __str__(self):
         return f"{self.id} / {self.listing} / {self.bid}"
@@ -102,5 +178,111 @@ class Comment(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="listing_comment")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_comment")
 
+    class Meta:
+        indexes = [
+            # Comments on a listing in the order they were made: WHERE listing = ... ORDER BY id.
+            models.Index(fields=["listing", "id"], name="comment_listing_idx"),
+        ]
+    def __str__(self):
+        return f"{self.author} / {self.listing}"
+
+
+# Bids on a listing summed up per hour: how many were placed and the highest and lowest amount.
+# Rows are updated as bids are placed (see rollups.py), so price charts and bidding velocity are read from a few rows
+# per day instead of every bid. python manage.py rebuild_bid_rollups recomputes them from the Bid table.
+class BidRollup(models.Model):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bid_rollups")
+    # Start of the hour (UTC) the row covers.
+    period_start = models.DateTimeField()
+    bid_count = models.PositiveIntegerField(default=0)
+    high = models.DecimalField(max_digits=19, decimal_places=2)
+    low = models.DecimalField(max_digits=19, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # One row per listing per hour. Also the index for WHERE listing = ... AND period_start >= ...
+            models.UniqueConstraint(fields=["listing", "period_start"], name="bidrollup_listing_period_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} / {self.period_start} / {self.bid_count}"
+
+
+# The outcome of a closed auction, written in the same transaction that closes it (see closing.py).
+# The winning bid and bid count are copied here, so pages about past auctions ("My Wins") never read the Bid table.
+# Results are a record of what happened: they are created once and never changed.
+class AuctionResult(models.Model):
+    # One result per listing. The listing id is the primary key.
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name="result")
+    # Empty if the auction closed without bids (or the winner's account was deleted).
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="wins")
+    winning_bid = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    closed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # My Wins page: WHERE winner = ... ORDER BY closed_at DESC.
+            models.Index(fields=["winner", "-closed_at"], name="result_winner_closed_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Auction results cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.listing_id} / {self.winner_id} / {self.winning_bid}"
+
+
+# Transactional outbox for notifications.
+# Bids and closes add an event here in the same transaction as the change itself, so an event exists exactly when the
+# change was committed. The dispatch_notifications worker turns events into Notification rows and deletes them.
+# See notifications.py.
+class OutboxEvent(models.Model):
+    BID = "bid"
+    CLOSE = "close"
+    KINDS = [(BID, "Bid"), (CLOSE, "Close")]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="+")
+    # e.g. {"bid_id": 12, "amount": "5.00", "bidder_id": 3} or {"winner_id": 3}
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} / {self.listing_id}"
+
+
+# In-app notification shown on the Notifications page.
+# A user has at most one unread notification per listing: later events update it (message and count) instead of
+# adding rows, so a bidding war on a watched listing is one notification, not hundreds.
+class Notification(models.Model):
+    OUTBID = "outbid"
+    BID = "bid"
+    CLOSED = "closed"
+    WON = "won"
+    KINDS = [(OUTBID, "Outbid"), (BID, "New bid"), (CLOSED, "Closed"), (WON, "Won")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=10, choices=KINDS)
+    message = models.CharField(max_length=255)
+    # Number of events folded into this notification.
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Notifications page: WHERE user = ... ORDER BY updated_at DESC.
+            models.Index(fields=["user", "-updated_at"], name="notification_user_idx"),
+        ]
+        constraints = [
+            # One unread notification per user and listing. Also the index used to find it when coalescing.
+            models.UniqueConstraint(fields=["listing", "user"], condition=models.Q(read_at__isnull=True), name="notification_one_unread"),
+        ]
+
     def __str__(self):
-        return f"{self.author} / {self.listing}"
\ No newline at end of file
+        return f"{self.user_id} / {self.kind} / {self.listing_id}"
@@ -0,0 +1,167 @@
+# Notifications for watchers and bidders.
+# Bids and closes write an OutboxEvent in their own transaction (record_bid(), record_closes()). That is one INSERT,
+# however many users watch the listing, so a bid request never waits for the fan-out.
+# The dispatch_notifications worker later claims pending events in batches and turns them into Notification rows:
+# - the previous high bidder (and anyone else outbid in the batch) is told they were outbid,
+# - when an auction closes the winner is told they won,
+# - every other watcher gets one "new bid" or "closed" notification.
+# Events for the same listing in one batch are folded together, and a user has at most one unread notification per
+# listing - later events update it and increase its count. A bidding war is one notification per user, not hundreds.
+# A later event only replaces the text of an unread notification if it is as important (see PRIORITY): a "new bid"
+# watcher notice never hides that the user was outbid or won.
+# Watchers are read and written in chunks of WATCHER_CHUNK, so a listing with 100k watchers is 50 small batches.
+# https://microservices.io/patterns/data/transactional-outbox.html
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Bid, Listing, Notification, OutboxEvent
+
+
+# Outbox events handled per transaction.
+DISPATCH_BATCH_SIZE = 200
+
+# Watchers notified per query.
+WATCHER_CHUNK = 2000
+
+Watch = Listing.watchlist.through
+
+# Notification kinds, least important first. Notices about the user's own bids outrank notices to every watcher.
+PRIORITY = [Notification.BID, Notification.CLOSED, Notification.OUTBID, Notification.WON]
+
+
+def record_bid(bid):
+    # Called by bidding.place_bid() inside its transaction.
+    OutboxEvent.objects.create(
+        kind=OutboxEvent.BID,
+        listing_id=bid.listing_id,
+        payload={"bid_id": bid.id, "amount": f"{bid.bid:.2f}", "bidder_id": bid.placedBy_id}
+    )
+
+
+def record_closes(results):
+    # Called by closing.close_listings() inside its transaction with the AuctionResults it wrote.
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(
+            kind=OutboxEvent.CLOSE,
+            listing_id=result.listing_id,
+            payload={"winner_id": result.winner_id, "amount": str(result.winning_bid) if result.winning_bid is not None else None}
+        )
+        for result in results
+    ])
+
+
+def notify(listing_id, user_ids, kind, message, events):
+    """
+    Give each user a notification about the listing: their unread one is updated, or a new one is created.
+    An unread notification of a more important kind keeps its kind and message and only has its count increased.
+    events is the number of outbox events this notification stands for.
+    """
+    if not user_ids:
+        return
+    now = timezone.now()
+    unread = Notification.objects.filter(listing_id=listing_id, read_at__isnull=True, user_id__in=user_ids)
+    existing = set(unread.values_list("user_id", flat=True))
+    if existing:
+        replaceable = PRIORITY[:PRIORITY.index(kind) + 1]
+        unread.filter(kind__in=replaceable).update(kind=kind, message=message, count=F("count") + events, updated_at=now)
+        unread.exclude(kind__in=replaceable).update(count=F("count") + events, updated_at=now)
+    # ignore_conflicts: another dispatcher may have just created one. Its notification is kept.
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, listing_id=listing_id, kind=kind, message=message, count=events, updated_at=now)
+        for user_id in user_ids if user_id not in existing
+    ], ignore_conflicts=True)
+
+
+def notify_watchers(listing_id, skip, kind, message, events):
+    # Notify everyone watching the listing except the users in skip, WATCHER_CHUNK users at a time.
+    last_user_id = 0
+    while True:
+        # Keyset pagination over the (listing_id, user_id) unique index of the watchlist table.
+        chunk = list(
+            Watch.objects.filter(listing_id=listing_id, user_id__gt=last_user_id)
+            .order_by("user_id").values_list("user_id", flat=True)[:WATCHER_CHUNK]
+        )
+        if not chunk:
+            return
+        notify(listing_id, [user_id for user_id in chunk if user_id not in skip], kind, message, events)
+        last_user_id = chunk[-1]
+
+
+def deliver(listing_id, title, events):
+    # Turn the pending events of one listing (oldest first) into notifications.
+    bids = [event for event in events if event.kind == OutboxEvent.BID]
+    close = next((event for event in events if event.kind == OutboxEvent.CLOSE), None)
+
+    # user id -> (kind, message) for notifications addressed to one user.
+    personal = {}
+    watcher_note = None
+
+    if bids:
+        latest = bids[-1].payload
+        leader = latest["bidder_id"]
+        # Accepted bids are in price order, so the bid before the first one in this batch was the high bid until then.
+        previous_leader = Bid.objects.filter(
+            listing_id=listing_id, id__lt=bids[0].payload["bid_id"]
+        ).order_by("-bid").values_list("placedBy_id", flat=True).first()
+
+        outbid = {event.payload["bidder_id"] for event in bids} | {previous_leader}
+        for user_id in outbid - {leader, None}:
+            personal[user_id] = (Notification.OUTBID, f"You have been outbid on {title}. The current bid is {latest['amount']}.")
+        # The new high bidder does not need to hear about their own bid.
+        personal.setdefault(leader, None)
+        watcher_note = (Notification.BID, f"New bid on {title}: {latest['amount']}.")
+
+    if close is not None:
+        winner = close.payload.get("winner_id")
+        if winner:
+            personal[winner] = (Notification.WON, f"You won {title} for {close.payload['amount']}!")
+        watcher_note = (Notification.CLOSED, f"The auction for {title} has closed.")
+
+    notes = defaultdict(list)
+    for user_id, note in personal.items():
+        if note is not None:
+            notes[note].append(user_id)
+    for (kind, message), user_ids in notes.items():
+        notify(listing_id, user_ids, kind, message, len(events))
+
+    if watcher_note is not None:
+        notify_watchers(listing_id, set(personal), *watcher_note, len(events))
+
+
+def dispatch_pending(batch_size=DISPATCH_BATCH_SIZE):
+    """
+    Deliver one batch of pending outbox events and delete them, in one transaction.
+    Several dispatchers can run at once: each claims different events (SKIP LOCKED).
+    Returns the number of events handled.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=skip_locked).order_by("id")[:batch_size])
+        if not events:
+            return 0
+
+        by_listing = defaultdict(list)
+        for event in events:
+            by_listing[event.listing_id].append(event)
+        titles = dict(Listing.objects.filter(pk__in=by_listing).values_list("id", "title"))
+
+        for listing_id, listing_events in by_listing.items():
+            deliver(listing_id, titles.get(listing_id, ""), listing_events)
+
+        OutboxEvent.objects.filter(pk__in=[event.id for event in events]).delete()
+
+    return len(events)
+
+
+def dispatch_all(batch_size=DISPATCH_BATCH_SIZE):
+    # Deliver every pending event. Returns the number of events handled.
+    total = 0
+    while True:
+        handled = dispatch_pending(batch_size)
+        total += handled
+        if handled < batch_size:
+            return total
@@ -0,0 +1,213 @@
+# Per-request profiler: SQL count and time, template render time and total time for every request to an auctions view.
+#
+# Enable it by adding the middleware to settings.py (after the session and auth middleware):
+#   MIDDLEWARE = [..., "auctions.profiling.ProfilerMiddleware"]
+# Settings (all optional):
+#   AUCTIONS_PROFILER = True                   set False to switch the middleware off without removing it
+#   AUCTIONS_PROFILER_BUFFER = 2000            requests kept in memory (oldest are dropped)
+#   AUCTIONS_PROFILER_N_PLUS_ONE = 5           the same SQL run this many times in one request is flagged as N+1
+#   AUCTIONS_PROFILER_DUMP_PATH = None         file the report is written to every AUCTIONS_PROFILER_DUMP_INTERVAL seconds
+#   AUCTIONS_PROFILER_DUMP_INTERVAL = 60
+# The report (percentiles per URL name, slowest routes first, and the N+1 queries seen) is at /profiler for staff users.
+#
+# The cost per request is a few microseconds: queries are counted by a database execute wrapper that reads the clock
+# and bumps a dict entry, and the sample is appended to a deque. Percentiles are only computed when the report is read.
+# Django already sends SQL with %s placeholders and the values apart, so the SQL text is the query's shape: an N+1 loop
+# runs the same text over and over with different parameters.
+# https://docs.djangoproject.com/en/5.0/topics/db/instrumentation/
+
+# Only sync views are measured completely. Queries that async views run through the async ORM happen in other threads
+# and are not seen by the execute wrapper.
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.template.backends.django import Template
+
+from .logs import get_logger, log_event
+
+
+logger = get_logger(__name__)
+
+# The request being profiled by this thread, read by the template timer.
+current = threading.local()
+
+
+class RequestProfile:
+    __slots__ = ("sql_count", "sql_time", "template_time", "shapes")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper: time the query and count its shape.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+            self.shapes[sql] += 1
+
+
+class Sample:
+    # One profiled request. Times are in milliseconds.
+    __slots__ = ("route", "total", "sql_count", "sql_time", "template_time", "repeated", "at")
+
+    def __init__(self, route, total, profile, repeated):
+        self.route = route
+        self.total = total * 1000
+        self.sql_count = profile.sql_count
+        self.sql_time = profile.sql_time * 1000
+        self.template_time = profile.template_time * 1000
+        # [(sql, times)] for the queries run at least AUCTIONS_PROFILER_N_PLUS_ONE times.
+        self.repeated = repeated
+        self.at = time.time()
+
+
+samples = deque(maxlen=getattr(settings, "AUCTIONS_PROFILER_BUFFER", 2000))
+
+
+def timed_render(render):
+    # Wrap the Django template backend's render() to add its time to the current request's profile.
+    # Only top-level templates go through it - {% include %} and {% extends %} render inside, so nothing is counted twice.
+    def wrapper(self, context=None, request=None):
+        profile = getattr(current, "profile", None)
+        if profile is None:
+            return render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+    wrapper.profiled = True
+    return wrapper
+
+
+def percentile(values, share):
+    # Nearest-rank percentile of a sorted list.
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def report():
+    """
+    Per URL name: request count, total time percentiles (p50/p95/p99, ms), average SQL count and time, average template
+    time and the N+1 queries seen, slowest p95 first.
+    """
+    by_route = {}
+    for sample in list(samples):
+        by_route.setdefault(sample.route, []).append(sample)
+
+    routes = []
+    for route, route_samples in by_route.items():
+        totals = sorted(sample.total for sample in route_samples)
+        count = len(route_samples)
+        repeated = Counter()
+        for sample in route_samples:
+            for sql, times in sample.repeated:
+                repeated[sql] = max(repeated[sql], times)
+        routes.append({
+            "route": route,
+            "requests": count,
+            "p50_ms": round(percentile(totals, 0.50), 2),
+            "p95_ms": round(percentile(totals, 0.95), 2),
+            "p99_ms": round(percentile(totals, 0.99), 2),
+            "max_ms": round(totals[-1], 2),
+            "avg_sql_count": round(sum(sample.sql_count for sample in route_samples) / count, 1),
+            "avg_sql_ms": round(sum(sample.sql_time for sample in route_samples) / count, 2),
+            "avg_template_ms": round(sum(sample.template_time for sample in route_samples) / count, 2),
+            "n_plus_one": [{"sql": sql, "max_per_request": times} for sql, times in repeated.most_common()],
+        })
+
+    routes.sort(key=lambda route: route["p95_ms"], reverse=True)
+    return {"generated_at": time.time(), "requests": sum(route["requests"] for route in routes), "routes": routes}
+
+
+def dump_report(path):
+    with open(path, "w") as file:
+        json.dump(report(), file, indent=2)
+
+
+dump_thread = None
+
+
+def dump_periodically(path, interval):
+    # Daemon thread: write the report to path every interval seconds, off the request path. One per process.
+    global dump_thread
+    if dump_thread is not None:
+        return dump_thread
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                dump_report(path)
+            except OSError:
+                log_event(logger, "profiler.dump_failed", logging.ERROR, path=path)
+    dump_thread = threading.Thread(target=run, name="auctions-profiler-dump", daemon=True)
+    dump_thread.start()
+    return dump_thread
+
+
+class ProfilerMiddleware:
+    # Sync only, so the execute wrapper and the template timer run in the thread that runs the view.
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not getattr(settings, "AUCTIONS_PROFILER", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.n_plus_one = getattr(settings, "AUCTIONS_PROFILER_N_PLUS_ONE", 5)
+        # The database aliases from settings.DATABASES (connections.all() rebuilds this list on every call).
+        self.aliases = list(connections)
+
+        if not getattr(Template.render, "profiled", False):
+            Template.render = timed_render(Template.render)
+
+        path = getattr(settings, "AUCTIONS_PROFILER_DUMP_PATH", None)
+        if path:
+            dump_periodically(path, getattr(settings, "AUCTIONS_PROFILER_DUMP_INTERVAL", 60))
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        current.profile = profile
+        # The list connection.execute_wrapper() manages, changed directly: the context manager costs more than the rest
+        # of the middleware together.
+        wrapped = [connections[alias].execute_wrappers for alias in self.aliases]
+        for wrappers in wrapped:
+            wrappers.append(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            for wrappers in wrapped:
+                wrappers.remove(profile)
+            current.profile = None
+
+        # Only the views of this app are recorded (not the admin, static files or the report itself).
+        match = request.resolver_match
+        if match is not None and match.func.__module__.startswith("auctions.") and match.url_name != "profiler_report":
+            repeated = [(sql, times) for sql, times in profile.shapes.items() if times >= self.n_plus_one]
+            samples.append(Sample(match.url_name or match.view_name, total, profile, repeated))
+            if repeated:
+                log_event(logger, "profiler.n_plus_one", logging.WARNING, route=match.url_name, queries=repeated)
+        return response
+
+
+@staff_member_required
+def profiler_report(request):
+    # Staff only (redirects to the admin login otherwise).
+    return JsonResponse(report())
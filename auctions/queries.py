@@ -0,0 +1,120 @@
+# Read-side data loaders used by the views.
+# Each loader returns everything a page needs from a fixed number of SQL queries so the cost of a page
+# does not grow with the number of rows it shows.
+# https://docs.djangoproject.com/en/5.0/topics/db/optimization/
+
+import asyncio
+
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from .models import Listing, Comment
+from .watchlists import ais_watching, awatcher_count, is_watching, watcher_count
+
+
+# Number of listings shown on one page of the Active Listings feed.
+FEED_PAGE_SIZE = 25
+
+# Largest primary key the id columns hold (bigint). Larger numbers are rejected before they reach a query, where the
+# database driver would fail on them.
+MAX_ID = 2**63 - 1
+
+
+def parse_cursor(value):
+    """
+    Convert the ?cursor= query string value into a listing id.
+    Anything that is not a positive integer an id column can hold is treated as "first page".
+    """
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if 0 < cursor <= MAX_ID else None
+
+
+def feed_queryset(cursor=None):
+    # https://docs.djangoproject.com/en/5.0/ref/models/querysets/#select-related
+    all_listings = Listing.objects.filter(is_open=True).select_related("createdBy", "category").order_by("-id")
+
+    if cursor is not None:
+        all_listings = all_listings.filter(id__lt=cursor)
+
+    return all_listings
+
+
+def split_page(listings, page_size):
+    # listings holds up to page_size + 1 rows. The extra row only tells us there is another page.
+    next_cursor = None
+    if len(listings) > page_size:
+        listings = listings[:page_size]
+        next_cursor = listings[-1].id
+
+    return listings, next_cursor
+
+
+def active_listings_page(cursor=None, page_size=FEED_PAGE_SIZE):
+    """
+    Active Listings feed with keyset (cursor) pagination.
+    Listings are ordered newest first by id. The cursor is the id of the last listing on the previous page,
+    so the next page is simply "id < cursor" - no OFFSET scan, and new listings never shift the pages.
+    The creator and category are loaded with a join (select_related) so the template does not run one query per listing.
+    Returns (listings, next_cursor). next_cursor is None on the last page.
+    """
+    # Fetch one extra row to find out if there is another page without running a COUNT query.
+    listings = list(feed_queryset(cursor)[:page_size + 1])
+
+    return split_page(listings, page_size)
+
+
+async def aactive_listings_page(cursor=None, page_size=FEED_PAGE_SIZE):
+    # Async version of active_listings_page() for the ASGI views.
+    # https://docs.djangoproject.com/en/5.0/topics/async/#queries-the-orm
+    listings = [listing async for listing in feed_queryset(cursor)[:page_size + 1]]
+
+    return split_page(listings, page_size)
+
+
+def listing_detail_queryset():
+    return Listing.objects.select_related("createdBy", "category", "leading_bid")
+
+
+def comments_queryset(listing_id):
+    return Comment.objects.filter(listing_id=listing_id).select_related("author").order_by("id")
+
+
+def listing_detail(listing_id, user):
+    """
+    Everything the listing page needs in two queries:
+    1. The listing, joined with its creator, category and leading bid. The bid count is stored on the listing itself.
+    2. The comments, joined with their authors.
+    listing.user_is_watching and listing.watchers are set from the cached watchlists (watchlists.py) - no watcher rows are loaded.
+    Returns (listing, comments). Raises Http404 if the listing does not exist.
+    """
+    listing = get_object_or_404(listing_detail_queryset(), pk=listing_id)
+    listing.user_is_watching = is_watching(user, listing.id)
+    listing.watchers = watcher_count(listing.id)
+
+    comments = list(comments_queryset(listing_id))
+
+    return listing, comments
+
+
+async def alisting_detail(listing_id, user):
+    """
+    Async version of listing_detail(). The two queries do not depend on each other, so they are started together
+    and the page waits for whichever finishes last instead of for both one after the other.
+    """
+    async def load_listing():
+        try:
+            listing = await listing_detail_queryset().aget(pk=listing_id)
+        except Listing.DoesNotExist:
+            raise Http404("No Listing matches the given query.")
+        listing.user_is_watching = await ais_watching(user, listing.id)
+        listing.watchers = await awatcher_count(listing.id)
+        return listing
+
+    async def load_comments():
+        return [comment async for comment in comments_queryset(listing_id)]
+
+    # https://docs.python.org/3/library/asyncio-task.html#asyncio.gather
+    return await asyncio.gather(load_listing(), load_comments())
@@ -0,0 +1,271 @@
+# Full-text search over listing titles, descriptions and category names.
+# The search index is kept in a separate table managed by a backend for the database in use:
+# - SQLite: an FTS5 virtual table ranked with bm25(). https://www.sqlite.org/fts5.html
+# - PostgreSQL: a tsvector table with a GIN index ranked with ts_rank_cd(). https://www.postgresql.org/docs/current/textsearch.html
+# - Anything else: a LIKE scan over the same text, so search still works without an index.
+# Set AUCTIONS_SEARCH_BACKEND in settings.py to the dotted path of a SearchBackend subclass to choose another one.
+
+# The index only holds text. The status, category and price filters are applied to the live Listing row when searching,
+# so bids and closing an auction never have to update the index. The category name is part of the text, so renaming or
+# deleting a category reindexes its listings.
+
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from .models import Listing
+
+
+# Maximum number of results returned by one search.
+SEARCH_RESULTS = 50
+
+LISTING_TABLE = "auctions_listing"
+CATEGORY_TABLE = "auctions_category"
+
+WORD = re.compile(r"\w+")
+
+
+def search_terms(query):
+    # Words in the query, lowercased. Punctuation and search operators typed by users are ignored.
+    return WORD.findall((query or "").lower())[:16]
+
+
+class SearchBackend:
+    """
+    Base class for search backends. A backend creates and fills its index table, updates it for changed listings,
+    and returns the ids of the best matching listings.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        pass
+
+    def drop_index(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def index_listings(self, listing_ids):
+        pass
+
+    def remove_listings(self, listing_ids):
+        pass
+
+    def index_category(self, category_id):
+        # Reindex every listing in the category, e.g. after the category was renamed.
+        pass
+
+    def search_ids(self, terms, where, params, limit):
+        """
+        Ids of listings matching every term, best match first.
+        where is extra SQL (starting with " AND ") on the listing table aliased as "l", with its params.
+        """
+        raise NotImplementedError
+
+    def execute(self, sql, params=()):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def fetch_ids(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def id_list(self, listing_ids):
+        # Listing ids are integers, so they can be written into the SQL directly.
+        return ", ".join(str(int(listing_id)) for listing_id in listing_ids)
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    table = "auctions_listing_fts"
+    # bm25() column weights for (title, description, category): a title match counts most.
+    weights = "10.0, 1.0, 5.0"
+
+    def create_index(self):
+        # rowid is the listing id.
+        self.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5(title, description, category, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop_index(self):
+        self.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def document_sql(self, where=""):
+        return (
+            f"INSERT INTO {self.table} (rowid, title, description, category) "
+            f"SELECT l.id, l.title, l.description, COALESCE(c.name, '') FROM {LISTING_TABLE} l "
+            f"LEFT JOIN {CATEGORY_TABLE} c ON c.id = l.category_id{where}"
+        )
+
+    def rebuild(self):
+        self.execute(f"DELETE FROM {self.table}")
+        self.execute(self.document_sql())
+
+    def index_listings(self, listing_ids):
+        self.remove_listings(listing_ids)
+        self.execute(self.document_sql(f" WHERE l.id IN ({self.id_list(listing_ids)})"))
+
+    def remove_listings(self, listing_ids):
+        self.execute(f"DELETE FROM {self.table} WHERE rowid IN ({self.id_list(listing_ids)})")
+
+    def index_category(self, category_id):
+        category_listings = f"SELECT id FROM {LISTING_TABLE} WHERE category_id = {int(category_id)}"
+        self.execute(f"DELETE FROM {self.table} WHERE rowid IN ({category_listings})")
+        self.execute(self.document_sql(f" WHERE l.category_id = {int(category_id)}"))
+
+    def search_ids(self, terms, where, params, limit):
+        # Every term must match. The last term also matches as a prefix, e.g. "vint" finds "vintage".
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        return self.fetch_ids(
+            f"SELECT {self.table}.rowid FROM {self.table} JOIN {LISTING_TABLE} l ON l.id = {self.table}.rowid "
+            f"WHERE {self.table} MATCH %s{where} ORDER BY bm25({self.table}, {self.weights}) LIMIT %s",
+            [match, *params, limit]
+        )
+
+
+class PostgresBackend(SearchBackend):
+    table = "auctions_listing_search"
+    config = "english"
+
+    def create_index(self):
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            f"listing_id bigint PRIMARY KEY REFERENCES {LISTING_TABLE} (id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        self.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)")
+
+    def drop_index(self):
+        self.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def document_sql(self, where=""):
+        # Weights A/B/C rank title matches above category matches above description matches.
+        return (
+            f"INSERT INTO {self.table} (listing_id, document) "
+            f"SELECT l.id, "
+            f"setweight(to_tsvector('{self.config}', l.title), 'A') || "
+            f"setweight(to_tsvector('{self.config}', COALESCE(c.name, '')), 'B') || "
+            f"setweight(to_tsvector('{self.config}', l.description), 'C') "
+            f"FROM {LISTING_TABLE} l LEFT JOIN {CATEGORY_TABLE} c ON c.id = l.category_id{where} "
+            f"ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document"
+        )
+
+    def rebuild(self):
+        self.execute(f"TRUNCATE {self.table}")
+        self.execute(self.document_sql())
+
+    def index_listings(self, listing_ids):
+        self.execute(self.document_sql(f" WHERE l.id IN ({self.id_list(listing_ids)})"))
+
+    def remove_listings(self, listing_ids):
+        self.execute(f"DELETE FROM {self.table} WHERE listing_id IN ({self.id_list(listing_ids)})")
+
+    def index_category(self, category_id):
+        self.execute(self.document_sql(f" WHERE l.category_id = {int(category_id)}"))
+
+    def search_ids(self, terms, where, params, limit):
+        # Same query syntax as the SQLite backend: all terms, the last one as a prefix.
+        query = " & ".join(terms) + ":*"
+        return self.fetch_ids(
+            f"SELECT s.listing_id FROM {self.table} s JOIN {LISTING_TABLE} l ON l.id = s.listing_id, "
+            f"to_tsquery('{self.config}', %s) query "
+            f"WHERE s.document @@ query{where} ORDER BY ts_rank_cd(s.document, query) DESC, s.listing_id DESC LIMIT %s",
+            [query, *params, limit]
+        )
+
+
+class LikeBackend(SearchBackend):
+    # No index: every term must appear in the title, description or category name, like the indexed backends.
+    # Newest listings first.
+    columns = ("l.title", "l.description", "COALESCE(c.name, '')")
+
+    def search_ids(self, terms, where, params, limit):
+        term_clause = "(" + " OR ".join(f"LOWER({column}) LIKE %s" for column in self.columns) + ")"
+        clauses = " AND ".join(term_clause for term in terms)
+        term_params = [f"%{term}%" for term in terms for column in self.columns]
+        return self.fetch_ids(
+            f"SELECT l.id FROM {LISTING_TABLE} l LEFT JOIN {CATEGORY_TABLE} c ON c.id = l.category_id "
+            f"WHERE {clauses}{where} ORDER BY l.id DESC LIMIT %s",
+            [*term_params, *params, limit]
+        )
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTS5Backend,
+    "postgresql": PostgresBackend,
+}
+
+
+def search_backend(using=None):
+    # The backend for the given connection (default: the default database).
+    using = using or connection
+    backend_path = getattr(settings, "AUCTIONS_SEARCH_BACKEND", None)
+    backend_class = import_string(backend_path) if backend_path else BACKENDS.get(using.vendor, LikeBackend)
+    return backend_class(using)
+
+
+def search_listings(query, status="open", category=None, min_price=None, max_price=None, limit=SEARCH_RESULTS):
+    """
+    Listings matching the search query, best match first.
+    status is "open", "closed" or "all". category is a Category. min_price and max_price compare with the current bid.
+    Two queries: the ranked ids from the index, then the listings themselves.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    where = ""
+    params = []
+    if status in ("open", "closed"):
+        where += " AND l.is_open = %s"
+        params.append(status == "open")
+    if category is not None:
+        where += " AND l.category_id = %s"
+        params.append(category.id)
+    if min_price is not None:
+        where += " AND l.bid >= %s"
+        params.append(min_price)
+    if max_price is not None:
+        where += " AND l.bid <= %s"
+        params.append(max_price)
+
+    listing_ids = search_backend().search_ids(terms, where, params, limit)
+
+    # https://docs.djangoproject.com/en/5.0/ref/models/querysets/#in-bulk
+    listings = Listing.objects.select_related("category").in_bulk(listing_ids)
+    return [listings[listing_id] for listing_id in listing_ids if listing_id in listings]
+
+
+# Incremental index updates, connected in apps.py.
+# The index is updated after the transaction commits so a rolled back listing is never searchable.
+
+def listing_saved(sender, instance, **kwargs):
+    listing_id = instance.pk
+    transaction.on_commit(lambda: search_backend().index_listings([listing_id]))
+
+
+def listing_deleted(sender, instance, **kwargs):
+    listing_id = instance.pk
+    transaction.on_commit(lambda: search_backend().remove_listings([listing_id]))
+
+
+def category_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Listings are indexed with their category's name. A new category has no listings yet.
+    if created or (update_fields is not None and "name" not in update_fields):
+        return
+    category_id = instance.pk
+    transaction.on_commit(lambda: search_backend().index_category(category_id))
+
+
+def category_deleting(sender, instance, **kwargs):
+    # Deleting a category sets its listings' category to NULL with an UPDATE, which sends no listing signals.
+    # Their ids are read before the delete, and they are reindexed without the category name once it commits.
+    listing_ids = list(instance.listings.values_list("pk", flat=True))
+    if listing_ids:
+        transaction.on_commit(lambda: search_backend().index_listings(listing_ids))
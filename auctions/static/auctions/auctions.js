@@ -15,6 +15,44 @@ document.addEventListener('DOMContentLoaded', function() {
         })
     }
 
+    // Live updates on the listing page.
+    // https://developer.mozilla.org/en-US/docs/Web/API/EventSource
+    const listingDetails = document.getElementById('listing-details');
+
+    if (listingDetails && window.EventSource) {
+        const events = new EventSource(listingDetails.dataset.eventsUrl);
+
+        // A bid was accepted: show the new price and count it.
+        events.addEventListener('bid', (e) => {
+            const data = JSON.parse(e.data);
+            document.querySelectorAll('.current-bid').forEach((element) => {
+                element.textContent = data.bid;
+            });
+            const totalBids = document.getElementById('total-bids');
+            if (totalBids) {
+                totalBids.textContent = parseInt(totalBids.textContent, 10) + 1;
+            }
+        });
+
+        // A comment was added: append it to the list.
+        events.addEventListener('comment', (e) => {
+            const data = JSON.parse(e.data);
+            const item = document.createElement('li');
+            item.className = 'list-group-item';
+            item.textContent = data.comment;
+            const author = document.createElement('p');
+            author.textContent = `Shared by: ${data.author}`;
+            item.append(author);
+            document.getElementById('comments').append(item);
+        });
+
+        // The auction was closed: reload to show the result and remove the bid form.
+        events.addEventListener('close', () => {
+            events.close();
+            window.location.reload();
+        });
+    }
+
 
 
 
@@ -0,0 +1,49 @@
+# Template tag that caches part of a page for one listing until the listing changes (see auctions/fragments.py).
+# https://docs.djangoproject.com/en/5.0/howto/custom-template-tags/#writing-the-compilation-function
+
+# Usage:
+# {% load listing_fragments %}
+# {% listingfragment "details" listing.id %} ... {% endlistingfragment %}
+# {% listingfragment "card" listing.id request.LANGUAGE_CODE %} ... {% endlistingfragment %}   # extra values vary the key
+
+# Pages showing many listings can put {listing id: version} in the context as listing_versions (fragments.listing_versions())
+# so the versions are read from the cache in one round trip instead of one per fragment.
+
+from django import template
+from django.utils.safestring import mark_safe
+
+from auctions.fragments import cached_fragment
+
+
+register = template.Library()
+
+
+class ListingFragmentNode(template.Node):
+    def __init__(self, nodelist, name, listing_id, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.listing_id = listing_id
+        self.vary = vary
+
+    def render(self, context):
+        listing_id = self.listing_id.resolve(context)
+        version = (context.get("listing_versions") or {}).get(listing_id)
+        html = cached_fragment(
+            self.name.resolve(context),
+            listing_id,
+            lambda: self.nodelist.render(context),
+            *[value.resolve(context) for value in self.vary],
+            version=version
+        )
+        return mark_safe(html)
+
+
+@register.tag("listingfragment")
+def listing_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name and a listing id.")
+    nodelist = parser.parse(("endlistingfragment",))
+    parser.delete_first_token()
+    return ListingFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]),
+                               [parser.compile_filter(bit) for bit in bits[3:]])
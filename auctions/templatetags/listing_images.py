@@ -0,0 +1,24 @@
+# Template tag that picks the right size and format of a listing image.
+# https://docs.djangoproject.com/en/5.0/howto/custom-template-tags/#inclusion-tags
+
+# Usage:
+# {% load listing_images %}
+# {% listing_image listing "thumb" %}
+
+from django import template
+from django.core.files.storage import default_storage
+
+
+register = template.Library()
+
+
+@register.inclusion_tag("auctions/listing_image.html")
+def listing_image(listing, variant="thumb"):
+    # Variants made by images.py, or the original upload if the image has not been processed yet.
+    files = (listing.image_variants or {}).get(variant, {})
+    return {
+        "webp": default_storage.url(files["webp"]) if "webp" in files else "",
+        "jpeg": default_storage.url(files["jpeg"]) if "jpeg" in files else "",
+        "original": listing.image.url if listing.image else "",
+        "alt": listing.title
+    }
@@ -0,0 +1,18 @@
+# Template tag for the number of listings on the signed in user's watchlist, shown next to the Watchlist link.
+# Read from the user's cached watchlist (auctions/watchlists.py), so it costs no query on most pages.
+
+# Usage:
+# {% load watchlists %}
+# {% watchlist_count user %}
+
+from django import template
+
+from auctions.watchlists import user_watched_ids
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def watchlist_count(user):
+    return len(user_watched_ids(user))
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 # Create your tests here.
+# https://docs.djangoproject.com/en/5.0/topics/testing/overview/
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.core.management import call_command, CommandError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import views
+from .models import User, AuctionResult, BidRollup, Category, Listing, Bid, Comment, Notification, OutboxEvent
+from .benchmarks import cleanup, compare, seed
+from .bidding import parse_bid_amount, place_bid
+from .categories import category_for_name, change_open_listings
+from .closing import close_due_listings, close_listing
+from .fragments import bump_listing_version
+from .images import process_listing_image
+from .notifications import dispatch_all
+from .live import LocalBroker, get_broker, listing_channel
+from .logs import SamplingFilter, StructuredFormatter, describe
+from . import profiling
+from .queries import FEED_PAGE_SIZE
+from .search import search_listings
+from .watchlists import watched_ids, watcher_count
+
+
+def create_listings(user, count, **fields):
+    # bulk_create skips save() - the image field only needs a stored file name here.
+    return Listing.objects.bulk_create([
+        Listing(title=f"Item {i}", description="Test item", image="images/test.png",
+                bid=Decimal("1.00"), createdBy=user, **fields)
+        for i in range(count)
+    ])
+
+
+class IndexFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def test_only_open_listings_are_shown(self):
+        create_listings(self.user, 2)
+        create_listings(self.user, 1, is_open=False)
+
+        response = self.client.get(reverse("index"))
+
+        self.assertEqual(len(response.context["all_listings"]), 2)
+        self.assertTrue(all(listing.is_open for listing in response.context["all_listings"]))
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # Regression test for the N+1 on listing.createdBy - one query for the page whatever its size.
+        create_listings(self.user, 3)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("index"))
+
+        create_listings(self.user, FEED_PAGE_SIZE * 2)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("index"))
+
+    def test_cursor_walks_every_listing_once(self):
+        create_listings(self.user, FEED_PAGE_SIZE + 5)
+
+        first_page = self.client.get(reverse("index"))
+        next_cursor = first_page.context["next_cursor"]
+        second_page = self.client.get(reverse("index"), {"cursor": next_cursor})
+
+        seen = [listing.id for listing in first_page.context["all_listings"]]
+        seen += [listing.id for listing in second_page.context["all_listings"]]
+        self.assertEqual(len(seen), FEED_PAGE_SIZE + 5)
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertIsNone(second_page.context["next_cursor"])
+
+    def test_invalid_cursor_shows_first_page(self):
+        create_listings(self.user, 1)
+
+        response = self.client.get(reverse("index"), {"cursor": "abc"})
+
+        self.assertEqual(len(response.context["all_listings"]), 1)
+
+        response = self.client.get(reverse("index"), {"cursor": str(2**64)})
+
+        self.assertEqual(len(response.context["all_listings"]), 1)
+
+
+class ListingDetailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bid_summary_and_watch_flag(self):
+        place_bid(self.listing.id, self.seller, Decimal("2.00"))
+        place_bid(self.listing.id, self.bidder, Decimal("3.00"))
+        self.listing.watchlist.add(self.bidder)
+        self.client.force_login(self.bidder)
+
+        response = self.client.get(reverse("listing", args=(self.listing.id,)))
+
+        self.assertEqual(response.context["total_bids"], 2)
+        self.assertEqual(response.context["highest_bidder_id"], self.bidder.id)
+        self.assertTrue(response.context["user_is_watching"])
+        self.assertFalse(response.context["starting_bid"])
+
+    def test_query_count_does_not_depend_on_bids_watchers_or_comments(self):
+        # Signed in, so the page is built rather than served from the anonymous page cache.
+        # The first request loads the watchlist and watcher count into the cache.
+        self.client.force_login(self.bidder)
+        self.client.get(reverse("listing", args=(self.listing.id,)))
+
+        # The session and user, then the listing and the comments.
+        with self.assertNumQueries(4):
+            self.client.get(reverse("listing", args=(self.listing.id,)))
+
+        for i in range(20):
+            user = User.objects.create_user(f"user{i}")
+            place_bid(self.listing.id, user, Decimal(i + 2))
+            Comment.objects.create(comment="Nice", listing=self.listing, author=user)
+            self.listing.watchlist.add(user)
+
+        with self.assertNumQueries(4):
+            self.client.get(reverse("listing", args=(self.listing.id,)))
+
+    def test_missing_listing_is_404(self):
+        response = self.client.get(reverse("listing", args=(self.listing.id + 1,)))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class BidCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def test_place_bid_updates_counters(self):
+        place_bid(self.listing.id, self.bidder, Decimal("2.00"))
+        new_bid = place_bid(self.listing.id, self.bidder, Decimal("5.00"))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid, Decimal("5.00"))
+        self.assertEqual(self.listing.bid_count, 2)
+        self.assertEqual(self.listing.leading_bid, new_bid)
+        self.assertIsNotNone(self.listing.last_bid_at)
+
+    def test_place_bid_rejects_low_bids_and_closed_auctions(self):
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, Decimal("1.00")))
+        self.assertIsNotNone(place_bid(self.listing.id, self.bidder, Decimal("1.01")))
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, Decimal("1.01")))
+
+        Listing.objects.filter(pk=self.listing.pk).update(is_open=False)
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, Decimal("9.00")))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 1)
+        self.assertEqual(Bid.objects.filter(listing=self.listing).count(), 1)
+
+    def test_bid_view_renders_listing_page(self):
+        self.client.force_login(self.bidder)
+
+        response = self.client.post(reverse("bid", args=(self.listing.id,)), {"bid": "2.50"})
+        self.assertTrue(response.context["bid_placed"])
+        self.assertEqual(response.context["total_bids"], 1)
+
+        response = self.client.post(reverse("bid", args=(self.listing.id,)), {"bid": "abc"})
+        self.assertFalse(response.context["bid_placed"])
+        self.assertEqual(response.context["bid"], Decimal("2.50"))
+
+        # Too large for the bid column: rejected like any other invalid amount.
+        response = self.client.post(reverse("bid", args=(self.listing.id,)), {"bid": "1e30"})
+        self.assertFalse(response.context["bid_placed"])
+        self.assertEqual(self.client.get(reverse("search"), {"q": "item", "min_price": "1e30"}).status_code, 200)
+
+    def test_parse_bid_amount_only_accepts_amounts_the_columns_hold(self):
+        self.assertEqual(parse_bid_amount("2.505"), Decimal("2.50"))
+        self.assertEqual(parse_bid_amount("99999999999999999.99"), Decimal("99999999999999999.99"))
+        for value in ("1e30", "99999999999999999.999", "-1", "0", "NaN", "Infinity", "", None, "abc"):
+            self.assertIsNone(parse_bid_amount(value), value)
+
+    def test_rebuild_command_fixes_stale_counters(self):
+        # Bids inserted directly skip the counters.
+        Bid.objects.create(bid=Decimal("2.00"), listing=self.listing, placedBy=self.bidder)
+        top_bid = Bid.objects.create(bid=Decimal("4.00"), listing=self.listing, placedBy=self.bidder)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_bid_counters", "--verify", stdout=StringIO())
+
+        call_command("rebuild_bid_counters", "--batch-size", "1", stdout=StringIO())
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 2)
+        self.assertEqual(self.listing.leading_bid, top_bid)
+        self.assertEqual(self.listing.bid, Decimal("4.00"))
+        self.assertEqual(self.listing.last_bid_at, top_bid.created_at)
+        call_command("rebuild_bid_counters", "--verify", stdout=StringIO())
+
+    def test_rebuild_repairs_the_price_and_last_bid_time(self):
+        bid = place_bid(self.listing.id, self.bidder, Decimal("2.00"))
+        Listing.objects.filter(pk=self.listing.id).update(bid=Decimal("9.00"), last_bid_at=None)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_bid_counters", "--verify", stdout=StringIO())
+
+        call_command("rebuild_bid_counters", stdout=StringIO())
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid, Decimal("2.00"))
+        self.assertEqual(self.listing.last_bid_at, bid.created_at)
+        call_command("rebuild_bid_counters", "--verify", stdout=StringIO())
+
+
+class CategoryDirectoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.art = category_for_name("Art")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_directory_is_served_from_cache(self):
+        change_open_listings(self.art.id, +1)
+        self.client.get(reverse("categories"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("categories"))
+
+        self.assertEqual([entry["name"] for entry in response.context["all_categories"]], ["Art"])
+
+    def test_close_updates_count_once_and_invalidates_cache(self):
+        listing = create_listings(self.seller, 1, category=self.art)[0]
+        change_open_listings(self.art.id, +1)
+        change_open_listings(self.art.id, +1)
+        self.client.get(reverse("categories"))
+        self.client.force_login(self.seller)
+
+        # The cache is invalidated when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("close", args=(listing.id,)))
+            self.client.post(reverse("close", args=(listing.id,)))
+
+        self.assertEqual(Category.objects.get(name="Art").open_listings, 1)
+        response = self.client.get(reverse("categories"))
+        self.assertEqual(response.context["all_categories"][0]["open_listings"], 1)
+
+    def test_counts_follow_orm_changes(self):
+        toys = category_for_name("Toys")
+        listing = Listing.objects.create(title="Lamp", description="Test item", image="images/test.png",
+                                         bid=Decimal("1.00"), createdBy=self.seller, category=self.art)
+        counts = lambda: dict(Category.objects.values_list("name", "open_listings"))
+        self.assertEqual(counts(), {"Art": 1, "Toys": 0})
+
+        # Moved to another category, closed, reopened and deleted, e.g. in the admin.
+        listing.category = toys
+        listing.save()
+        self.assertEqual(counts(), {"Art": 0, "Toys": 1})
+        listing.is_open = False
+        listing.save()
+        self.assertEqual(counts(), {"Art": 0, "Toys": 0})
+        listing.is_open = True
+        listing.save()
+        self.assertEqual(counts(), {"Art": 0, "Toys": 1})
+        listing.delete()
+        self.assertEqual(counts(), {"Art": 0, "Toys": 0})
+
+        # A count that is already wrong never goes below zero.
+        change_open_listings(toys.id, -1)
+        self.assertEqual(counts()["Toys"], 0)
+
+    def test_rebuild_category_counts(self):
+        create_listings(self.seller, 3, category=self.art)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_category_counts", "--verify", stdout=StringIO())
+        call_command("rebuild_category_counts", stdout=StringIO())
+        self.assertEqual(Category.objects.get(pk=self.art.id).open_listings, 3)
+        call_command("rebuild_category_counts", "--verify", stdout=StringIO())
+
+    def test_only_the_creator_can_close(self):
+        listing = create_listings(self.seller, 1)[0]
+        self.client.force_login(User.objects.create_user("other"))
+
+        self.client.post(reverse("close", args=(listing.id,)))
+
+        listing.refresh_from_db()
+        self.assertTrue(listing.is_open)
+
+
+class CategoryLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def test_spellings_of_a_name_share_one_category(self):
+        home_decor = category_for_name("Home Decor")
+
+        self.assertEqual(category_for_name("  home decor "), home_decor)
+        self.assertEqual(category_for_name("HOME-DECOR"), home_decor)
+        self.assertEqual(home_decor.slug, "home-decor")
+        self.assertIsNone(category_for_name("   "))
+
+    def test_category_page_shows_open_listings_by_slug(self):
+        books = category_for_name("Books")
+        create_listings(self.seller, 2, category=books)
+        create_listings(self.seller, 1, category=books, is_open=False)
+        create_listings(self.seller, 1, category=category_for_name("Art"))
+
+        response = self.client.get(reverse("category", args=("books",)))
+
+        self.assertEqual(len(response.context["all_category_items"]), 2)
+        self.assertEqual(self.client.get(reverse("category", args=("unknown",))).status_code, 404)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.art = category_for_name("Art")
+
+    def create_listing(self, title, description="Test item", **fields):
+        # The search index is updated when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return Listing.objects.create(title=title, description=description, image="images/test.png",
+                                          bid=fields.pop("bid", Decimal("1.00")), createdBy=self.seller, **fields)
+
+    def test_title_matches_rank_above_description_matches(self):
+        in_description = self.create_listing("Oak table", "Comes with a vintage lamp")
+        in_title = self.create_listing("Vintage lamp", "Brass")
+
+        results = search_listings("vintage lamp")
+
+        self.assertEqual(results, [in_title, in_description])
+
+    def test_filters_use_current_listing_state(self):
+        cheap = self.create_listing("Blue vase", bid=Decimal("5.00"), category=self.art)
+        expensive = self.create_listing("Red vase", bid=Decimal("50.00"), category=self.art)
+        self.create_listing("Green vase", bid=Decimal("5.00"))
+        # Closing and bidding use UPDATE, which does not touch the index.
+        Listing.objects.filter(pk=expensive.pk).update(is_open=False)
+
+        self.assertEqual(search_listings("vase", category=self.art), [cheap])
+        self.assertEqual(search_listings("vase", status="closed"), [expensive])
+        self.assertEqual(search_listings("vas", status="all", min_price=Decimal("10")), [expensive])
+
+    def test_index_follows_edits_and_deletes(self):
+        listing = self.create_listing("Guitar")
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.title = "Violin"
+            listing.save()
+
+        self.assertEqual(search_listings("guitar"), [])
+        self.assertEqual(search_listings("violin"), [listing])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertEqual(search_listings("violin"), [])
+
+    def test_renaming_a_category_reindexes_its_listings(self):
+        category = category_for_name("Lighting")
+        listing = self.create_listing("Brass lamp", category=category)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = "Furniture"
+            category.save()
+        self.assertEqual(search_listings("lighting"), [])
+        self.assertEqual(search_listings("furniture"), [listing])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(search_listings("furniture"), [])
+        self.assertEqual(search_listings("brass"), [listing])
+
+    def test_like_backend_matches_the_category_name_too(self):
+        listing = self.create_listing("Brass lamp", category=self.art)
+
+        with override_settings(AUCTIONS_SEARCH_BACKEND="auctions.search.LikeBackend"):
+            self.assertEqual(search_listings("art lamp"), [listing])
+            self.assertEqual(search_listings("art chair"), [])
+
+    def test_search_view(self):
+        self.create_listing("Vintage lamp")
+
+        response = self.client.get(reverse("search"), {"q": "lamp", "min_price": "abc"})
+
+        self.assertEqual([item.title for item in response.context["results"]], ["Vintage lamp"])
+
+
+class ImageProcessingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_variants_are_resized_and_have_no_metadata(self):
+        upload = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        Image.new("RGB", (2000, 1000), "red").save(upload, "JPEG", exif=exif)
+        listing = Listing.objects.create(title="Lamp", description="Test item", bid=Decimal("1.00"), createdBy=self.seller,
+                                         image=SimpleUploadedFile("lamp.jpg", upload.getvalue(), content_type="image/jpeg"))
+
+        process_listing_image(listing.id)
+
+        listing.refresh_from_db()
+        for format_name, pillow_format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+            with default_storage.open(listing.image_variants["thumb"][format_name]) as thumb, Image.open(thumb) as image:
+                self.assertEqual(image.format, pillow_format)
+                self.assertEqual(image.size, (320, 160))
+                self.assertEqual(len(image.getexif()), 0)
+
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "thumb.webp")
+
+    def test_images_with_the_same_stem_keep_their_own_variants(self):
+        listings = []
+        for name, color, pillow_format in (("photo.jpg", "red", "JPEG"), ("photo.png", "blue", "PNG")):
+            upload = BytesIO()
+            Image.new("RGB", (400, 400), color).save(upload, pillow_format)
+            name = default_storage.save(f"images/{name}", ContentFile(upload.getvalue()))
+            listings.append(Listing.objects.create(title="Lamp", description="Test item", bid=Decimal("1.00"),
+                                                   createdBy=self.seller, image=name))
+
+        for listing in listings:
+            process_listing_image(listing.id)
+
+        colors = []
+        for listing in listings:
+            listing.refresh_from_db()
+            with default_storage.open(listing.image_variants["thumb"]["jpeg"]) as thumb, Image.open(thumb) as image:
+                colors.append(image.convert("RGB").getpixel((0, 0)))
+        self.assertGreater(colors[0][0], 200)
+        self.assertGreater(colors[1][2], 200)
+
+
+@override_settings(AUCTIONS_MAX_IMAGE_BYTES=2048)
+class ImageUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.seller)
+
+    def post_listing(self, name, content):
+        return self.client.post(reverse("new_listing"), {
+            "title": "Lamp", "description": "Test item", "bid": "1.00", "category": "Home",
+            "image": SimpleUploadedFile(name, content)
+        })
+
+    def png(self, color="red"):
+        upload = BytesIO()
+        Image.new("RGB", (10, 10), color).save(upload, "PNG")
+        return upload.getvalue()
+
+    def test_identical_images_are_stored_once(self):
+        self.post_listing("first.png", self.png())
+        # The type comes from the file content, not the name.
+        self.post_listing("second.jpg", self.png())
+
+        first, second = Listing.objects.order_by("id")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith("images/sha256/"))
+        self.assertTrue(first.image.name.endswith(".png"))
+
+    def test_non_images_and_large_files_are_rejected(self):
+        response = self.post_listing("notes.png", b"just some text, not an image")
+        self.assertContains(response, "must be a JPEG, PNG, GIF or WebP")
+
+        response = self.post_listing("big.png", self.png() + b"0" * 4096)
+        # Limits under 1 MB are shown in KB, not as "0 MB".
+        self.assertContains(response, "must be smaller than 2.0\xa0KB")
+
+        self.assertFalse(Listing.objects.exists())
+
+    def test_stored_originals_have_no_camera_metadata(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        exif[0x0112] = 6
+        upload = BytesIO()
+        Image.new("RGB", (20, 10), "red").save(upload, "JPEG", exif=exif, comment=b"taken at home")
+        self.post_listing("photo.jpg", upload.getvalue())
+
+        listing = Listing.objects.get()
+        with default_storage.open(listing.image.name) as original, Image.open(original) as image:
+            # Only the orientation is kept.
+            self.assertEqual(dict(image.getexif()), {0x0112: 6})
+            self.assertNotIn("comment", image.info)
+        # The listing page shows the original until the variants exist.
+        self.assertContains(self.client.get(reverse("listing", args=(listing.id,))), listing.image.url)
+
+        # A damaged file cannot be re-saved, so it is rejected rather than stored with its metadata.
+        response = self.post_listing("broken.jpg", upload.getvalue()[:-200])
+        self.assertContains(response, "The image could not be read.")
+
+        # An image without metadata is stored byte for byte.
+        self.post_listing("plain.png", self.png("blue"))
+        with default_storage.open(Listing.objects.latest("id").image.name) as original:
+            self.assertEqual(original.read(), self.png("blue"))
+
+
+class LiveUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def test_accepted_bids_are_published_after_commit(self):
+        published = []
+        broker = get_broker()
+        original_publish = broker.publish
+        broker.publish = lambda channel, event: published.append((channel, event))
+        self.addCleanup(setattr, broker, "publish", original_publish)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.bidder, Decimal("2.00"))
+            place_bid(self.listing.id, self.bidder, Decimal("1.50"))
+            self.assertEqual(published, [])
+
+        self.assertEqual(published, [
+            (listing_channel(self.listing.id), {"type": "bid", "listing": self.listing.id, "bid": "2.00", "bidder": "bidder"})
+        ])
+
+
+class LocalBrokerTests(SimpleTestCase):
+
+    async def test_subscribers_receive_events_for_their_channel(self):
+        broker = LocalBroker()
+
+        async with broker.subscribe("listing:1") as first, broker.subscribe("listing:1") as second, \
+                broker.subscribe("listing:2") as other:
+            broker.publish("listing:1", {"type": "close"})
+
+            self.assertEqual(await first.get(), {"type": "close"})
+            self.assertEqual(await second.get(), {"type": "close"})
+            self.assertTrue(other.empty())
+
+        self.assertEqual(broker.subscriber_count("listing:1"), 0)
+
+    async def test_subscriber_with_a_closed_loop_is_dropped(self):
+        broker = LocalBroker()
+        closed_loop = asyncio.new_event_loop()
+        closed_loop.close()
+        # A subscriber whose worker's loop shut down before it unsubscribed.
+        broker.subscribers["listing:1"][asyncio.Queue()] = closed_loop
+
+        async with broker.subscribe("listing:1") as live:
+            broker.publish("listing:1", {"type": "bid"})
+            self.assertEqual(await live.get(), {"type": "bid"})
+            self.assertEqual(broker.subscriber_count("listing:1"), 1)
+
+
+class AsyncReadViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("seller", password="secret")
+        self.category = category_for_name("Books")
+        self.listing = Listing.objects.create(title="Async book", description="Read", image="images/test.png",
+                                              bid=Decimal("5.00"), createdBy=self.user, category=self.category)
+        self.listing.watchlist.add(self.user)
+        Comment.objects.create(comment="First!", listing=self.listing, author=self.user)
+
+    def async_request(self, path, user=None):
+        # What AuthenticationMiddleware provides to an async view.
+        request = AsyncRequestFactory().get(path)
+
+        async def auser():
+            return user or AnonymousUser()
+
+        request.auser = auser
+        return request
+
+    async def test_listing_page_with_comments_and_watch_flag(self):
+        response = await views.listing_async(self.async_request(f"/listing/{self.listing.id}", self.user), self.listing.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Async book")
+        self.assertContains(response, "First!")
+        self.assertContains(response, "Remove from Watchlist")
+
+    async def test_missing_listing_is_404(self):
+        with self.assertRaises(Http404):
+            await views.listing_async(self.async_request("/listing/0"), 0)
+
+    async def test_feed_category_and_watchlist_pages(self):
+        response = await views.index_async(self.async_request("/"))
+        self.assertContains(response, "Async book")
+
+        response = await views.categories_async(self.async_request("/categories"))
+        self.assertContains(response, "Books")
+
+        response = await views.category_async(self.async_request("/category/books"), "books")
+        self.assertContains(response, "Async book")
+
+        response = await views.watchList_async(self.async_request("/watchList", self.user))
+        self.assertContains(response, "Title: Async book")
+
+
+class AuctionClosingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.category = category_for_name("Books")
+
+    def create_auctions(self, count, ends_at):
+        listings = create_listings(self.seller, count, category=self.category, ends_at=ends_at)
+        Category.objects.filter(pk=self.category.pk).update(open_listings=F("open_listings") + count)
+        return listings
+
+    def test_due_auctions_are_closed_in_batches_with_their_winner(self):
+        now = timezone.now()
+        due = self.create_auctions(5, now - timedelta(minutes=1))
+        running = self.create_auctions(2, now + timedelta(hours=1))
+        # Bid before the end time, then let the auction run out.
+        Listing.objects.filter(pk=due[0].id).update(ends_at=now + timedelta(minutes=1))
+        place_bid(due[0].id, self.bidder, Decimal("2.00"))
+        Listing.objects.filter(pk=due[0].id).update(ends_at=now - timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(close_due_listings(now, batch_size=2), 5)
+
+        self.assertFalse(Listing.objects.filter(pk__in=[listing.id for listing in due], is_open=True).exists())
+        self.assertEqual(Listing.objects.filter(pk__in=[listing.id for listing in running], is_open=True).count(), 2)
+        self.assertEqual(Listing.objects.get(pk=due[0].id).winner, self.bidder)
+        self.assertIsNone(Listing.objects.get(pk=due[1].id).winner)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).open_listings, 2)
+
+        # Running again closes nothing and does not change the counts.
+        self.assertEqual(close_due_listings(now), 0)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).open_listings, 2)
+
+    def test_bids_after_the_end_time_are_rejected(self):
+        listing = self.create_auctions(1, timezone.now() - timedelta(seconds=1))[0]
+
+        self.assertIsNone(place_bid(listing.id, self.bidder, Decimal("2.00")))
+
+    def test_only_the_creator_closes_and_the_winner_is_recorded(self):
+        listing = self.create_auctions(1, None)[0]
+        place_bid(listing.id, self.bidder, Decimal("2.00"))
+
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("close", args=(listing.id,)))
+        self.assertTrue(Listing.objects.get(pk=listing.id).is_open)
+
+        self.client.force_login(self.seller)
+        self.client.post(reverse("close", args=(listing.id,)))
+        listing.refresh_from_db()
+        self.assertFalse(listing.is_open)
+        self.assertEqual(listing.winner, self.bidder)
+
+    def test_close_auctions_command(self):
+        self.create_auctions(3, timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+
+        call_command("close_auctions", stdout=out)
+
+        self.assertIn("Closed 3 auctions.", out.getvalue())
+
+
+class AuctionResultTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listings = create_listings(cls.seller, 2)
+
+    def test_closing_records_the_result(self):
+        listing, unsold = self.listings
+        place_bid(listing.id, self.seller, Decimal("2.00"))
+        place_bid(listing.id, self.bidder, Decimal("3.00"))
+
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse("close", args=(listing.id,)))
+        self.client.post(reverse("close", args=(unsold.id,)))
+
+        self.assertContains(response, "This auction is now closed.")
+        result = AuctionResult.objects.get(listing=listing)
+        self.assertEqual((result.winner, result.winning_bid, result.bid_count), (self.bidder, Decimal("3.00"), 2))
+        unsold_result = AuctionResult.objects.get(listing=unsold)
+        self.assertEqual((unsold_result.winner, unsold_result.winning_bid, unsold_result.bid_count), (None, None, 0))
+
+        # Results are immutable.
+        result.bid_count = 5
+        with self.assertRaises(ValueError):
+            result.save()
+
+    def test_wins_page_does_not_read_bids(self):
+        listing = self.listings[0]
+        place_bid(listing.id, self.bidder, Decimal("3.00"))
+        close_listing(listing.id, self.seller)
+        self.client.force_login(self.bidder)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("wins"))
+
+        self.assertContains(response, listing.title)
+        self.assertFalse(any("auctions_bid" in query["sql"] for query in queries.captured_queries))
+
+
+class WatchlistCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.watcher = User.objects.create_user("watcher", "watcher@example.com", "password")
+        cls.listings = create_listings(cls.seller, 3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.watcher)
+
+    def test_add_and_remove_update_the_cached_set_and_count(self):
+        listing = self.listings[0]
+        self.assertEqual(watched_ids(self.watcher.id), frozenset())
+        self.assertEqual(watcher_count(listing.id), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("add_to_watchlist", args=(listing.id,)))
+            self.client.post(reverse("add_to_watchlist", args=(listing.id,)))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(watched_ids(self.watcher.id), frozenset([listing.id]))
+            self.assertEqual(watcher_count(listing.id), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("remove_from_watchlist", args=(listing.id,)))
+
+        self.assertEqual(watched_ids(self.watcher.id), frozenset())
+        self.assertEqual(watcher_count(listing.id), 0)
+        self.assertFalse(listing.watchlist.exists())
+
+    def test_changes_outside_the_service_drop_the_cache(self):
+        listing = self.listings[1]
+        watched_ids(self.watcher.id)
+        watcher_count(listing.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.watchlist.add(self.watcher)
+
+        self.assertEqual(watched_ids(self.watcher.id), frozenset([listing.id]))
+        self.assertEqual(watcher_count(listing.id), 1)
+
+    def test_watchlist_page_loads_cards_in_one_query(self):
+        for listing in self.listings:
+            listing.watchlist.add(self.watcher)
+        # Warm the session and the cached watchlist.
+        self.client.get(reverse("watchList"))
+
+        with self.assertNumQueries(3):
+            # The session and user, then the listing cards. The watched ids and the badge come from the cache.
+            response = self.client.get(reverse("watchList"))
+
+        self.assertEqual([listing.id for listing in response.context["watchList"]], [listing.id for listing in reversed(self.listings)])
+        self.assertContains(response, 'badge-secondary">3<')
+
+
+class NotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.first = User.objects.create_user("first", "first@example.com", "password")
+        cls.second = User.objects.create_user("second", "second@example.com", "password")
+        cls.watchers = [User.objects.create_user(f"watcher{i}") for i in range(5)]
+        cls.listing = create_listings(cls.seller, 1)[0]
+        cls.listing.watchlist.add(cls.first, *cls.watchers)
+
+    def test_bidding_war_is_coalesced_into_one_notification_per_user(self):
+        for i in range(10):
+            place_bid(self.listing.id, self.first if i % 2 == 0 else self.second, Decimal(i + 2))
+        self.assertEqual(OutboxEvent.objects.count(), 10)
+
+        # Small chunks so the watchers are read in several batches.
+        with mock.patch("auctions.notifications.WATCHER_CHUNK", 2):
+            self.assertEqual(dispatch_all(batch_size=4), 10)
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        # second placed the last bid and is not notified. first was outbid.
+        self.assertFalse(Notification.objects.filter(user=self.second).exists())
+        outbid = Notification.objects.get(user=self.first)
+        self.assertEqual(outbid.kind, Notification.OUTBID)
+        self.assertIn("11.00", outbid.message)
+        for watcher in self.watchers:
+            notification = Notification.objects.get(user=watcher)
+            self.assertEqual((notification.kind, notification.count), (Notification.BID, 10))
+
+    def test_close_notifies_winner_and_watchers(self):
+        place_bid(self.listing.id, self.second, Decimal("5.00"))
+        close_listing(self.listing.id, self.seller)
+
+        dispatch_all()
+
+        self.assertEqual(Notification.objects.get(user=self.second).kind, Notification.WON)
+        self.assertEqual(Notification.objects.get(user=self.watchers[0]).kind, Notification.CLOSED)
+        self.assertEqual(Notification.objects.filter(kind=Notification.CLOSED).count(), 6)
+
+    def test_watcher_notice_does_not_hide_an_unread_outbid_or_win(self):
+        place_bid(self.listing.id, self.first, Decimal("5.00"))
+        place_bid(self.listing.id, self.second, Decimal("6.00"))
+        dispatch_all()
+        # first watches the listing: a later bid by someone else is only a "new bid" notice for them.
+        place_bid(self.listing.id, self.watchers[0], Decimal("7.00"))
+        dispatch_all()
+
+        notification = Notification.objects.get(user=self.first)
+        self.assertEqual(notification.kind, Notification.OUTBID)
+        self.assertIn("6.00", notification.message)
+        self.assertEqual(notification.count, 3)
+
+        # A more important event still replaces it.
+        close_listing(self.listing.id, self.seller)
+        dispatch_all()
+        self.assertEqual(Notification.objects.get(user=self.watchers[0]).kind, Notification.WON)
+
+    def test_notifications_page_marks_them_read(self):
+        place_bid(self.listing.id, self.second, Decimal("5.00"))
+        dispatch_all()
+        self.client.force_login(self.watchers[0])
+
+        response = self.client.get(reverse("notifications"))
+
+        self.assertContains(response, "New bid on Item 0: 5.00.")
+        self.assertFalse(Notification.objects.filter(user=self.watchers[0], read_at__isnull=True).exists())
+
+        # The next bid starts a new unread notification.
+        place_bid(self.listing.id, self.first, Decimal("6.00"))
+        dispatch_all()
+        self.assertEqual(Notification.objects.filter(user=self.watchers[0]).count(), 2)
+
+
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_listing_page_is_served_from_cache_until_a_bid(self):
+        url = reverse("listing", args=(self.listing.id,))
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Item 0")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.bidder, Decimal("7.50"))
+
+        self.assertContains(self.client.get(url), "7.50")
+
+    def test_bid_during_render_is_not_cached_under_the_new_version(self):
+        url = reverse("listing", args=(self.listing.id,))
+        load = views.listing_detail
+
+        def load_then_bid(*args):
+            # A bid commits after the page's data was read but before its fragments are cached.
+            loaded = load(*args)
+            with self.captureOnCommitCallbacks(execute=True):
+                place_bid(self.listing.id, self.bidder, Decimal("7.50"))
+            return loaded
+
+        for user in (None, self.seller):
+            cache.clear()
+            Listing.objects.filter(pk=self.listing.id).update(bid=Decimal("1.00"), bid_count=0, leading_bid=None)
+            if user:
+                self.client.force_login(user)
+            with mock.patch("auctions.views.listing_detail", load_then_bid):
+                self.assertNotContains(self.client.get(url), "7.50")
+            self.assertContains(self.client.get(url), "7.50")
+
+    def test_fragment_tag_is_cached_per_listing_version(self):
+        template = Template('{% load listing_fragments %}{% listingfragment "test" listing_id %}{{ text }}{% endlistingfragment %}')
+
+        self.assertEqual(template.render(Context({"listing_id": self.listing.id, "text": "first"})), "first")
+        self.assertEqual(template.render(Context({"listing_id": self.listing.id, "text": "second"})), "first")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(comment="Hi", listing=self.listing, author=self.bidder)
+            bump_listing_version(self.listing.id)
+
+        self.assertEqual(template.render(Context({"listing_id": self.listing.id, "text": "second"})), "second")
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1, category=category_for_name("Art"))[0]
+        change_open_listings(cls.listing.category_id, +1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_listing_page_is_not_modified_without_queries(self):
+        url = reverse("listing", args=(self.listing.id,))
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_listing_page_honours_if_modified_since(self):
+        url = reverse("listing", args=(self.listing.id,))
+        last_modified = self.client.get(url)["Last-Modified"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(pk=self.listing.id).update(updated_at=timezone.now() + timedelta(hours=1))
+            bump_listing_version(self.listing.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_signed_in_pages_are_revalidated_by_etag_only(self):
+        # The signed in page depends on the user, which a date cannot express.
+        self.client.force_login(self.bidder)
+        for url in (reverse("listing", args=(self.listing.id,)), reverse("category", args=("art",))):
+            response = self.client.get(url)
+            self.assertNotIn("Last-Modified", response)
+            self.assertIn("Cookie", response["Vary"])
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600)).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_bid_and_close_change_the_listing_etag(self):
+        url = reverse("listing", args=(self.listing.id,))
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.bidder, Decimal("7.50"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "7.50")
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            close_listing(self.listing.id, self.seller)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_the_signed_in_user(self):
+        url = reverse("index")
+        etag = self.client.get(url)["ETag"]
+
+        self.client.force_login(self.bidder)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_category_page_is_not_modified_until_a_listing_closes(self):
+        url = reverse("category", args=("art",))
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            close_listing(self.listing.id, self.seller)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse("category", args=("missing",))).status_code, 404)
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listings = create_listings(cls.seller, 5, category=category_for_name("Art"))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listings_are_paginated_with_sparse_fields_in_one_query(self):
+        url = reverse("api_listings")
+        with self.assertNumQueries(1):
+            page = self.client.get(url, {"fields": "title,price,category", "limit": 3}).json()
+
+        self.assertEqual(page["results"][0], {"id": self.listings[4].id, "title": "Item 4", "price": "1.00", "category": "art"})
+        self.assertEqual(page["next_cursor"], self.listings[2].id)
+
+        page = self.client.get(url, {"fields": "title", "limit": 3, "cursor": page["next_cursor"]}).json()
+        self.assertEqual([row["title"] for row in page["results"]], ["Item 1", "Item 0"])
+        self.assertIsNone(page["next_cursor"])
+
+    def test_listings_by_ids_keep_the_requested_order(self):
+        ids = [self.listings[3].id, self.listings[0].id, 999999]
+        response = self.client.get(reverse("api_listings"), {"ids": ",".join(map(str, ids)), "fields": "id"})
+        self.assertEqual(response.json(), {"results": [{"id": ids[0]}, {"id": ids[1]}]})
+
+    def test_ids_and_cursors_outside_the_id_range_are_rejected(self):
+        url = reverse("api_listings")
+        for ids in (str(2**64), "0", f"{self.listings[0].id},-1"):
+            response = self.client.get(url, {"ids": ids})
+            self.assertEqual(response.status_code, 400, ids)
+        self.assertEqual(self.client.get(url, {"cursor": str(2**64)}).json()["results"][0]["id"], self.listings[4].id)
+
+    def test_bids_comments_and_errors(self):
+        listing = self.listings[0]
+        place_bid(listing.id, self.bidder, Decimal("2.00"))
+        place_bid(listing.id, self.seller, Decimal("3.00"))
+        Comment.objects.create(comment="Nice", listing=listing, author=self.bidder)
+
+        bids = self.client.get(reverse("api_listing_bids", args=(listing.id,))).json()["results"]
+        self.assertEqual([(bid["amount"], bid["bidder"]) for bid in bids], [("3.00", "seller"), ("2.00", "bidder")])
+        comments = self.client.get(reverse("api_listing_comments", args=(listing.id,))).json()["results"]
+        self.assertEqual(comments[0]["author"], "bidder")
+
+        self.assertEqual(self.client.get(reverse("api_listing_bids", args=(999999,))).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_listing", args=(listing.id,)), {"fields": "secret"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("api_listings"), {"limit": 1000}).status_code, 400)
+        self.assertEqual(self.client.post(reverse("api_listings")).status_code, 405)
+
+    def test_watchlist_needs_a_signed_in_user(self):
+        self.assertEqual(self.client.get(reverse("api_watchlist")).status_code, 401)
+
+        self.client.force_login(self.bidder)
+        self.listings[1].watchlist.add(self.bidder)
+        results = self.client.get(reverse("api_watchlist"), {"fields": "title"}).json()["results"]
+        self.assertEqual(results, [{"id": self.listings[1].id, "title": "Item 1"}])
+
+
+class BidHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def test_bids_are_rolled_up_per_hour_as_they_are_placed(self):
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        with mock.patch("auctions.bidding.timezone.now", return_value=start + timedelta(minutes=5)):
+            place_bid(self.listing.id, self.bidder, Decimal("2.00"))
+            place_bid(self.listing.id, self.seller, Decimal("4.00"))
+        with mock.patch("auctions.bidding.timezone.now", return_value=start + timedelta(hours=1, minutes=1)):
+            place_bid(self.listing.id, self.bidder, Decimal("5.00"))
+
+        rollups = list(BidRollup.objects.filter(listing=self.listing).order_by("period_start").values_list("bid_count", "low", "high"))
+        self.assertEqual(rollups, [(2, Decimal("2.00"), Decimal("4.00")), (1, Decimal("5.00"), Decimal("5.00"))])
+        self.assertEqual(Bid.objects.filter(listing=self.listing).latest("id").created_at, start + timedelta(hours=1, minutes=1))
+
+        # Rebuilding from the Bid table gives the same rows.
+        call_command("rebuild_bid_rollups", stdout=StringIO())
+        self.assertEqual(list(BidRollup.objects.filter(listing=self.listing).order_by("period_start").values_list("bid_count", "low", "high")), rollups)
+
+    def test_bid_history_is_paginated_newest_first(self):
+        for amount in range(2, 6):
+            place_bid(self.listing.id, self.bidder, Decimal(amount))
+        url = reverse("bid_history", args=(self.listing.id,))
+
+        with mock.patch.object(views, "BID_HISTORY_PAGE_SIZE", 3):
+            response = self.client.get(url)
+            self.assertEqual([bid.bid for bid in response.context["all_bids"]], [Decimal("5.00"), Decimal("4.00"), Decimal("3.00")])
+            self.assertEqual(len(response.context["rollups"]), 1)
+
+            response = self.client.get(url, {"cursor": response.context["next_cursor"]})
+            self.assertEqual([bid.bid for bid in response.context["all_bids"]], [Decimal("2.00")])
+            self.assertIsNone(response.context["next_cursor"])
+
+        rollups = self.client.get(reverse("api_listing_bid_rollups", args=(self.listing.id,))).json()["results"]
+        self.assertEqual((rollups[0]["bid_count"], rollups[0]["high"]), (4, "5.00"))
+
+
+class StructuredLoggingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.listing = create_listings(cls.user, 1)[0]
+
+    def test_describing_a_queryset_never_runs_it(self):
+        listings = Listing.objects.filter(is_open=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(describe(listings), "<QuerySet Listing (not evaluated)>")
+            self.assertEqual(describe({"listing": self.listing, "amount": Decimal("2.50")}), {"listing": f"Listing:{self.listing.id}", "amount": "2.50"})
+
+    def test_events_are_formatted_as_json_lines(self):
+        logger = logging.getLogger("auctions.tests.structured")
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, "bid.placed", (), None,
+                                   extra={"event_fields": {"listing_id": 3, "listings": Listing.objects.all()}})
+        entry = json.loads(StructuredFormatter().format(record))
+        self.assertEqual((entry["event"], entry["listing_id"], entry["listings"]), ("bid.placed", 3, "<QuerySet Listing (not evaluated)>"))
+
+    def test_sampling_drops_info_but_keeps_warnings(self):
+        never = SamplingFilter(0)
+        logger = logging.getLogger("auctions.tests.sampled")
+        self.assertFalse(never.filter(logger.makeRecord(logger.name, logging.INFO, __file__, 1, "event", (), None)))
+        self.assertTrue(never.filter(logger.makeRecord(logger.name, logging.ERROR, __file__, 1, "event", (), None)))
+
+    def test_app_records_reach_the_project_handlers_by_default(self):
+        # Without AUCTIONS_LOG_QUEUE the "auctions" logger is left to LOGGING and propagates to the root handlers.
+        logger = logging.getLogger("auctions")
+        self.assertTrue(logger.propagate)
+        self.assertFalse(logger.handlers)
+
+    def test_comment_view_logs_an_event_instead_of_printing(self):
+        self.client.force_login(self.user)
+        with self.assertLogs("auctions.views", logging.INFO) as logs, mock.patch("builtins.print") as printed:
+            self.client.post(reverse("comment", args=(self.listing.id,)), {"comment": "Hello"})
+        self.assertIn("comment.created", logs.output[0])
+        printed.assert_not_called()
+
+
+class ProfilerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.admin = User.objects.create_user("admin", "admin@example.com", "password", is_staff=True)
+        create_listings(cls.seller, 3)
+
+    def setUp(self):
+        cache.clear()
+        profiling.samples.clear()
+
+    def test_requests_are_measured_per_route(self):
+        with self.modify_settings(MIDDLEWARE={"append": "auctions.profiling.ProfilerMiddleware"}):
+            self.client.get(reverse("index"))
+            self.client.get(reverse("index"))
+            self.client.get(reverse("categories"))
+
+        routes = {route["route"]: route for route in profiling.report()["routes"]}
+        self.assertEqual(routes["index"]["requests"], 2)
+        self.assertGreater(routes["index"]["avg_sql_count"], 0)
+        self.assertGreater(routes["index"]["avg_template_ms"], 0)
+        self.assertEqual(routes["index"]["n_plus_one"], [])
+
+    def test_repeated_queries_are_flagged_as_n_plus_one(self):
+        def view(request):
+            for listing in Listing.objects.only("id"):
+                User.objects.filter(pk=self.seller.id).exists()
+            return HttpResponse()
+
+        request = RequestFactory().get(reverse("index"))
+        request.resolver_match = resolve(reverse("index"))
+        with self.settings(AUCTIONS_PROFILER_N_PLUS_ONE=3), self.assertLogs("auctions.profiling", logging.WARNING):
+            profiling.ProfilerMiddleware(view)(request)
+
+        route = profiling.report()["routes"][0]
+        self.assertEqual(route["avg_sql_count"], 4)
+        self.assertEqual(route["n_plus_one"][0]["max_per_request"], 3)
+
+    def test_report_is_for_staff_only(self):
+        self.assertEqual(self.client.get(reverse("profiler_report")).status_code, 302)
+        self.client.force_login(self.admin)
+        self.assertIn("routes", self.client.get(reverse("profiler_report")).json())
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    def test_seeded_data_is_consistent_and_cleaned_up(self):
+        world = seed("benchtest", users=5, listings=20, bids=200, comments=10, watches=10, rng=random.Random(1))
+
+        busiest = Listing.objects.get(pk=world.listing_ids[0])
+        self.assertEqual(busiest.bid_count, Bid.objects.filter(listing=busiest).count())
+        self.assertEqual(busiest.leading_bid.bid, busiest.bid)
+        self.assertEqual(sum(BidRollup.objects.filter(listing=busiest).values_list("bid_count", flat=True)), busiest.bid_count)
+        self.assertEqual(sum(Category.objects.values_list("open_listings", flat=True)), 20)
+
+        cleanup("benchtest")
+        self.assertFalse(Listing.objects.exists())
+        self.assertEqual(sum(Category.objects.values_list("open_listings", flat=True)), 0)
+
+    def test_suite_reports_every_scenario(self):
+        out = StringIO()
+        call_command("bench_suite", "--users", "3", "--listings", "10", "--bids", "30", "--iterations", "3", stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report["scenarios"]), {"browse_feed", "open_listing", "bid_war", "watchlist_toggle", "comment", "close"})
+        self.assertEqual(report["scenarios"]["open_listing"]["errors"], 0)
+        self.assertGreater(report["scenarios"]["open_listing"]["queries_per_request"], 0)
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {"scenarios": {"open_listing": {"p95_ms": 10.0, "throughput_rps": 100.0, "queries_per_request": 4.0, "errors": 0}}}
+        same = {"scenarios": {"open_listing": {"p95_ms": 11.0, "throughput_rps": 95.0, "queries_per_request": 4.0, "errors": 0}}}
+        worse = {"scenarios": {"open_listing": {"p95_ms": 20.0, "throughput_rps": 95.0, "queries_per_request": 5.0, "errors": 0}}}
+        self.assertEqual(compare(same, baseline, 0.2), [])
+        self.assertEqual(len(compare(worse, baseline, 0.2)), 2)
+
+
+class CatalogImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(MEDIA_ROOT=f"{self.directory}/media")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        upload = BytesIO()
+        Image.new("RGB", (10, 10), "red").save(upload, "PNG")
+        with open(f"{self.directory}/lamp.png", "wb") as file:
+            file.write(upload.getvalue())
+
+    def write_csv(self, rows):
+        path = f"{self.directory}/catalog.csv"
+        with open(path, "w") as file:
+            file.write("title,description,bid,category,image\n")
+            file.writelines(f"{row}\n" for row in rows)
+        return path
+
+    def import_file(self, path, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("import_listings", path, "--seller", "seller", *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_import_creates_listings_in_batches(self):
+        path = self.write_csv([
+            "Lamp,Red lamp,5.00,Home & Garden,lamp.png",
+            "Chair,Oak chair,12.50,home garden,lamp.png",
+            "Broken,No price,free,Home,lamp.png",
+            "Missing,No image,3.00,Toys,missing.png",
+        ])
+        self.import_file(path, "--batch-size", "2")
+
+        self.assertEqual(list(Listing.objects.order_by("id").values_list("title", "bid")), [("Lamp", Decimal("5.00")), ("Chair", Decimal("12.50"))])
+        first, second = Listing.objects.order_by("id")
+        # One stored image, and both spellings of the category are the same category.
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith("images/sha256/"))
+        self.assertEqual(first.category_id, second.category_id)
+        self.assertEqual(Category.objects.get(pk=first.category_id).open_listings, 2)
+        self.assertEqual([listing.id for listing in search_listings("oak")], [second.id])
+
+    def test_resume_skips_committed_rows(self):
+        path = self.write_csv([f"Item {number},Test item,1.00,,lamp.png" for number in range(5)])
+        with open(f"{path}.progress", "w") as file:
+            json.dump({"rows": 3}, file)
+        self.import_file(path, "--resume")
+
+        self.assertEqual(list(Listing.objects.order_by("id").values_list("title", flat=True)), ["Item 3", "Item 4"])
+        self.assertFalse(os.path.exists(f"{path}.progress"))
+
+    def test_resume_after_a_batch_committed_without_its_progress(self):
+        path = self.write_csv([f"Item {number},Test item,1.00,,lamp.png" for number in range(4)])
+        committed = create_listings(self.seller, 2)
+        # Interrupted between the commit of rows 3-4 and the progress update.
+        with open(f"{path}.progress", "w") as file:
+            json.dump({"rows": 2, "pending": {"rows": 4, "id": committed[0].id, "title": "Item 0"}}, file)
+        self.import_file(path, "--resume")
+        self.assertEqual(Listing.objects.count(), 2)
+
+        # Interrupted before the commit: the pending batch is imported again.
+        with open(f"{path}.progress", "w") as file:
+            json.dump({"rows": 2, "pending": {"rows": 4, "id": committed[-1].id + 100, "title": "Item 2"}}, file)
+        self.import_file(path, "--resume")
+        self.assertEqual(list(Listing.objects.order_by("id").values_list("title", flat=True))[2:], ["Item 2", "Item 3"])
+
+    def test_bad_image_references_only_skip_their_row(self):
+        path = self.write_csv([
+            "Escape,Outside the storage,1.00,,../../etc/passwd",
+            "Url,Malformed URL,1.00,,http://exa mple.com:port/a.png",
+            "Lamp,Red lamp,5.00,,lamp.png",
+        ])
+        self.import_file(path)
+        self.assertEqual(list(Listing.objects.values_list("title", flat=True)), ["Lamp"])
+
+    def test_export_round_trips_through_import(self):
+        # Images already in storage are referenced as they are.
+        with open(f"{self.directory}/lamp.png", "rb") as file:
+            default_storage.save("images/test.png", file)
+        create_listings(self.seller, 5)
+        path = f"{self.directory}/export.jsonl"
+        with CaptureQueriesContext(connection) as queries:
+            call_command("export_listings", "--output", path, "--chunk-size", "2", stdout=StringIO())
+        # Every row comes from the one values_list() query.
+        self.assertEqual(len(queries), 1)
+
+        with open(path) as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual([row["id"] for row in rows], list(Listing.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual(rows[0]["seller"], "seller")
+
+        Listing.objects.all().delete()
+        self.import_file(path)
+        self.assertEqual(Listing.objects.count(), 5)
+
+
+class AdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.category = category_for_name("Home")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f"admin:auctions_{model}_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        listings = create_listings(self.seller, 3, category=self.category)
+        for listing in listings:
+            Bid.objects.create(listing=listing, placedBy=self.seller, bid=Decimal("2.00"))
+            Comment.objects.create(listing=listing, author=self.seller, comment="Nice")
+        counts = {model: self.changelist_queries(model) for model in ("listing", "bid", "comment")}
+
+        listings = create_listings(self.seller, 10, category=self.category)
+        for listing in listings:
+            Bid.objects.create(listing=listing, placedBy=self.seller, bid=Decimal("2.00"))
+            Comment.objects.create(listing=listing, author=self.seller, comment="Nice")
+        self.assertEqual({model: self.changelist_queries(model) for model in counts}, counts)
+
+    def test_close_action_closes_in_batches(self):
+        listings = create_listings(self.seller, 3, category=self.category)
+        change_open_listings(self.category.id, 3)
+        Bid.objects.create(listing=listings[0], placedBy=self.admin, bid=Decimal("2.00"))
+
+        with mock.patch("auctions.admin.CLOSE_BATCH_SIZE", 2), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:auctions_listing_changelist"), {
+                "action": "close_auctions", "_selected_action": [listing.id for listing in listings]
+            })
+
+        self.assertFalse(Listing.objects.filter(is_open=True).exists())
+        self.assertEqual(AuctionResult.objects.count(), 3)
+        self.assertEqual(Category.objects.get(pk=self.category.id).open_listings, 0)
+
+    def test_close_action_needs_change_permission(self):
+        staff = User.objects.create_user("staff", "staff@example.com", "password", is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename="view_listing"))
+        listing = create_listings(self.seller, 1)[0]
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("admin:auctions_listing_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "close_auctions")
+
+        self.client.post(reverse("admin:auctions_listing_changelist"), {"action": "close_auctions", "_selected_action": [listing.id]})
+        self.assertTrue(Listing.objects.get(pk=listing.id).is_open)
+
+    def test_spam_actions_delete_comments(self):
+        spammer = User.objects.create_user("spammer", "spam@example.com", "password")
+        listing = create_listings(self.seller, 1)[0]
+        spam = [Comment.objects.create(listing=listing, author=spammer, comment=f"Buy now {i}") for i in range(3)]
+        kept = Comment.objects.create(listing=listing, author=self.seller, comment="Nice lamp")
+
+        with mock.patch("auctions.admin.DELETE_BATCH_SIZE", 2):
+            self.client.post(reverse("admin:auctions_comment_changelist"), {
+                "action": "delete_spam_by_authors", "_selected_action": [spam[0].id]
+            })
+        self.assertEqual(list(Comment.objects.all()), [kept])
+
+        self.client.post(reverse("admin:auctions_comment_changelist"), {"action": "delete_spam", "_selected_action": [kept.id]})
+        self.assertFalse(Comment.objects.exists())
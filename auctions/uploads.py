@@ -0,0 +1,181 @@
+# Streaming upload handling for listing images.
+# ListingImageUploadHandler replaces Django's default upload handlers for the Create Listing form. It writes each
+# chunk straight to a temporary file while hashing it, checks the file type from its first bytes, and stops reading
+# a file as soon as it is larger than the limit. Memory use per upload is one chunk, whatever the file size.
+# https://docs.djangoproject.com/en/5.0/topics/http/file-uploads/#upload-handlers
+
+# Images are then stored under their SHA-256, e.g. images/sha256/3f/a2/3fa2...9c.jpg, so the same photo uploaded
+# for several listings is stored once.
+# The stored file is public and is shown until the resized copies exist (images.py), so camera metadata (EXIF with
+# GPS positions, XMP, comments) is removed from it first: the file is re-saved without it and hashed after that.
+# https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html
+
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+
+# Largest image accepted, in bytes. Set AUCTIONS_MAX_IMAGE_BYTES in settings.py to change it.
+DEFAULT_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Image type -> (file signature check, file extension).
+# https://en.wikipedia.org/wiki/List_of_file_signatures
+IMAGE_TYPES = {
+    "image/jpeg": (lambda head: head.startswith(b"\xff\xd8\xff"), "jpg"),
+    "image/png": (lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"), "png"),
+    "image/gif": (lambda head: head[:6] in (b"GIF87a", b"GIF89a"), "gif"),
+    "image/webp": (lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP", "webp"),
+}
+
+# Number of bytes needed to recognise every type above.
+SIGNATURE_LENGTH = 12
+
+# Image.info keys that hold metadata rather than pixels.
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+
+# Image type -> Pillow save options when an image is re-saved without its metadata. JPEG keeps the source's
+# quantization tables, so the pixels are not degraded by another round of compression. An empty comment stops Pillow
+# from copying the source's comment.
+STRIP_OPTIONS = {
+    "image/jpeg": {"quality": "keep", "comment": b""},
+    "image/png": {},
+    "image/gif": {"comment": b""},
+    "image/webp": {"quality": 90},
+}
+
+# EXIF tag kept when the rest is dropped, so photos are still shown the right way up.
+# https://exiftool.org/TagNames/EXIF.html
+ORIENTATION = 0x0112
+
+
+def max_image_bytes():
+    return getattr(settings, "AUCTIONS_MAX_IMAGE_BYTES", DEFAULT_MAX_IMAGE_BYTES)
+
+
+def detect_image_type(head):
+    # The image type for the first bytes of a file, or None if it is not a supported image.
+    for content_type, (matches, extension) in IMAGE_TYPES.items():
+        if matches(head):
+            return content_type
+    return None
+
+
+class ListingImageUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to disk, hashing them on the way.
+    Files that are too large or not a supported image are skipped and the reason is kept in self.errors
+    (field name -> message). Accepted files get .sha256 and .image_type attributes.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.image_type = None
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def skip(self, message):
+        self.errors[self.field_name] = message
+        self.file.close()
+        # SkipFile makes Django discard the rest of this file without buffering it, then carry on with the other fields.
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > max_image_bytes():
+            self.skip(f"The image must be smaller than {filesizeformat(max_image_bytes())}.")
+
+        if self.image_type is None:
+            self.head += raw_data[:SIGNATURE_LENGTH - len(self.head)]
+            if len(self.head) >= SIGNATURE_LENGTH:
+                self.image_type = detect_image_type(self.head)
+                if self.image_type is None:
+                    self.skip("The image must be a JPEG, PNG, GIF or WebP file.")
+
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.image_type is None:
+            # Files shorter than the signature.
+            self.image_type = detect_image_type(self.head)
+            if self.image_type is None:
+                self.errors[self.field_name] = "The image must be a JPEG, PNG, GIF or WebP file."
+                self.file.close()
+                return None
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_type = self.image_type
+        self.file.sha256 = self.hash.hexdigest()
+        self.file.image_type = self.image_type
+        return self.file
+
+
+def image_path(digest, image_type):
+    extension = IMAGE_TYPES[image_type][1]
+    return f"images/sha256/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+
+def content_path(uploaded_file):
+    return image_path(uploaded_file.sha256, uploaded_file.image_type)
+
+
+def strip_metadata(file, image_type):
+    """
+    The bytes of the image in file re-saved without its metadata, or None if it has none and can be stored as it is.
+    Raises ValueError if the image cannot be decoded.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            exif = image.getexif()
+            if not exif and not any(key in image.info for key in METADATA_KEYS):
+                return None
+            options = dict(STRIP_OPTIONS[image_type])
+            if exif.get(ORIENTATION, 1) != 1:
+                kept = Image.Exif()
+                kept[ORIENTATION] = exif[ORIENTATION]
+                options["exif"] = kept
+            if "icc_profile" in image.info:
+                # Colour profile, not metadata about the photo.
+                options["icc_profile"] = image.info["icc_profile"]
+            if getattr(image, "n_frames", 1) > 1:
+                options["save_all"] = True
+            output = BytesIO()
+            image.save(output, image.format, **options)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise ValueError("The image could not be read.")
+    finally:
+        file.seek(0)
+    return output.getvalue()
+
+
+def store_listing_image(uploaded_file):
+    """
+    Save an image received by ListingImageUploadHandler under its content hash and return the storage path.
+    Metadata is removed first (see strip_metadata(), which raises ValueError for an unreadable image).
+    If the same image was uploaded before, the stored file is reused.
+    """
+    stripped = strip_metadata(uploaded_file, uploaded_file.image_type)
+    if stripped is None:
+        path = content_path(uploaded_file)
+    else:
+        path = image_path(hashlib.sha256(stripped).hexdigest(), uploaded_file.image_type)
+        uploaded_file = ContentFile(stripped)
+    if not default_storage.exists(path):
+        # If two uploads of a new image race, storage gives the second one a different name - still a valid file.
+        path = default_storage.save(path, uploaded_file)
+    return path
@@ -1,22 +1,46 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, profiling, views
+
+
+# Read-only pages have async versions for ASGI deployments. See the "Async read views" section of views.py.
+if getattr(settings, "AUCTIONS_ASYNC_VIEWS", False):
+    read_views = {
+        "index": views.index_async,
+        "listing": views.listing_async,
+        "watchList": views.watchList_async,
+        "categories": views.categories_async,
+        "category": views.category_async,
+    }
+else:
+    read_views = {
+        "index": views.index,
+        "listing": views.listing,
+        "watchList": views.watchList,
+        "categories": views.categories,
+        "category": views.category,
+    }
 
 urlpatterns = [
-    path("", views.index, name="index"),
+    path("", read_views["index"], name="index"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     # Add path to create a new listing.
     path("new_listing", views.new_listing, name="new_listing"),
     # Add path to listing page.
-    path("listing/<int:id>", views.listing, name="listing"),
+    path("listing/<int:id>", read_views["listing"], name="listing"),
+    # Add path to the live updates (Server-Sent Events) for a listing page.
+    path("listing/<int:id>/events", views.listing_events, name="listing_events"),
     # Add path to add an item/listing to the user's Watchlist
     path("add_to_watchlist/<int:id>", views.add_to_watchlist, name="add_to_watchlist"),
     # Add path to remove an item/listing from the user's Watchlist
     path("remove_from_watchlist/<int:id>", views.remove_from_watchlist, name="remove_from_watchlist"),
     # Add path to watchlist page.
-    path("watchList", views.watchList, name="watchList"),
+    path("watchList", read_views["watchList"], name="watchList"),
+    # Add path to a listing's bid history.
+    path("listing/<int:id>/bids", views.bid_history, name="bid_history"),
     # Add path to place a bid.
     path("bid/<int:id>", views.bid, name="bid"),
     # Add path to close a listing or auction.
@@ -24,7 +48,23 @@ urlpatterns = [
     # Add path to add a comment.
     path("comment/<int:id>", views.comment, name="comment"),
     # Add path to categories.
-    path("categories", views.categories, name="categories"),
-    # Add path to categories.
-    path("category/<str:name>", views.category, name="category")
+    path("categories", read_views["categories"], name="categories"),
+    # Add path to a category page, looked up by the category slug.
+    path("category/<slug:slug>", read_views["category"], name="category"),
+    # Add path to the auctions the user won.
+    path("wins", views.wins, name="wins"),
+    # Add path to the user's notifications.
+    path("notifications", views.notifications, name="notifications"),
+    # Add path to search listings.
+    path("search", views.search, name="search"),
+    # JSON read API, version 1 (see api.py).
+    path("api/v1/listings", api.listings, name="api_listings"),
+    path("api/v1/listings/<int:id>", api.listing, name="api_listing"),
+    path("api/v1/listings/<int:id>/bids", api.listing_bids, name="api_listing_bids"),
+    path("api/v1/listings/<int:id>/bid_rollups", api.listing_bid_rollups, name="api_listing_bid_rollups"),
+    path("api/v1/listings/<int:id>/comments", api.listing_comments, name="api_listing_comments"),
+    path("api/v1/categories", api.categories, name="api_categories"),
+    path("api/v1/watchlist", api.watchlist, name="api_watchlist"),
+    # Request profiler report, staff only (see profiling.py).
+    path("profiler", profiling.profiler_report, name="profiler_report")
 ]
@@ -1,29 +1,81 @@
+import asyncio
+import json
+import logging
+
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 
-from .models import User, Listing, Bid, Comment
+from .models import User, AuctionResult, BidRollup, Category, Listing, Bid, Comment, Notification
 # Use Django to create the forms from the model.
 from .forms import CreateListingForm, CreateBidForm, CreateCommentForm
+# Bid writes.
+from .bidding import parse_bid_amount, place_bid
+# Category directory.
+from .categories import acategory_directory, category_directory, category_for_name
+# Live listing updates.
+from .live import get_broker, listing_channel, publish_listing_event
+# Listing image thumbnails.
+from .images import schedule_image_processing
+# Listing image uploads.
+from .uploads import ListingImageUploadHandler, store_listing_image
+# Listing search.
+from .search import search_listings
+# Closing auctions.
+from .closing import close_listing, parse_end_time
+# Cached watchlists.
+from .watchlists import auser_watched_ids, unwatch, user_watched_ids, watch, watchlist_cards
+# Cached listing HTML.
+from .fragments import (
+    acached_fragment, alisting_version, alisting_versions, bump_listing_version, cached_fragment, listing_version, listing_versions
+)
+# Read-side data loaders.
+from .queries import active_listings_page, aactive_listings_page, parse_cursor, split_page, listing_detail, alisting_detail
+# ETags for conditional GET.
+from .conditional import categories_etag, category_etag, category_last_modified, index_etag, listing_etag, listing_last_modified
+# Structured event logging (instead of print()).
+from .logs import get_logger, log_event
+
+# Events go to the project's LOGGING handlers (see logs.py). Sample busy views with AUCTIONS_LOG_SAMPLING = {"auctions.views": 0.1}.
+logger = get_logger(__name__)
+
+# Number of notifications shown on the Notifications page.
+NOTIFICATIONS_PAGE_SIZE = 50
+
+# Number of bids, and of hourly rollups, shown on one page of a listing's bid history.
+BID_HISTORY_PAGE_SIZE = 50
+BID_HISTORY_ROLLUPS = 48
 
 # Use Decimal() to convert the bid input by the user as a string to a decimal.
 from decimal import Decimal
 
 
+# A browser that already has the current page gets 304 Not Modified (see conditional.py).
+@vary_on_cookie
+@condition(etag_func=index_etag)
 def index(request):
 
     """
     Active Listings: 
     The default/index route should allow users to view all of the currently active auction listings. 
     For each active listing, the page will display the title, description, current price, and photo (if one exists for the listing).
+    Only open listings are shown, one page at a time. ?cursor=<id> selects the page after the listing with that id.
     """
 
-    all_listings = Listing.objects.all()
+    cursor = parse_cursor(request.GET.get("cursor"))
+    all_listings, next_cursor = active_listings_page(cursor)
 
     context = {
-       "all_listings": all_listings
+       "all_listings": all_listings,
+       "next_cursor": next_cursor,
+       # The cached listing cards are looked up by version (see fragments.py). One cache round trip for the page.
+       "listing_versions": listing_versions([listing.id for listing in all_listings])
     }
     return render(request, "auctions/index.html", context)
 
@@ -86,7 +138,18 @@ They will be able to enter the listing title, description, category, image, and
 Users should also optionally be able to provide a URL for an image for the listing.
 """
 
+# The upload handlers must be replaced before CsrfViewMiddleware reads request.POST, so CSRF is checked inside the view.
+# https://docs.djangoproject.com/en/5.0/topics/http/file-uploads/#modifying-upload-handlers-on-the-fly
+@csrf_exempt
 def new_listing(request):
+    # Stream the image to disk while hashing it, and reject large or non-image files without buffering them.
+    image_upload = ListingImageUploadHandler(request)
+    request.upload_handlers = [image_upload]
+    return _new_listing(request, image_upload)
+
+
+@csrf_protect
+def _new_listing(request, image_upload):
     
     title = "Create Listing"
 
@@ -96,7 +159,8 @@ def new_listing(request):
         # Image data will be stored in the request.FILES object.
         # https://docs.djangoproject.com/en/5.0/ref/forms/api/#binding-uploaded-files-to-a-form
         listing_data = CreateListingForm(request.POST, request.FILES)
-        print('Listing Data:', listing_data)
+        # Logs the names of the submitted fields - the form is not rendered.
+        log_event(logger, "listing.form_received", logging.DEBUG, form=listing_data, user_id=request.user.id)
 
         # if listing_data.is_valid(): # ValueError at /new_listing - The view auctions.views.new_listing didn't return an HttpResponse object. It returned None instead.
             
@@ -113,10 +177,34 @@ def new_listing(request):
         
         user = user_name
 
+        # Optional end time. The close_auctions worker closes the auction when it is reached.
+        ends_at = parse_end_time(listing_data["ends_at"].value())
+        if ends_at is not None and ends_at <= timezone.now():
+            return render(request, "auctions/new_listing.html", {
+                "title": title,
+                "form": listing_data,
+                "message": "The end time must be in the future."
+            })
+
         # https://docs.djangoproject.com/en/5.0/topics/http/file-uploads/
         # https://docs.djangoproject.com/en/5.0/ref/forms/api/#binding-uploaded-files
-        image = request.FILES["image"] # WORKS!!!!!!!!
-        print('Image:', image)
+        image = request.FILES.get("image")
+        if image is None:
+            return render(request, "auctions/new_listing.html", {
+                "title": title,
+                "form": listing_data,
+                "message": image_upload.errors.get("image", "Please choose an image for the listing.")
+            })
+
+        # Identical images are stored once, under their content hash, without their camera metadata.
+        try:
+            image = store_listing_image(image)
+        except ValueError as error:
+            return render(request, "auctions/new_listing.html", {
+                "title": title,
+                "form": listing_data,
+                "message": str(error)
+            })
 
         # Save the listing_data form values to the auctions database.
         # https://docs.djangoproject.com/en/5.0/topics/db/queries/
@@ -126,12 +214,20 @@ def new_listing(request):
                 description=description, 
                 # https://stackoverflow.com/questions/72062094/i-got-decimal-invalidoperation-class-decimal-conversionsyntax
                 bid=Decimal(bid), 
-                category=category,
+                # Free text from the form - any spelling of an existing category is matched to it by slug.
+                category=category_for_name(category),
                 image=image,
+                ends_at=ends_at,
                 createdBy=user
                 )        
         
-        listing_data.save() 
+        # Save the listing and count it in its category in one transaction (categories.listing_saved counts it).
+        with transaction.atomic():
+            listing_data.save()
+            # Thumbnails are made in a worker thread after the transaction commits.
+            schedule_image_processing(listing_data.id)
+
+        log_event(logger, "listing.created", listing_id=listing_data.id, category_id=listing_data.category_id, user_id=user.id)
 
         # Redirect to index.html
         # https://www.geeksforgeeks.org/django-modelform-create-form-from-models/
@@ -139,10 +235,11 @@ def new_listing(request):
         #     "message": "Your new listing was saved." # !!!!!! NOT WORKING - Listings were created but the message is not displayed. !!!!!!
         # })
 
-        all_listings = Listing.objects.all()
+        all_listings, next_cursor = active_listings_page()
 
         return render(request, "auctions/index.html", {
             "all_listings": all_listings,
+            "next_cursor": next_cursor,
             "new_listing_message": "Your new listing was saved."
         })
              
@@ -160,122 +257,121 @@ Listing Page: Clicking on a listing should take users to a page specific to that
 On that page, users should be able to view all details about the listing, including the current price for the listing.
 """
 
+@vary_on_cookie
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def listing(request, id):
-    
-    item_id = id
-    # print("Item id:", item_id) # Returns ID
-    # print("ID Type", type(item_id)) # <class 'int'>
-
-    # Retrieve a specific row in the database table Listings.
-    # https://www.w3schools.com/django/django_queryset_get.php
-    listing_data = Listing.objects.filter(pk=item_id) #.values() # Returns iterable QuerySet with or without .values()
-    # listing_data = Listing.objects.get(pk=item_id) # Returns Platter 1 / Art - .get() retrieves a single object - Listing object is not iterable
-    # If I wanted to use the above .get() I'd have to place listing_data in the context and access each in the html as listing_data.title, listing_data.description, listing_data.description.bid, etc. without a 'for loop'.
-    # print("Listing Data:", listing_data) # Returns QuerySet
-    
-    # Watchlist Database Queries
-    # Does the user have this item on their watch_list?
-    # Get user
-    user_name = request.user
-    # print("User Name:", user_name) # Returns user's name
-    # user_id = request.user.id
-    # print("User ID:", user_id) # Returns user's ID
-
-    # https://stackoverflow.com/questions/4319469/queryset-object-has-no-attribute-error-trying-to-get-related-data-on-manytoma
-    get_listing_data = Listing.objects.get(pk=item_id) # Retrieves a single Listing object - Returns title / category
-    # print("Get Listing Data:", get_listing_data)
-    watchlist_data = get_listing_data.watchlist.all() # Returns QuerySet of users linked to the listing's watchlist.
-    # print("Watchlist Data:", watchlist_data)
-   
-    # user_is_watching = False
-    user_is_watching = user_name in watchlist_data
-
-    # Add Bid form if the user is signed in.
-    # form = CreateBidForm() # When this form is submitted, it also expects an argument to the add to/remove from watchlist path. Will hardcode form in HTML for now. # Error Message: NoReverseMatch at /bid/3 - Reverse for 'add_to_watchlist' with arguments '('',)' not found. 1 pattern(s) tried: ['add_to_watchlist/(?P<id>[0-9]+)\\Z']
-
-    # Get the current bid.
-    # https://stackoverflow.com/questions/25881015/django-queryset-return-single-value
-    # https://docs.djangoproject.com/en/5.0/ref/models/querysets/#values-list
-    # bid_data = Listing.objects.values_list("bid", flat=True) # Returns all bids
-    last_bid = Listing.objects.values_list("bid", flat=True).get(pk=item_id) # Returns bid for specified item or listing.
-    # print("Bid Data:", bid_data)
-         
-    # Show number of bids on the front end.
-    # ??!!!!!! I need total_bids fro specific listing!!!!!!??
-    # total_bids = len(Bid.objects.values_list("bid", flat=True)) # All listing bids in Bid table. 
-    total_bids = len(Bid.objects.filter(listing_id=item_id)) # All bids on one listing.
-    # print("Total Bids:", total_bids)
 
-    # If the total number of bids == 0:
-    # https://stackoverflow.com/questions/394809/does-python-have-a-ternary-conditional-operator
-    # a if condition else b
-    starting_bid = True if total_bids == 0 else False
-    # if total_bids == 0:
-        # starting_bid = True # HTML should read Starting Bid:
+    # Signed out visitors all get the same page, so it is cached whole until the listing changes (see fragments.py).
+    # A cached page needs no database query at all.
+    # The version is read before the listing (see listing_page_context()).
+    version = listing_version(id)
+    if not request.user.is_authenticated:
+        page = cached_fragment(
+            "anonymous-page", id,
+            lambda: render(request, "auctions/listing.html", listing_page_context(request, id, version)).content,
+            version=version
+        )
+        return HttpResponse(page)
 
-    # The user who created (createdBy) the listing may “close” the auction from listing.html.
-    # This makes the highest bidder the winner of the auction and makes the listing no longer active.
-    # print("Listing Created By:", get_listing_data.createdBy) # Returns the user who created the listing.
+    return render(request, "auctions/listing.html", listing_page_context(request, id, version))
 
-    # Boolean check to find if the current user created this listing.
-    creator = user_name == get_listing_data.createdBy 
-    # print("Creator:", creator) # Returns True or False.
 
-    # Check if Listing.is_open
-    listing_is_open = get_listing_data.is_open
+def listing_page_context(request, item_id, version=None):
+    # Context for listing.html. Also used by the views that render the listing page after a POST (bid).
+    user_name = request.user
+
+    # The listing's version is read before its data and given to the {% listingfragment %} tags. A bid that commits
+    # in between bumps the version after this read, so the HTML rendered from older data is cached under the old
+    # version and never served for the new one.
+    if version is None:
+        version = listing_version(item_id)
 
-    # Get the last or highest bid and the user who placed it to determine the winner.
-    highest_bid_amount = Listing.objects.values_list("bid", flat=True).get(pk=item_id)
-    print("Highest Bid Amount:", highest_bid_amount)
+    # Retrieve the listing with its creator, bid summary and watchlist flag, and its comments.
+    # The number of queries does not depend on how many bids, watchers or comments the listing has.
+    item, all_comments = listing_detail(item_id, user_name)
 
-    # Search Bid table for the item_id with the highest_bid and find the user who placed that bid.
+    context = listing_context(user_name, item_id, item, all_comments)
+    context["listing_versions"] = {item_id: version}
+    return context
 
-    # Error for new listings - Bid matching query does not exist. The Listing and Bid table bid field are not connected. No bid has been placed yet but the program is looking for that information.
 
-    # If Bid.bid does not exist - instructions OR make bid a foreign key. 
-    all_bids_for_item = Bid.objects.filter(listing_id=item_id)
-    print("All Bids for Item:", all_bids_for_item)
+def listing_context(user_name, item_id, item, all_comments):
+    # Build the listing.html context from the loaded listing and comments. Shared by the sync and async listing views.
 
-    # Check to determine if all_bids_for_item is an empty QuerySet.
-    # https://stackoverflow.com/questions/1387727/checking-for-empty-queryset-in-django
-    if not all_bids_for_item:
-        # This is the Starting Bid - Highest bidder is set to 0 which is no user's id.
-        highest_bidder_id = 0        
-    else: 
-        # Get the bid that equals the highest bid.
-        highest_bid = all_bids_for_item.get(bid=highest_bid_amount)
-        print("Highest Bid:", highest_bid)
+    # If the total number of bids == 0:
+    # https://stackoverflow.com/questions/394809/does-python-have-a-ternary-conditional-operator
+    # a if condition else b
+    starting_bid = True if item.bid_count == 0 else False
+
+    # The user who created (createdBy) the listing may “close” the auction from listing.html.
+    # This makes the highest bidder the winner of the auction and makes the listing no longer active.
+    # Boolean check to find if the current user created this listing.
+    creator = user_name.id == item.createdBy_id
 
-        # Get the user who placed the highest bid.
-        highest_bidder_id = highest_bid.placedBy_id
-        print("Highest Bidder ID:", highest_bidder_id)
+    # Get the user who placed the highest bid to determine the winner. Closed auctions store their winner.
+    # This is the Starting Bid if there are no bids - Highest bidder is set to 0 which is no user's id.
+    if not item.is_open:
+        highest_bidder_id = item.winner_id or 0
+    else:
+        highest_bidder_id = item.leading_bid.placedBy_id if item.leading_bid else 0
 
     # Add bid form.
     bid_form = CreateBidForm()
 
     # Add comment form.
     comment_form = CreateCommentForm()
-
-    # Get all comments connected to this listing/item_id.
-    all_comments = Comment.objects.filter(listing=item_id)
-    print("All Comments:", all_comments)
         
     context = {
-        "listing_data": listing_data,
+        "listing": item,
         "item_id": item_id,
-        "user_is_watching": user_is_watching,
-        "bid": last_bid,
-        "total_bids": total_bids,
+        "user_is_watching": item.user_is_watching,
+        "watchers": item.watchers,
+        "bid": item.bid,
+        "total_bids": item.bid_count,
         "starting_bid": starting_bid,
         "bid_form": bid_form,
         "creator": creator,
-        "listing_is_open": listing_is_open,
+        "listing_is_open": item.is_open,
         "highest_bidder_id": highest_bidder_id,
         "comment_form": comment_form,
         "all_comments": all_comments
     }
     
-    return render(request, "auctions/listing.html", context)
+    return context
+
+
+"""
+Live updates: the listing page subscribes to /listing/<id>/events to be told about new bids, comments and the auction closing.
+This view is async and keeps the connection open, so it must be served through commerce/asgi.py.
+"""
+
+# Seconds between keep-alive comments, so proxies don't close an idle connection.
+EVENTS_KEEPALIVE = 20
+
+async def listing_events(request, id):
+
+    if not await Listing.objects.filter(pk=id).aexists():
+        raise Http404("No such listing.")
+
+    async def event_stream():
+        # The subscription is removed when the browser disconnects and Django closes this generator.
+        async with get_broker().subscribe(listing_channel(id)) as events:
+            # Ask the browser to wait 5 seconds before reconnecting.
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    # https://docs.djangoproject.com/en/5.0/ref/request-response/#streaminghttpresponse-objects
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 """
@@ -289,16 +385,14 @@ def add_to_watchlist(request, id):
     listing_id = id
     user_name = request.user
 
-    # https://docs.djangoproject.com/en/5.0/topics/db/queries/#saving-foreignkey-and-manytomanyfield-fields
-    # Saving ForeignKey and ManyToManyField fields
     # Get listing
-    get_listing_data = Listing.objects.get(pk=listing_id)
+    get_object_or_404(Listing.objects.only("id"), pk=listing_id)
 
     # If POST request
     if request.method == "POST":
 
-        # Update ManyToManyField using add(). Add user to the watchlist in the Listing table for the specified item.
-        get_listing_data.watchlist.add(user_name)
+        # Add the listing to the user's watchlist. The cached watchlist and watcher count are updated with it (see watchlists.py).
+        watch(user_name, listing_id)
         
         # Redirect to listing.html passing the argument 'id' for the listing.
         # https://stackoverflow.com/questions/52575418/reverse-with-prefix-argument-after-must-be-an-iterable-not-int
@@ -310,16 +404,14 @@ def remove_from_watchlist(request, id):
     listing_id = id
     user_name = request.user  
 
-    # https://docs.djangoproject.com/en/5.0/topics/db/queries/#many-to-many-relationships
-    # Remove items from a field in the database
     # Get listing
-    get_listing_data = Listing.objects.get(pk=listing_id)
+    get_object_or_404(Listing.objects.only("id"), pk=listing_id)
 
     # If POST request
     if request.method == "POST":        
 
-        # Update ManyToManyField using remove(). Remove the user from the watchlist in the Listing table for the specified item.
-        get_listing_data.watchlist.remove(user_name)
+        # Remove the listing from the user's watchlist. The cached watchlist and watcher count are updated with it.
+        unwatch(user_name, listing_id)
         
         # Redirect to listing.html passing the argument 'id' for the listing
         # https://stackoverflow.com/questions/52575418/reverse-with-prefix-argument-after-must-be-an-iterable-not-int
@@ -334,17 +426,17 @@ Clicking on any of the listings takes the user to that listing’s page.
 def watchList(request):
     user_name = request.user
 
-    # https://docs.djangoproject.com/en/5.0/topics/db/queries/#following-relationships-backward
-    # https://stackoverflow.com/questions/2642613/what-is-related-name-used-for
-    # Get all listings / watchlists for the current user
-    get_user_watchList = user_name.watch_list.all()
-    print("Get User WatchList", get_user_watchList)
+    # The ids come from the user's cached watchlist. The cards for those listings are loaded in one query.
+    if user_name.is_authenticated:
+        get_user_watchList = watchlist_cards(user_watched_ids(user_name))
+    else:
+        get_user_watchList = []
 
     context = {
         "watchList": get_user_watchList
     }
 
-    return render(request, "auctions/watchlist.html", context)
+    return render(request, "auctions/watchList.html", context)
 
 
 """
@@ -365,121 +457,39 @@ def bid(request, id):
     # There are multiple forms on the listing page and both are being submitted when one button is clicked. Error is displayed requesting other form.
 
     listing_id = id
-    print('Listing id:', listing_id, type(listing_id))
-
     user_name = request.user
-    # user_id = request.user.id
 
     # https://stackoverflow.com/questions/866272/how-can-i-build-multiple-submit-buttons-django-form
     # Determine which form to use
 
-    # If POST request and the arguments for add/remove from watchlist are empty OR select only the bid form OR prevent the add/remove from watchlist button
-    if request.method == "POST": # and (not add_to_watchlist or not remove_from_watchlist):
-       
-        print('Request:', request)
-
-        # Error NoReverseMatch... Reverse for 'comment' with arguments '('',)' not found. 1 pattern(s) tried: ['comment/(?P<id>[0-9]+)\\Z']
-        
-        """
-        THE LOGIC TO PLACE A BID WORKS WITH THE DJANGO FORM AND THE HARDCODED FORM. THE DATABASES ARE UPDATED WHEN CONDITIONS ARE MET. HOWEVER, THE PROGRAM CRASHES BECAUSE IT
-        IS ALSO EXPECTING AN ARGUMENT FOR THE COMMENT PATH. BEFORE IT WANTED THE ADD_TO/REMOVE_FROM_WATCHLIST PATH.
-
-        !!!!!! TRY WITH JAVASCRIPT !!!!!!
-        """
-        
-        print("Request Body:", request.body) # Returns b'csrfToken=djwi5iyo...&placeBid=10&placeBid=user_bid' - Result with a button with value="user_bid".
-
-        # Bid is placed but I get the above error NoReverseMatch. 
-        bid_amount = Decimal(request.POST['bid']) # Name from input element created by bid_form.
-
-        print("Bid Amount:", bid_amount)
-
-        # Capture the bid_amount value.
-        current_bid = bid_amount
-        print("Current Bid:", current_bid, type(current_bid)) 
-        
-        last_bid = Listing.objects.values_list("bid", flat=True).get(pk=listing_id) # Returns bid for specified item or listing.
-        print("Last Bid:", last_bid) 
-        print("Type Last Bid:", type(last_bid)) # <class 'decimal.Decimal'>
-        print("Type Current Bid:", type(current_bid)) # <class 'str'>
-
-        # https://stackoverflow.com/questions/4643991/python-converting-string-into-decimal-number
-        # If last bid is >= current bid stored in Listing table
-        # if last_bid < Decimal(current_bid): # InvalidOperation at /bid/3 - [<class 'decimal.ConversionSyntax'>] bid must be saved as Decimal(bid) from the user
-        if last_bid < current_bid:
-            # Capture listing object with the listing_id from Listing table to save and update Listing and Bid tables.
-            # listing = Listing.objects.filter(pk=listing_id) # ValueError at /bid/2 - Cannot assign "<QuerySet [<Listing: Platter 1 / Art>]>": "Bid.listing" must be a "Listing" instance.
-            # listing = Listing.objects.get(pk=listing_id) # # Cannot assign "2": "Bid.listing" must be a "Listing" instance. # IntegrityError at /bid/2 - NOT NULL constraint failed: auctions_bid.listing_id # IntegrityError at /bid/2 - NOT NULL constraint failed: auctions_listing.createdBy_id
-            listing = Listing.objects.filter(pk=listing_id).get(id=listing_id)
-            print("Listing:", listing)
-
-            # Save the Bid.
-            # Save bid, listing_id, and user_name
-            bid_data = Bid(
-                # https://stackoverflow.com/questions/72062094/i-got-decimal-invalidoperation-class-decimal-conversionsyntax
-                # bid=Decimal(current_bid),
-                bid=current_bid, 
-                listing=listing,
-                placedBy=user_name
-            )
-
-            bid_data.save()   
+    if request.method == "POST" and user_name.is_authenticated:
 
-            # THE FOLLOWING ERRORS WERE TELLING ME THAT I WAS NOT ACCESSING A SPECIFIC FIELD IN THE TABLE TO UPDATE. CORRECTION BELOW WITH update_listing.
-            # listing=listing, # Cannot assign "2": "Bid.listing" must be a "Listing" instance. # IntegrityError at /bid/2 - NOT NULL constraint failed: auctions_bid.listing_id # IntegrityError at /bid/2 - NOT NULL constraint failed: auctions_listing.createdBy_id
-            # listing=listing_id, # ValueError at /bid/2 - Cannot assign "2": "Bid.listing" must be a "Listing" instance.
+        # Use Decimal() to convert the bid input by the user as a string to a decimal.
+        current_bid = parse_bid_amount(request.POST.get("bid")) # Name from input element created by bid_form.
 
-            # Update the Listing bid / current bid.
-            # https://stackoverflow.com/questions/3681627/how-to-update-fields-in-a-model-without-creating-a-new-record-in-django
-            update_listing = Listing.objects.get(pk=listing_id)
-            # https://stackoverflow.com/questions/72062094/i-got-decimal-invalidoperation-class-decimal-conversionsyntax
-            # update_listing.bid = Decimal(current_bid)
-            update_listing.bid = current_bid
+        # The bid is accepted only if the auction is open and the bid is greater than the starting or current bid.
+        # place_bid() checks and saves in one database statement, so two users bidding at the same time can't both win.
+        new_bid = place_bid(listing_id, user_name, current_bid) if current_bid is not None else None
 
-            # update_listing = Listing(
-            #     bid=current_bid
-            #     # IntegrityError at /bid/2 - NOT NULL constraint failed: auctions_listing.createdBy_id
-            # )
+        if new_bid is not None:
+            log_event(logger, "bid.placed", listing_id=listing_id, bid_id=new_bid.id, amount=current_bid, user_id=user_name.id)
+        else:
+            log_event(logger, "bid.rejected", listing_id=listing_id, amount=current_bid, user_id=user_name.id)
 
-            update_listing.save()
+        context = listing_page_context(request, listing_id)
 
-            listing_data = Listing.objects.filter(pk=listing_id)
-            
-            return render(request, "auctions/listing.html", {
-                "listing data": listing_data,
-                "bid_success_message": "Bid was successful.", # Going to route /bid/5 but there's no bid.html????????
+        if new_bid is not None:
+            context.update({
+                "bid_success_message": "Bid was successful.",
                 "bid_placed": True
-            }) 
-
-            """
-            # https://stackoverflow.com/questions/75338256/is-there-a-way-to-add-context-to-django-reverse-function
-            # "reverse() only produces a string: a path."
-            return HttpResponseRedirect(reverse("listing", args=(listing_id,)), {
-                "listing data": listing_data,
-                "bid_success_message": "Bid was successful." # No message displayed.
             })
-            """
-
         else:
-
-            listing_data = Listing.objects.filter(pk=listing_id)
-
-            return render(request, "auctions/listing.html", {
-                "listing data": listing_data,
-                # To display the message below, check on the server with a try / except.
-                "bid_error_message": "Bid error: Your bid was invalid or it must be greater than the starting or current bid.", # ValueError at /bid/3 - invalid literal for int() with base 10: '-0.03'
+            context.update({
+                "bid_error_message": "Bid error: Your bid was invalid or it must be greater than the starting or current bid.",
                 "bid_placed": False
-            }) 
-
-            """
-            # https://stackoverflow.com/questions/75338256/is-there-a-way-to-add-context-to-django-reverse-function
-            # "reverse() only produces a string: a path."
-            return HttpResponseRedirect(reverse("listing", args=(listing_id,)), {
-                "listing data": listing_data,
-                # To display the message below, check on the server with a try / except.
-                "bid_error_message": "Bid error: Your bid was invalid or it must be greater than the starting or current bid." # No message displayed.
             })
-            """
+
+        return render(request, "auctions/listing.html", context)
         
     # Redirect to listing.html
     return HttpResponseRedirect(reverse("listing", args=(listing_id,)))
@@ -541,6 +551,35 @@ def bid(request, id):
 """
 
 
+"""
+Bid History: every bid on a listing, newest (and highest) first, one page at a time. ?cursor=<id> selects the page
+after the bid with that id. The page also shows the last BID_HISTORY_ROLLUPS hours of bidding from the hourly rollups.
+"""
+
+def bid_history(request, id):
+
+    listing = get_object_or_404(Listing.objects.only("id", "title", "bid", "bid_count"), pk=id)
+
+    # Keyset pagination over bid_listing_history_idx (listing, id DESC). One extra row tells if there is another page.
+    cursor = parse_cursor(request.GET.get("cursor"))
+    bids = Bid.objects.filter(listing_id=id).select_related("placedBy").only(
+        "id", "bid", "created_at", "placedBy__username"
+    ).order_by("-id")
+    if cursor is not None:
+        bids = bids.filter(id__lt=cursor)
+    all_bids, next_cursor = split_page(list(bids[:BID_HISTORY_PAGE_SIZE + 1]), BID_HISTORY_PAGE_SIZE)
+
+    context = {
+        "listing": listing,
+        "all_bids": all_bids,
+        "next_cursor": next_cursor,
+        # The summary belongs to the listing, not to the page of bids, so only the first page shows it.
+        "rollups": BidRollup.objects.filter(listing_id=id).order_by("-period_start")[:BID_HISTORY_ROLLUPS] if cursor is None else []
+    }
+
+    return render(request, "auctions/bid_history.html", context)
+
+
 """
 The user who created (createdBy) the listing may “close” the auction from listing.html.
 This makes the highest bidder the winner of the auction and makes the listing no longer active.
@@ -554,42 +593,18 @@ def close(request, id):
     # Get user
     user_name = request.user
 
-    # Auction is closed when Listing.is_open == False
-    # Get listing data
-    get_listing_data = Listing.objects.get(pk=id)
-    get_listing_data.is_open = False
-    # Save status to Listing database.
-    get_listing_data.save()
-
-    listing_data = Listing.objects.filter(pk=id)
-
-    watchlist_data = get_listing_data.watchlist.all() 
-    user_is_watching = user_name in watchlist_data
+    # Only the creator may close the auction, and only once - close_listing() records the winner and the auction result,
+    # updates the category's open listing count and tells the listing page (see closing.py).
+    closed = close_listing(item_id, user_name)
+    if closed:
+        log_event(logger, "auction.closed", listing_id=item_id, user_id=user_name.id)
 
-    # Get the current bid.
-    last_bid = Listing.objects.values_list("bid", flat=True).get(pk=item_id)
-
-    # Get total bids.
-    total_bids = len(Bid.objects.filter(listing_id=item_id))
-
-    # Get starting bid.
-    starting_bid = True if total_bids == 0 else False
-
-    # Get creator of this listing.
-    creator = user_name == get_listing_data.createdBy 
-
-    return render(request, "auctions/listing.html", {
-        "listing_data": listing_data,
-        "item_id": item_id,
-        "user_is_watching": user_is_watching,
-        "bid": last_bid,
-        "total_bids": total_bids,
-        "starting_bid": starting_bid,
-        # "form": form
-        "creator": creator,
-        "close_message": "Congratulations! This auction is now closed."
-    })
+    # Render the listing page from the (now closed) listing, like the listing view does.
+    context = listing_page_context(request, item_id)
+    if closed:
+        context["close_message"] = "Congratulations! This auction is now closed."
 
+    return render(request, "auctions/listing.html", context)
 
 
 # Add Comments
@@ -603,14 +618,12 @@ def comment(request, id):
     # Get the user
     user_name = request.user
     
-    listing = Listing.objects.get(pk=listing_id)
-    print("Listing:", listing) # Returns title and category
+    # Only the id is needed to attach the comment. (Printing the listing used to load its category too.)
+    listing = get_object_or_404(Listing.objects.only("id"), pk=listing_id)
     
     # Capture the comment from the request.
     new_comment = CreateCommentForm(request.POST)
-    # print('New Comment:', new_comment)
     comment = new_comment["comment"].value()
-    print("Comment:", comment)
   
     add_comment = Comment(
         comment=comment,
@@ -619,6 +632,12 @@ def comment(request, id):
     )
 
     add_comment.save()
+    # The text is not logged, only its length.
+    log_event(logger, "comment.created", listing_id=listing_id, comment_id=add_comment.id, length=len(comment or ""), user_id=user_name.id)
+    publish_listing_event(listing_id, "comment", comment=comment, author=user_name.username)
+    # The cached comments list and page are stale, and the page's Last-Modified moves on.
+    Listing.objects.filter(pk=listing_id).update(updated_at=timezone.now())
+    bump_listing_version(listing_id)
 
     return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
 
@@ -628,12 +647,12 @@ Categories: Users should be able to visit a page that displays a list of all lis
 Clicking on the name of any category should take the user to a page that displays all of the active listings in that category.
 """
 
+@vary_on_cookie
+@condition(etag_func=categories_etag)
 def categories(request):
 
-    # https://stackoverflow.com/questions/5877306/remove-duplicates-in-a-django-query
-    # Get all data in the specified table column without repeating values.
-    all_categories = Listing.objects.values_list("category", flat=True).distinct()
-    print("All Cateogires", all_categories)
+    # Categories with active listings and how many each has. Served from the cache - the Listing table is not read.
+    all_categories = category_directory()
 
     context = {
         "all_categories": all_categories
@@ -642,19 +661,197 @@ def categories(request):
     return render(request, "auctions/categories.html", context)
 
 
-def category(request, name):
+@vary_on_cookie
+@condition(etag_func=category_etag, last_modified_func=category_last_modified)
+def category(request, slug):
     # List all items in this category.
 
-    category = name
-    print("Category:", category)
+    # Categories are looked up by their slug, e.g. /category/home-decor
+    category = get_object_or_404(Category, slug=slug)
 
-    # Get all listings with the specified category.
-    all_category_items = Listing.objects.filter(category=category)
-    print("All Category Items:", all_category_items)
+    # Get all active listings with the specified category - an index lookup on (is_open, category_id).
+    all_category_items = category.listings.filter(is_open=True).only("id", "title")
     
     context = {
         "all_category_items": all_category_items,
         "category": category
     }
 
-    return render(request, "auctions/category.html", context)
\ No newline at end of file
+    return render(request, "auctions/category.html", context)
+
+
+"""
+My Wins: the auctions the user won, most recently closed first.
+Read from AuctionResult (one index range on winner, closed_at) - the Bid table is not used.
+"""
+
+def wins(request):
+
+    user_name = request.user
+
+    if user_name.is_authenticated:
+        all_wins = AuctionResult.objects.filter(winner_id=user_name.id).select_related("listing").only(
+            "listing__id", "listing__title", "winning_bid", "bid_count", "closed_at"
+        ).order_by("-closed_at")
+    else:
+        all_wins = []
+
+    context = {
+        "all_wins": all_wins
+    }
+
+    return render(request, "auctions/wins.html", context)
+
+
+"""
+Notifications: outbid, won and watched listing updates for the signed in user, newest first.
+Opening the page marks them as read.
+"""
+
+def notifications(request):
+
+    user_name = request.user
+
+    if user_name.is_authenticated:
+        all_notifications = list(Notification.objects.filter(user_id=user_name.id).order_by("-updated_at")[:NOTIFICATIONS_PAGE_SIZE])
+        unread_ids = [notification.id for notification in all_notifications if notification.read_at is None]
+        if unread_ids:
+            Notification.objects.filter(pk__in=unread_ids).update(read_at=timezone.now())
+    else:
+        all_notifications = []
+
+    context = {
+        "all_notifications": all_notifications
+    }
+
+    return render(request, "auctions/notifications.html", context)
+
+
+"""
+Search: Users can search the title, description and category of listings.
+Results can be limited to open or closed auctions, one category and a price range.
+"""
+
+def search(request):
+
+    query = request.GET.get("q", "").strip()
+    status = request.GET.get("status", "open")
+
+    # An unknown category slug or an invalid price is ignored rather than treated as an error.
+    category = Category.objects.filter(slug=request.GET.get("category", "")).first() if request.GET.get("category") else None
+    min_price = parse_bid_amount(request.GET.get("min_price"))
+    max_price = parse_bid_amount(request.GET.get("max_price"))
+
+    results = search_listings(query, status=status, category=category, min_price=min_price, max_price=max_price)
+
+    context = {
+        "query": query,
+        "status": status,
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "results": results
+    }
+
+    return render(request, "auctions/search.html", context)
+
+
+"""
+Async read views: the same pages as index, listing, watchList, categories and category, written with the async ORM.
+Under ASGI (commerce/asgi.py) a sync view takes a thread from a small pool for the whole request, so at high
+concurrency requests queue for threads. These views await their queries instead.
+urls.py uses them when AUCTIONS_ASYNC_VIEWS = True is set in settings.py. Keep it False for WSGI deployments,
+where Django would have to start an event loop for every request to run them.
+https://docs.djangoproject.com/en/5.0/topics/async/
+"""
+
+async def request_user(request):
+    # Load the user without blocking and keep it on the request, so templates reading {{ user }} do not
+    # run a synchronous session query from the event loop.
+    # https://docs.djangoproject.com/en/5.0/ref/request-response/#django.http.HttpRequest.auser
+    request.user = await request.auser()
+    # The nav bar shows the watchlist count (templatetags/watchlists.py). Load it here, not while rendering.
+    await auser_watched_ids(request.user)
+    return request.user
+
+
+async def index_async(request):
+
+    await request_user(request)
+
+    cursor = parse_cursor(request.GET.get("cursor"))
+    all_listings, next_cursor = await aactive_listings_page(cursor)
+
+    context = {
+       "all_listings": all_listings,
+       "next_cursor": next_cursor,
+       "listing_versions": await alisting_versions([listing.id for listing in all_listings])
+    }
+    return render(request, "auctions/index.html", context)
+
+
+async def listing_async(request, id):
+
+    user_name = await request_user(request)
+
+    # Read before the listing, like listing_page_context() does.
+    version = await alisting_version(id)
+
+    async def render_page():
+        # The listing with its bid summary and the comments are loaded concurrently.
+        item, all_comments = await alisting_detail(id, user_name)
+        context = listing_context(user_name, id, item, all_comments)
+        # Give the template the version so the {% listingfragment %} tags do not look it up while rendering.
+        context["listing_versions"] = {id: version}
+        return render(request, "auctions/listing.html", context).content
+
+    if not user_name.is_authenticated:
+        return HttpResponse(await acached_fragment("anonymous-page", id, render_page, version=version))
+
+    return HttpResponse(await render_page())
+
+
+async def watchList_async(request):
+
+    user_name = await request_user(request)
+
+    if user_name.is_authenticated:
+        get_user_watchList = [listing async for listing in watchlist_cards(await auser_watched_ids(user_name))]
+    else:
+        get_user_watchList = []
+
+    context = {
+        "watchList": get_user_watchList
+    }
+
+    return render(request, "auctions/watchList.html", context)
+
+
+async def categories_async(request):
+
+    await request_user(request)
+
+    context = {
+        "all_categories": await acategory_directory()
+    }
+
+    return render(request, "auctions/categories.html", context)
+
+
+async def category_async(request, slug):
+
+    await request_user(request)
+
+    try:
+        category = await Category.objects.aget(slug=slug)
+    except Category.DoesNotExist:
+        raise Http404("No Category matches the given query.")
+
+    all_category_items = [item async for item in category.listings.filter(is_open=True).only("id", "title")]
+
+    context = {
+        "all_category_items": all_category_items,
+        "category": category
+    }
+
+    return render(request, "auctions/category.html", context)
@@ -0,0 +1,170 @@
+# Watchlists served from the cache.
+# Two kinds of cache entries are kept next to the Listing.watchlist many-to-many table:
+# - per user: the set of listing ids the user watches (a frozenset, so "is this listing watched?" is one lookup),
+# - per listing: the number of users watching it, changed with cache.incr()/decr().
+# Both are loaded from the database on a cache miss and changed by watch()/unwatch() after the change commits.
+# Changes made to the table some other way (the admin, listing.watchlist.add()) send m2m_changed, which drops the
+# affected entries so they are reloaded (connected in apps.py).
+# https://docs.djangoproject.com/en/5.0/topics/cache/#the-low-level-cache-api
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .fragments import bump_listing_version
+from .models import Listing
+
+
+# Cache entries also expire after a day, which bounds how long a lost concurrent update can show.
+WATCHLIST_CACHE_TIMEOUT = 24 * 60 * 60
+
+Watch = Listing.watchlist.through
+
+
+def user_key(user_id):
+    return f"auctions:watchlist:user:{user_id}"
+
+
+def count_key(listing_id):
+    return f"auctions:watchlist:count:{listing_id}"
+
+
+def load_watched_ids(user_id):
+    return frozenset(Watch.objects.filter(user_id=user_id).values_list("listing_id", flat=True))
+
+
+def watched_ids(user_id):
+    # The ids of the listings the user watches.
+    key = user_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = load_watched_ids(user_id)
+        cache.set(key, ids, timeout=WATCHLIST_CACHE_TIMEOUT)
+    return ids
+
+
+async def awatched_ids(user_id):
+    # Async version of watched_ids() for the ASGI views.
+    key = user_key(user_id)
+    ids = await cache.aget(key)
+    if ids is None:
+        ids = frozenset([listing_id async for listing_id in Watch.objects.filter(user_id=user_id).values_list("listing_id", flat=True)])
+        await cache.aset(key, ids, timeout=WATCHLIST_CACHE_TIMEOUT)
+    return ids
+
+
+def user_watched_ids(user):
+    # watched_ids() for a User, kept on the object so one request reads the cache once (listing page + nav badge).
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, "_watched_ids"):
+        user._watched_ids = watched_ids(user.id)
+    return user._watched_ids
+
+
+async def auser_watched_ids(user):
+    # Async version of user_watched_ids(). Async views call it before rendering so templates never query.
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, "_watched_ids"):
+        user._watched_ids = await awatched_ids(user.id)
+    return user._watched_ids
+
+
+def is_watching(user, listing_id):
+    return listing_id in user_watched_ids(user)
+
+
+async def ais_watching(user, listing_id):
+    return listing_id in await auser_watched_ids(user)
+
+
+def watcher_count(listing_id):
+    # Number of users watching the listing.
+    key = count_key(listing_id)
+    count = cache.get(key)
+    if count is None:
+        count = Watch.objects.filter(listing_id=listing_id).count()
+        # add() does not overwrite a count another request stored (and maybe incremented) in the meantime.
+        cache.add(key, count, timeout=WATCHLIST_CACHE_TIMEOUT)
+    return count
+
+
+async def awatcher_count(listing_id):
+    # Async version of watcher_count() for the ASGI views.
+    key = count_key(listing_id)
+    count = await cache.aget(key)
+    if count is None:
+        count = await Watch.objects.filter(listing_id=listing_id).acount()
+        await cache.aadd(key, count, timeout=WATCHLIST_CACHE_TIMEOUT)
+    return count
+
+
+def update_cache(user_id, listing_id, watching):
+    # Apply one change to the cached entries that exist. Missing entries are loaded from the database when next needed.
+    key = user_key(user_id)
+    ids = cache.get(key)
+    if ids is not None:
+        ids = ids | {listing_id} if watching else ids - {listing_id}
+        cache.set(key, ids, timeout=WATCHLIST_CACHE_TIMEOUT)
+
+    try:
+        if watching:
+            cache.incr(count_key(listing_id))
+        else:
+            cache.decr(count_key(listing_id))
+    except ValueError:
+        # Not cached.
+        pass
+
+
+def watch(user, listing_id):
+    # Add the listing to the user's watchlist. Returns True if it was added, False if it was already there.
+    row, created = Watch.objects.get_or_create(listing_id=listing_id, user_id=user.id)
+    if created:
+        transaction.on_commit(lambda: update_cache(user.id, listing_id, True))
+        # The listing page shows the watcher count.
+        bump_listing_version(listing_id)
+    return created
+
+
+def unwatch(user, listing_id):
+    # Remove the listing from the user's watchlist. Returns True if it was removed.
+    deleted, rows = Watch.objects.filter(listing_id=listing_id, user_id=user.id).delete()
+    if deleted:
+        transaction.on_commit(lambda: update_cache(user.id, listing_id, False))
+        bump_listing_version(listing_id)
+    return bool(deleted)
+
+
+def watchlist_cards(listing_ids):
+    # The listings for a watchlist page in one query, newest first, with only the columns the cards show.
+    return Listing.objects.filter(pk__in=listing_ids).select_related("category").only(
+        "id", "title", "bid", "is_open", "image", "image_variants", "category__name"
+    ).order_by("-id")
+
+
+def watchlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    m2m_changed receiver for Listing.watchlist. Drops the cached entries touched by the change.
+    instance is a Listing (listing.watchlist.add(user)) or, with reverse=True, a User (user.watch_list.add(listing)).
+    """
+    if action == "pre_clear":
+        # clear() does not say which rows it removes, so look them up before they are gone.
+        if reverse:
+            user_ids = {instance.pk}
+            listing_ids = set(Watch.objects.filter(user_id=instance.pk).values_list("listing_id", flat=True))
+        else:
+            user_ids = set(Watch.objects.filter(listing_id=instance.pk).values_list("user_id", flat=True))
+            listing_ids = {instance.pk}
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            user_ids, listing_ids = {instance.pk}, set(pk_set)
+        else:
+            user_ids, listing_ids = set(pk_set), {instance.pk}
+    else:
+        return
+
+    keys = [user_key(user_id) for user_id in user_ids] + [count_key(listing_id) for listing_id in listing_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    for listing_id in listing_ids:
+        bump_listing_version(listing_id)